@@ -0,0 +1,86 @@
+"""
+OpenAI gateway - long-lived, pooled API clients shared by every AI call in the app.
+Each timeout profile gets its own client, and all clients reuse one keep-alive
+connection pool, so bursts of calls no longer pay a TLS handshake per request.
+Calls that miss the LLM cache wait for a slot of their profile's priority class (see ai_scheduler).
+"""
+
+import logging
+import os
+import threading
+
+import httpx
+from openai import OpenAI
+
+from ai_scheduler import slot_for_profile
+from llm_cache import cached_completion
+
+# Request timeout in seconds for each kind of AI work
+TIMEOUT_PROFILES = {
+    'translation': 8.0,
+    'batch_translation': 30.0,
+    'signature': 15.0,
+    'personality_trait': 8.0,
+    'squad_grouping': 30.0,
+    'squad_naming': 10.0,
+    'icebreaker': 30.0,
+    'student_pipeline': 30.0,
+}
+
+# Sampled, high-temperature profiles - asking again (re-running "create squads", regenerating an
+# icebreaker) must give a new answer, so their responses bypass the LLM cache
+UNCACHED_PROFILES = {'squad_grouping', 'squad_naming', 'icebreaker'}
+
+# Connection pool shared by all profiles
+POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20)),
+    max_keepalive_connections=int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10)),
+    keepalive_expiry=60.0,
+)
+
+_base_client = None
+_profile_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get_base_client():
+    """Create the pooled base client on first use (after gunicorn has forked the worker)"""
+    global _base_client
+    if _base_client is None:
+        _base_client = OpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            http_client=httpx.Client(limits=POOL_LIMITS, timeout=max(TIMEOUT_PROFILES.values())),
+        )
+        logging.info("Created pooled OpenAI client")
+    return _base_client
+
+
+def get_client(profile):
+    """Return the long-lived client for a timeout profile"""
+    if profile not in TIMEOUT_PROFILES:
+        raise ValueError(f"Unknown AI timeout profile: {profile}")
+
+    client = _profile_clients.get(profile)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        if profile not in _profile_clients:
+            # with_options shares the base client's connection pool
+            _profile_clients[profile] = _get_base_client().with_options(timeout=TIMEOUT_PROFILES[profile])
+        return _profile_clients[profile]
+
+
+def chat_completion(profile, **request):
+    """
+    Run a chat completion on the profile's pooled client through the shared LLM response cache
+    (except for UNCACHED_PROFILES) and return the response text
+    """
+    def create_completion():
+        with slot_for_profile(profile):
+            response = get_client(profile).chat.completions.create(**request)
+        return response.choices[0].message.content
+
+    if profile in UNCACHED_PROFILES:
+        return create_completion()
+    return cached_completion(request, create_completion)
@@ -0,0 +1,116 @@
+"""
+Priority scheduler for AI calls - every call that misses the LLM cache takes a slot here
+before it goes to the API, so all work shares the OpenAI quota in a fixed order:
+interactive teacher actions (squad formation and naming, icebreakers) first, then
+personality analysis, then translation backfill.
+
+At most max_concurrency calls run at once and each class has its own limit. When a slot
+frees up it goes to the waiting call with the best rank; a waiting call's rank improves by
+one class every aging_seconds, so a long translation backlog still makes progress while
+the teacher keeps the interactive class busy.
+"""
+
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Priority classes, most urgent first
+PRIORITY_CLASSES = {
+    'interactive': 0,
+    'analysis': 1,
+    'translation': 2,
+}
+
+# Priority class of each AI timeout profile (see ai_gateway.TIMEOUT_PROFILES)
+PROFILE_CLASSES = {
+    'squad_grouping': 'interactive',
+    'squad_naming': 'interactive',
+    'icebreaker': 'interactive',
+    'signature': 'analysis',
+    'personality_trait': 'analysis',
+    'student_pipeline': 'analysis',
+    'translation': 'translation',
+    'batch_translation': 'translation',
+}
+
+# Concurrent AI calls per process, overall and per class
+MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', 8))
+CLASS_LIMITS = {
+    'interactive': int(os.environ.get('AI_INTERACTIVE_MAX_CONCURRENCY', 8)),
+    'analysis': int(os.environ.get('AI_ANALYSIS_MAX_CONCURRENCY', 4)),
+    'translation': int(os.environ.get('AI_TRANSLATION_MAX_CONCURRENCY', 2)),
+}
+# Seconds of waiting that raise a call by one priority class
+AGING_SECONDS = float(os.environ.get('AI_PRIORITY_AGING_SECONDS', 15.0))
+
+
+class PriorityScheduler:
+    """Hands out AI call slots by priority class with per-class limits and aging"""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, class_limits=None, aging_seconds=AGING_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.class_limits = dict(CLASS_LIMITS, **(class_limits or {}))
+        self.aging_seconds = aging_seconds
+        self._condition = threading.Condition()
+        self._running = {name: 0 for name in PRIORITY_CLASSES}
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def _rank(self, waiter, now):
+        priority_class, since, sequence = waiter
+        return (PRIORITY_CLASSES[priority_class] - (now - since) / self.aging_seconds, sequence)
+
+    def _next_waiter(self):
+        """The waiter that gets the next free slot, or None while no slot it may use is free"""
+        if sum(self._running.values()) >= self.max_concurrency:
+            return None
+        eligible = [waiter for waiter in self._waiting if self._running[waiter[0]] < self.class_limits[waiter[0]]]
+        if not eligible:
+            return None
+        now = time.monotonic()
+        return min(eligible, key=lambda waiter: self._rank(waiter, now))
+
+    def acquire(self, priority_class):
+        waiter = (priority_class, time.monotonic(), next(self._sequence))
+        with self._condition:
+            self._waiting.append(waiter)
+            try:
+                while self._next_waiter() is not waiter:
+                    self._condition.wait()
+            finally:
+                self._waiting.remove(waiter)
+            self._running[priority_class] += 1
+            # The next waiter may be able to start as well (e.g. a different class)
+            self._condition.notify_all()
+
+    def release(self, priority_class):
+        with self._condition:
+            self._running[priority_class] -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority_class):
+        """Hold one AI call slot of a priority class"""
+        self.acquire(priority_class)
+        try:
+            yield
+        finally:
+            self.release(priority_class)
+
+    def stats(self):
+        """Running and waiting calls per priority class"""
+        with self._condition:
+            waiting = {name: 0 for name in PRIORITY_CLASSES}
+            for priority_class, since, sequence in self._waiting:
+                waiting[priority_class] += 1
+            return {'running': dict(self._running), 'waiting': waiting}
+
+
+ai_scheduler = PriorityScheduler()
+
+
+def slot_for_profile(profile):
+    """AI call slot for a timeout profile's priority class"""
+    return ai_scheduler.slot(PROFILE_CLASSES.get(profile, 'interactive'))
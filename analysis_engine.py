@@ -0,0 +1,228 @@
+"""
+Cohort analysis engine - runs personality signature generation for many students
+in parallel while keeping the retry, fallback and circuit breaker behaviour of a single call
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import current_app, has_app_context
+
+SIGNATURE_FIELDS = ['archetype', 'core_strength', 'hidden_potential', 'conversation_catalyst']
+
+# Global circuit breaker state for AI functions, shared by every worker thread
+circuit_breaker_state = {
+    'failure_count': 0,
+    'last_failure_time': None,
+    'circuit_open': False,
+    'success_count': 0
+}
+circuit_breaker_lock = threading.Lock()
+
+
+def is_quality_ai_result(result, fallback_value):
+    """
+    Check that an AI result is real output rather than a fallback or near-empty text.
+    Dict results (e.g. personality signatures) count as usable if any field is not a fallback.
+    """
+    if isinstance(result, dict):
+        return any(is_quality_ai_result(result.get(key), value) for key, value in fallback_value.items())
+    return bool(result and result.strip() and result != fallback_value and len(result.strip()) > 5)
+
+
+def is_circuit_open():
+    """Return True while the circuit breaker is open and not yet due for a reset"""
+    with circuit_breaker_lock:
+        if not circuit_breaker_state['circuit_open']:
+            return False
+        return time.time() - circuit_breaker_state['last_failure_time'] <= 60
+
+
+def intelligent_ai_call_with_retry(ai_function, student_answers, function_name, fallback_value, max_retries=3):
+    """
+    Intelligent retry mechanism with circuit breaker pattern and adaptive timeout
+    """
+    # Circuit breaker check
+    with circuit_breaker_lock:
+        if circuit_breaker_state['circuit_open']:
+            if time.time() - circuit_breaker_state['last_failure_time'] > 60:  # Reset after 1 minute
+                circuit_breaker_state['circuit_open'] = False
+                circuit_breaker_state['failure_count'] = 0
+                print(f"🔄 Circuit breaker reset for {function_name}")
+            else:
+                print(f"⚡ Circuit breaker open for {function_name}, using fallback")
+                return fallback_value
+
+    start_time = time.time()
+
+    for attempt in range(max_retries):
+        try:
+            # Calculate delay with exponential backoff (1s, 2s, 4s)
+            if attempt > 0:
+                delay = min(2 ** (attempt - 1), 8)  # Cap at 8 seconds
+                print(f"⏳ Retrying {function_name} in {delay}s (attempt {attempt + 1}/{max_retries})")
+                time.sleep(delay)
+
+            # Call the AI function with timeout monitoring
+            attempt_start = time.time()
+            result = ai_function(student_answers)
+            attempt_duration = time.time() - attempt_start
+
+            # Validate result quality
+            if is_quality_ai_result(result, fallback_value):
+                # Success - reset circuit breaker
+                with circuit_breaker_lock:
+                    circuit_breaker_state['failure_count'] = 0
+                    circuit_breaker_state['success_count'] += 1
+                    circuit_breaker_state['circuit_open'] = False
+
+                total_duration = time.time() - start_time
+                print(f"✓ {function_name} succeeded on attempt {attempt + 1} ({attempt_duration:.1f}s, total: {total_duration:.1f}s)")
+                return result
+            else:
+                print(f"⚠ {function_name} returned low-quality result on attempt {attempt + 1}")
+                if attempt == max_retries - 1:
+                    with circuit_breaker_lock:
+                        circuit_breaker_state['failure_count'] += 1
+                    return fallback_value
+
+        except Exception as e:
+            error_type = type(e).__name__
+            print(f"✗ {function_name} failed on attempt {attempt + 1}: {error_type} - {str(e)}")
+
+            # Handle different error types
+            if "timeout" in str(e).lower() or "timed out" in str(e).lower():
+                print(f"🕐 Timeout error for {function_name}")
+            elif "rate limit" in str(e).lower():
+                print(f"⏱ Rate limit error for {function_name}, extending delay")
+                if attempt < max_retries - 1:
+                    time.sleep(10)  # Extended delay for rate limits
+
+            if attempt == max_retries - 1:
+                with circuit_breaker_lock:
+                    circuit_breaker_state['failure_count'] += 1
+                    circuit_breaker_state['last_failure_time'] = time.time()
+
+                    # Open circuit breaker after 3 consecutive failures
+                    if circuit_breaker_state['failure_count'] >= 3:
+                        circuit_breaker_state['circuit_open'] = True
+                        print(f"⚡ Circuit breaker opened for {function_name}")
+
+                return fallback_value
+
+    return fallback_value
+
+
+def get_student_answers(student):
+    """Collect the six questionnaire answers of a student for AI analysis"""
+    return {f'question{i}': getattr(student, f'question{i}') for i in range(1, 7)}
+
+
+def _analyze_answers(app, student_answers):
+    """Worker task: generate one personality signature, skipping the call while the circuit is open"""
+    from openai_integration import generate_personality_signature, SIGNATURE_FALLBACKS
+
+    if is_circuit_open():
+        return None
+    if app is None:
+        return intelligent_ai_call_with_retry(
+            generate_personality_signature, student_answers, "personality_signature", SIGNATURE_FALLBACKS
+        )
+    # Worker threads need their own app context to use the shared LLM response cache
+    with app.app_context():
+        return intelligent_ai_call_with_retry(
+            generate_personality_signature, student_answers, "personality_signature", SIGNATURE_FALLBACKS
+        )
+
+
+def analyze_cohort(students, session, max_workers=4, commit_batch_size=10, overwrite=True, progress=None):
+    """
+    Analyze every given student with at most max_workers AI calls in flight.
+
+    AI calls run in a thread pool and never touch the database; results are applied
+    to the ORM objects in the calling thread and committed every commit_batch_size students.
+    Students skipped because the circuit breaker opened are left unanalyzed for a later run.
+    progress(stats) is called after every student; returning False stops the run, leaving
+    the students whose calls had not started unanalyzed.
+    Returns a dict of run statistics; analyzed_ids lists the students whose signature was stored.
+    """
+    from openai_integration import SIGNATURE_FALLBACKS
+
+    stats = {
+        'analyzed': 0,
+        'skipped': 0,
+        'failed': 0,
+        'successful_ai_calls': 0,
+        'total_ai_calls': 0,
+        'fallback_used': 0,
+        'duration': 0.0,
+        'stopped': False,
+        'analyzed_ids': [],
+    }
+    if not students:
+        return stats
+
+    start_time = time.time()
+    pending_commit = 0
+    app = current_app._get_current_object() if has_app_context() else None
+    max_workers = max(1, min(max_workers, len(students)))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cohort-analysis') as executor:
+        # IDs are read now - after a batch commit, reading one would load the student and flush the rest early
+        futures = {
+            executor.submit(_analyze_answers, app, get_student_answers(student)): (student, student.id)
+            for student in students
+        }
+
+        for future in as_completed(futures):
+            student, student_id = futures[future]
+            try:
+                signature = future.result()
+            except Exception as e:
+                logging.error(f"Error analyzing student {student.name}: {str(e)}")
+                signature = dict(SIGNATURE_FALLBACKS)
+                stats['failed'] += 1
+
+            if signature is None:
+                stats['skipped'] += 1
+                if progress is not None and progress(stats) is False:
+                    stats['stopped'] = True
+                    break
+                continue
+
+            stats['total_ai_calls'] += 1
+            if is_quality_ai_result(signature, SIGNATURE_FALLBACKS):
+                stats['successful_ai_calls'] += 1
+            stats['fallback_used'] += sum(1 for field in SIGNATURE_FIELDS if signature[field] == SIGNATURE_FALLBACKS[field])
+
+            for field in SIGNATURE_FIELDS:
+                if overwrite or not getattr(student, field):
+                    setattr(student, field, signature[field])
+            stats['analyzed'] += 1
+            stats['analyzed_ids'].append(student_id)
+            pending_commit += 1
+
+            # Commit in batches rather than once per student
+            if pending_commit >= commit_batch_size:
+                session.commit()
+                pending_commit = 0
+                logging.info(f"Cohort analysis progress: {stats['analyzed']}/{len(students)} students committed")
+
+            if progress is not None and progress(stats) is False:
+                stats['stopped'] = True
+                break
+
+        if stats['stopped']:
+            # Calls already in flight finish, their results are dropped
+            for future in futures:
+                future.cancel()
+            logging.info(f"Cohort analysis stopped after {stats['analyzed']} of {len(students)} students")
+
+    if pending_commit:
+        session.commit()
+
+    stats['duration'] = time.time() - start_time
+    logging.info(f"Cohort analysis finished: {stats['analyzed']} analyzed, {stats['skipped']} skipped in {stats['duration']:.1f}s")
+    return stats
@@ -0,0 +1,322 @@
+"""
+Incremental analysis pipeline: translate → signature → tags → clustering.
+
+Each stage declares the student inputs it reads and a version taken from its prompt or
+algorithm. Whenever a stage output is stored, the SHA-256 of that version and those inputs
+is recorded in the stage_states table under (subject, stage) - the subject is a student, or
+the whole cohort for clustering. A stage is stale when its output is missing or the hash it
+would compute now differs from the recorded one, so a run only recomputes the stale stages
+of changed students, and bumping a prompt version re-runs that stage and nothing else.
+
+Outputs of students created before hash tracking started (the creation time of the oldest
+stage_states row - start_tracking adds one at startup) have no recorded hash; they count as
+current and are adopted (their hash recorded) the first time a pipeline run sees them. Any
+later output without a hash is stale - every writer records its successes, so a missing hash
+means the output is a failure fallback (the original answer in place of a translation).
+Must be used inside an application context.
+"""
+
+import hashlib
+import json
+import logging
+import re
+
+from analysis_engine import SIGNATURE_FIELDS
+from openai_integration import SIGNATURE_FALLBACKS, SIGNATURE_PROMPT_VERSION, SQUAD_GROUPING_PROMPT_VERSION, TRANSLATION_PROMPT_VERSION
+from student_tags import TAGS_VERSION
+from translation_batcher import QUESTION_FIELDS, TRANSLATION_ERROR_TEXT
+
+TRANSLATED_FIELDS = [f'{field}_jp' for field in QUESTION_FIELDS]
+COHORT_SUBJECT = 'cohort'
+TRACKING_SUBJECT = 'pipeline'
+
+# Jobs that produce translations (and, fused, signatures) for a new submission
+SUBMISSION_JOB_KINDS = ('translation', 'student_pipeline')
+
+# Hiragana/katakana - answers written in Japanese are copied instead of translated
+KANA_PATTERN = re.compile(r'[぀-ヿ]')
+
+
+def input_hash(version, inputs):
+    """Stable hash of a stage version and the inputs it reads"""
+    payload = json.dumps([version, inputs], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def student_subject(student_id):
+    return f'student:{student_id}'
+
+
+def _answers(student):
+    return [getattr(student, field) or '' for field in QUESTION_FIELDS]
+
+
+def _vibes_text(student):
+    return student.vibes or student.get_combined_answers()
+
+
+def _translated_ids(students):
+    """Students whose six answers all have a translation (the error placeholder does not count)"""
+    return {
+        student.id for student in students
+        if all(getattr(student, field) and getattr(student, field) != TRANSLATION_ERROR_TEXT for field in TRANSLATED_FIELDS)
+    }
+
+
+def _signed_ids(students):
+    """Students with every signature field filled and at least one that is not a fallback"""
+    return {
+        student.id for student in students
+        if all(getattr(student, field) for field in SIGNATURE_FIELDS)
+        and any(getattr(student, field) != SIGNATURE_FALLBACKS[field] for field in SIGNATURE_FIELDS)
+    }
+
+
+def _tagged_ids(students):
+    """Students with a tags row that is not older than the student (reused IDs)"""
+    from models import StudentTags
+
+    created = {student.id: student.created_at for student in students}
+    if not created:
+        return set()
+    rows = StudentTags.query.filter(StudentTags.student_id.in_(list(created))).all()
+    return {
+        row.student_id for row in rows
+        if not (row.updated_at and created[row.student_id] and row.updated_at < created[row.student_id])
+    }
+
+
+class StudentStage:
+    """A per-student pipeline stage: its version, the inputs it reads and who has its output stored"""
+
+    def __init__(self, name, version, inputs, stored_ids):
+        self.name = name
+        self.version = version
+        self.inputs = inputs
+        self.stored_ids = stored_ids
+
+    def hash_for(self, student):
+        return input_hash(self.version, self.inputs(student))
+
+
+# In run order - the signature reads the original answers, so only clustering waits on it
+STAGES = {
+    'translate': StudentStage('translate', TRANSLATION_PROMPT_VERSION, _answers, _translated_ids),
+    'signature': StudentStage('signature', SIGNATURE_PROMPT_VERSION, _answers, _signed_ids),
+    'tags': StudentStage('tags', TAGS_VERSION, _vibes_text, _tagged_ids),
+}
+
+
+def record_stage(stage_name, students):
+    """Record that the stage output of these students is current (the caller commits)"""
+    from models import db, StageState
+
+    stage = STAGES[stage_name]
+    if not students:
+        return
+    subjects = {student_subject(student.id): student for student in students}
+    rows = {row.subject: row for row in StageState.query.filter(
+        StageState.stage == stage_name, StageState.subject.in_(list(subjects))
+    )}
+    for subject, student in subjects.items():
+        row = rows.get(subject)
+        if row is None:
+            row = StageState(subject=subject, stage=stage_name)
+            db.session.add(row)
+        row.input_hash = stage.hash_for(student)
+
+
+def start_tracking():
+    """Add the row that marks when hash tracking started, unless there already is one (commits)"""
+    from models import db, StageState
+
+    if db.session.get(StageState, (TRACKING_SUBJECT, 'tracking')) is not None:
+        return
+    db.session.add(StageState(subject=TRACKING_SUBJECT, stage='tracking', input_hash=''))
+    try:
+        db.session.commit()
+    except Exception as e:
+        # Another process added it first
+        db.session.rollback()
+        logging.info(f"Pipeline tracking marker stored concurrently: {str(e)}")
+
+
+def tracking_started_at():
+    """Creation time of the oldest stage_states row (None while there is none); rows keep it when updated"""
+    from models import db, StageState
+
+    return db.session.query(db.func.min(StageState.created_at)).scalar()
+
+
+def _predates_tracking(student, started_at):
+    return started_at is None or (student.created_at is not None and student.created_at < started_at)
+
+
+def stale_students(stage_name, students=None, adopt=False):
+    """
+    Students whose stage output is missing or was computed from other inputs or another version.
+    Stored outputs without a recorded hash are current only for students older than hash tracking;
+    with adopt=True their hash is recorded (the caller commits).
+    """
+    from models import Student, StageState
+
+    stage = STAGES[stage_name]
+    if students is None:
+        students = Student.query.order_by(Student.id).all()
+    recorded = {row.subject: row.input_hash for row in StageState.query.filter_by(stage=stage_name)}
+    stored_ids = stage.stored_ids(students)
+    started_at = tracking_started_at()
+
+    stale = []
+    unrecorded = []
+    for student in students:
+        recorded_hash = recorded.get(student_subject(student.id))
+        if student.id not in stored_ids:
+            stale.append(student)
+        elif recorded_hash is None:
+            if _predates_tracking(student, started_at):
+                unrecorded.append(student)
+            else:
+                stale.append(student)
+        elif recorded_hash != stage.hash_for(student):
+            stale.append(student)
+    if adopt and unrecorded:
+        record_stage(stage_name, unrecorded)
+        logging.info(f"Pipeline stage {stage_name}: adopted {len(unrecorded)} existing outputs")
+    return stale
+
+
+def cohort_hash(students):
+    """Hash of everything squad formation reads about the cohort"""
+    return input_hash(SQUAD_GROUPING_PROMPT_VERSION, [
+        [student.id, student.country, student.gender]
+        + [getattr(student, field) or '' for field in SIGNATURE_FIELDS + QUESTION_FIELDS + TRANSLATED_FIELDS]
+        for student in sorted(students, key=lambda student: student.id)
+    ])
+
+
+def record_clustering(students):
+    """Record the cohort the current squads were formed from (call in the transaction that saves them)"""
+    from models import db, StageState
+
+    row = db.session.get(StageState, (COHORT_SUBJECT, 'clustering'))
+    if row is None:
+        row = StageState(subject=COHORT_SUBJECT, stage='clustering')
+        db.session.add(row)
+    row.input_hash = cohort_hash(students)
+
+
+def clustering_stale(students=None):
+    """True when there are no squads or they were formed from a different cohort or prompt"""
+    from models import db, Squad, Student, StageState
+
+    if Squad.query.count() == 0:
+        return True
+    row = db.session.get(StageState, (COHORT_SUBJECT, 'clustering'))
+    if row is None:
+        return False
+    if students is None:
+        students = Student.query.all()
+    return row.input_hash != cohort_hash(students)
+
+
+def queued_student_ids():
+    """Students whose submission job has not finished - their translation is on its way"""
+    from job_queue import ACTIVE_STATUSES
+    from models import Job
+
+    jobs = Job.query.filter(Job.kind.in_(SUBMISSION_JOB_KINDS), Job.status.in_(ACTIVE_STATUSES)).all()
+    return {json.loads(job.payload).get('student_id') for job in jobs}
+
+
+def student_language(student):
+    """'ja' for students who answered in Japanese (only that case matters to the translators)"""
+    return 'ja' if KANA_PATTERN.search(' '.join(_answers(student))) else 'en'
+
+
+def run_pipeline(job=None, max_workers=4, commit_batch_size=10, translation_batch_size=5,
+                 top_k=5, fallback_text=None):
+    """
+    Bring every student's translate, signature and tags stages up to date, recomputing only
+    stale ones; clustering is left to the organizer and only reported as stale.
+    Students whose submission job is still queued are skipped for translate and signature.
+    job (a job_queue JobHandle) receives the progress of each stage and stops the run when cancelled.
+    Returns a dict of run statistics.
+    """
+    from models import db, Student
+    from analysis_engine import analyze_cohort
+    from compatibility_index import index_students
+    from student_tags import save_student_tags
+    from translation_batcher import translate_students
+    from vibe_keywords import get_vibe_archetype
+
+    def cancelled():
+        return job is not None and job.cancelled()
+
+    def report(stage, done, total, **details):
+        # The start of each stage is always stored, later updates are throttled
+        if job is not None:
+            job.report(stage, done, total, force=not done, **details)
+
+    students = Student.query.order_by(Student.id).all()
+    queued_ids = queued_student_ids()
+    stats = {'translated': 0, 'analyzed': 0, 'tagged': 0, 'stale': {}, 'analysis': None, 'stopped': False, 'squads_stale': None}
+
+    # Stage 1: translations, a batch of students per AI request
+    to_translate = [student for student in stale_students('translate', students, adopt=True) if student.id not in queued_ids]
+    db.session.commit()
+    stats['stale']['translate'] = len(to_translate)
+    report('translating', 0, len(to_translate))
+    for start in range(0, len(to_translate), translation_batch_size):
+        if cancelled():
+            stats['stopped'] = True
+            return stats
+        batch = to_translate[start:start + translation_batch_size]
+        translate_students([(student.id, student_language(student)) for student in batch], fallback_text=fallback_text)
+        stats['translated'] += len(batch)
+        report('translating', stats['translated'], len(to_translate))
+
+    # Stage 2: personality signatures through the cohort analysis engine
+    to_analyze = [student for student in stale_students('signature', students, adopt=True) if student.id not in queued_ids]
+    db.session.commit()
+    stats['stale']['signature'] = len(to_analyze)
+    report('analyzing', 0, len(to_analyze), students_analyzed=0, students_total=len(to_analyze))
+    if to_analyze:
+        def report_progress(analysis_stats):
+            report('analyzing', analysis_stats['analyzed'] + analysis_stats['skipped'], len(to_analyze),
+                   students_analyzed=analysis_stats['analyzed'])
+            return not cancelled()
+
+        # Stale signatures were computed from other answers or another prompt - replace them
+        analysis = analyze_cohort(
+            to_analyze,
+            db.session,
+            max_workers=max_workers,
+            commit_batch_size=commit_batch_size,
+            progress=report_progress
+        )
+        analyzed_ids = set(analysis['analyzed_ids'])
+        record_stage('signature', [student for student in to_analyze if student.id in analyzed_ids])
+        db.session.commit()
+        stats['analysis'] = analysis
+        stats['analyzed'] = analysis['analyzed']
+        if analysis['stopped']:
+            stats['stopped'] = True
+            return stats
+
+    # Stage 3: keyword tags and the compatibility index (local, no AI calls)
+    to_tag = stale_students('tags', students, adopt=True)
+    stats['stale']['tags'] = len(to_tag)
+    report('tagging', 0, len(to_tag))
+    for student in to_tag:
+        save_student_tags(student)
+    db.session.commit()
+    if to_tag:
+        index_students(to_tag, get_vibe_archetype, top_k=top_k)
+    stats['tagged'] = len(to_tag)
+
+    # Stage 4: squads are only re-formed when the organizer asks for it
+    stats['squads_stale'] = clustering_stale(students)
+    logging.info(f"Pipeline run: {stats['translated']} translated, {stats['analyzed']} analyzed, "
+                 f"{stats['tagged']} tagged, squads stale: {stats['squads_stale']}")
+    return stats
@@ -13,16 +13,20 @@ import threading
 import time
 from datetime import datetime
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session, flash
+from flask import Flask, request, jsonify, render_template, redirect, url_for, session, flash, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Import our modules
-from models import db, Student, Squad, SessionSettings
+from models import db, Student, Squad, SessionSettings, Job
 from forms import StudentForm
+from job_queue import JobQueue, job_status
+from student_tags import save_student_tags, backfill_student_tags
+from change_feed import track_changes, record_changes, record_reset
+from squad_snapshots import track_snapshot_invalidation, save_snapshots, get_snapshot
+from content_registry import get_questions, get_site_content, get_success_text, get_app_explanation
 from firebase_setup import verify_firebase_token
-import firebase_admin
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -30,9 +34,66 @@ logging.basicConfig(level=logging.INFO)
 # Create Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Cohort analysis: maximum concurrent AI calls and how many students to commit at once
+app.config['ANALYSIS_MAX_CONCURRENCY'] = int(os.environ.get('ANALYSIS_MAX_CONCURRENCY', 4))
+app.config['ANALYSIS_COMMIT_BATCH_SIZE'] = int(os.environ.get('ANALYSIS_COMMIT_BATCH_SIZE', 10))
+
+# Translation batching: pending translation jobs claimed together and sent as one request
+app.config['TRANSLATION_BATCH_SIZE'] = int(os.environ.get('TRANSLATION_BATCH_SIZE', 5))
+
+# Fused per-student pipeline: translate and analyze each submission with one AI request right away
+app.config['FUSED_STUDENT_PIPELINE'] = os.environ.get('FUSED_STUDENT_PIPELINE', '0') == '1'
+
+# Background jobs: worker threads per process (0 disables them), idle poll interval in seconds,
+# seconds before a job left running by a stopped worker is resumed, attempts before a job fails,
+# and seconds of waiting that raise a job's priority by one point (starvation protection)
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 3))
+app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 2.0))
+app.config['JOB_LEASE_SECONDS'] = int(os.environ.get('JOB_LEASE_SECONDS', 600))
+app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+app.config['JOB_AGING_SECONDS'] = float(os.environ.get('JOB_AGING_SECONDS', 6.0))
+
+# Job priority classes: interactive teacher actions first, then analysis, then translation backfill
+app.config['JOB_PRIORITIES'] = {'create_squads': 100, 'analysis': 50, 'student_pipeline': 30, 'translation': 10}
+
+# LLM response cache shared through the database: entry lifetime and maximum number of entries
+app.config['LLM_CACHE_ENABLED'] = os.environ.get('LLM_CACHE_ENABLED', '1') == '1'
+app.config['LLM_CACHE_TTL_SECONDS'] = int(os.environ.get('LLM_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+app.config['LLM_CACHE_MAX_ENTRIES'] = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 5000))
+
+# Squad formation: default mode ('auto', 'ai', 'hierarchical', 'local' or 'hybrid'), class size above
+# which 'auto' switches to hierarchical formation, students per AI block, parallel AI calls
+# and parallel per-squad naming calls in hybrid mode
+app.config['SQUAD_FORMATION_MODE'] = os.environ.get('SQUAD_FORMATION_MODE', 'auto')
+app.config['SQUAD_HIERARCHICAL_THRESHOLD'] = int(os.environ.get('SQUAD_HIERARCHICAL_THRESHOLD', 40))
+app.config['SQUAD_BLOCK_SIZE'] = int(os.environ.get('SQUAD_BLOCK_SIZE', 24))
+app.config['SQUAD_FORMATION_MAX_CONCURRENCY'] = int(os.environ.get('SQUAD_FORMATION_MAX_CONCURRENCY', 4))
+app.config['SQUAD_NAMING_MAX_CONCURRENCY'] = int(os.environ.get('SQUAD_NAMING_MAX_CONCURRENCY', 16))
+
+# Diversity optimizer post-pass on create-squads: always on (otherwise only when the form asks for it)
+# and number of swap/move candidates to evaluate
+app.config['SQUAD_OPTIMIZE_DIVERSITY'] = os.environ.get('SQUAD_OPTIMIZE_DIVERSITY', '0') == '1'
+app.config['SQUAD_OPTIMIZER_ITERATIONS'] = int(os.environ.get('SQUAD_OPTIMIZER_ITERATIONS', 20000))
+
+# AI insights page: students per page and compatible partners kept per student
+app.config['COMPATIBILITY_PAGE_SIZE'] = int(os.environ.get('COMPATIBILITY_PAGE_SIZE', 20))
+app.config['COMPATIBILITY_TOP_K'] = int(os.environ.get('COMPATIBILITY_TOP_K', 5))
+
+# Dashboard Server-Sent Events: open streams per process (each holds a gunicorn thread),
+# stream lifetime before the browser reconnects, and change feed poll interval in seconds
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', 4))
+app.config['SSE_STREAM_SECONDS'] = int(os.environ.get('SSE_STREAM_SECONDS', 300))
+app.config['SSE_POLL_INTERVAL'] = float(os.environ.get('SSE_POLL_INTERVAL', 1.0))
+
+# Students waiting on /find-squad: parked long-polls per process (each holds a gunicorn thread),
+# seconds a long-poll is held, and assignment board poll interval in seconds
+app.config['SQUAD_WAIT_MAX_PARKED'] = int(os.environ.get('SQUAD_WAIT_MAX_PARKED', 4))
+app.config['SQUAD_WAIT_TIMEOUT'] = int(os.environ.get('SQUAD_WAIT_TIMEOUT', 25))
+app.config['SQUAD_WAIT_POLL_INTERVAL'] = float(os.environ.get('SQUAD_WAIT_POLL_INTERVAL', 1.0))
+
 # Configure CSRF
 app.config['WTF_CSRF_CHECK_DEFAULT'] = False
 app.config['WTF_CSRF_SSL_STRICT'] = False
@@ -41,6 +102,22 @@ csrf = CSRFProtect(app)
 # Initialize database
 db.init_app(app)
 
+# Record student/squad changes for the dashboard delta sync, and drop squad hub snapshots they invalidate
+track_changes(db.session)
+track_snapshot_invalidation(db.session)
+
+# Durable background jobs (translation, squad creation, batch analysis) run by a fixed pool of worker threads.
+# The server entrypoints (main.py, wsgi.py) start the workers, so importing the app (tests, flask CLI) does not.
+job_queue = JobQueue(
+    app,
+    num_workers=app.config['JOB_WORKERS'],
+    poll_interval=app.config['JOB_POLL_INTERVAL'],
+    lease_seconds=app.config['JOB_LEASE_SECONDS'],
+    max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+    aging_seconds=app.config['JOB_AGING_SECONDS']
+)
+job_queue.watch_commits(db.session)
+
 # Template filter for JSON parsing
 @app.template_filter('from_json')
 def from_json_filter(value):
@@ -51,22 +128,8 @@ def from_json_filter(value):
         return None
 
 def load_site_content():
-    """Load site content from JSON file"""
-    try:
-        with open('site_content.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logging.error(f"Error loading site content: {e}")
-        return {}
-
-def load_questions():
-    """Load questions from JSON file"""
-    try:
-        with open('questions.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logging.error(f"Error loading questions: {e}")
-        return []
+    """Site content, parsed once and reloaded only when site_content.json changes"""
+    return get_site_content()
 
 def generate_submission_id():
     """Generate a unique submission ID like ABC-123"""
@@ -135,14 +198,10 @@ def register_all_routes():
         if not session.get('session_authenticated'):
             return redirect(url_for('session_password'))
         
-        questions_data = load_questions()
         selected_language = session.get('selected_language', 'en')
         
-        # Extract questions for the selected language
-        if 'questions' in questions_data:
-            questions = questions_data['questions'].get(selected_language, questions_data['questions'].get('en', []))
-        else:
-            questions = []
+        # Questions for the selected language from the content registry
+        questions = get_questions(selected_language)
         
         # Create form object
         from forms import StudentForm
@@ -217,17 +276,16 @@ def register_all_routes():
             try:
                 db.session.add(student)
                 print("Student added to database session")
+                # Tags are computed once here so the dashboard only reads them
+                db.session.flush()
+                save_student_tags(student)
+                # Translation (or fused translation + analysis) job is committed with the student so it survives a restart
+                job_kind = 'student_pipeline' if app.config['FUSED_STUDENT_PIPELINE'] else 'translation'
+                job_queue.enqueue(job_kind, {'student_id': student.id, 'language': student_language})
                 db.session.commit()
                 
                 logging.info(f"New student registered: {name} (ID: {student.id}, Submission ID: {submission_id})")
-                
-                # Start background translation
-                logging.info(f"Started background translation for student {student.id} in language {student_language}")
-                threading.Thread(
-                    target=translate_student_answers_in_background,
-                    args=(student.id, student_language),
-                    daemon=True
-                ).start()
+                logging.info(f"Queued background {job_kind} for student {student.id} in language {student_language}")
                 
                 return redirect(url_for('success'))
                 
@@ -257,74 +315,83 @@ def register_all_routes():
         
         # Load site content
         site_content = load_site_content()
-        success_page_content = site_content.get('success_page', {})
         
         # Get selected language
         selected_language = session.get('selected_language', 'en')
         
-        # Prepare success text with language-specific content
-        success_text = {}
-        for key, value in success_page_content.items():
-            if isinstance(value, dict) and selected_language in value:
-                # Format with student name if needed
-                text = value[selected_language]
-                if '{name}' in text and student_name:
-                    text = text.format(name=student_name)
-                success_text[key] = text
+        # Language-specific success text, precomputed per language by the content registry
+        success_text = get_success_text(selected_language, student_name)
         
         return render_template('success.html', 
                              submission_id=submission_id,
                              student_name=student_name,
                              site_content=site_content,
                              success_text=success_text,
-                             app_explanation=site_content['success_page']['app_explanation'])
+                             app_explanation=get_app_explanation())
 
     def translate_student_answers_in_background(student_id, student_language):
         """
         Background function dedicated only to translation - including special handling for Japanese students
         """
-        with app.app_context():
-            try:
-                from openai_integration import translate_to_japanese
-                
-                student = Student.query.get(student_id)
-                if not student:
-                    logging.error(f"Student {student_id} not found for translation")
-                    return
-                
-                logging.info(f"Starting translation for student {student_id} ({student.name}) in language: {student_language}")
-                
-                # For all students, translate their answers to Japanese
-                if student_language != 'ja':  # Only translate if not already Japanese
-                    logging.info(f"Translating answers for student {student_id} from {student_language} to Japanese")
-                    
-                    # Translate each question answer
-                    questions = [student.question1, student.question2, student.question3, 
-                               student.question4, student.question5, student.question6]
-                    japanese_fields = ['question1_jp', 'question2_jp', 'question3_jp', 
-                                     'question4_jp', 'question5_jp', 'question6_jp']
-                    
-                    for i, (question_text, jp_field) in enumerate(zip(questions, japanese_fields), 1):
-                        if question_text and question_text.strip():
-                            try:
-                                translated = translate_to_japanese(question_text)
-                                setattr(student, jp_field, translated)
-                                logging.info(f"Question {i} translated successfully for student {student_id}")
-                            except Exception as e:
-                                logging.error(f"Translation failed for question {i}, student {student_id}: {e}")
-                                setattr(student, jp_field, question_text)  # Fallback to original
-                    
-                    # Save translations
-                    db.session.commit()
-                    logging.info(f"Successfully processed translations for student {student_id}")
-                else:
-                    logging.info(f"Student {student_id} is already in Japanese, skipping translation")
-                
-                logging.info(f"Translation completed and saved for student {student_id}")
-                
-            except Exception as e:
-                logging.error(f"Translation error for student {student_id}: {e}")
-                db.session.rollback()
+        translate_students_answers_in_background([(student_id, student_language)])
+
+    def translate_students_answers_in_background(translation_requests, last_attempt=True):
+        """
+        Translate a burst of submissions with one AI request for all of their answers.
+        Failed translations are retried by the job queue; the last attempt keeps the original answers.
+        """
+        from translation_batcher import translate_students
+        
+        logging.info(f"Starting translation for students: {translation_requests}")
+        # Failures record no stage hash, so the next pipeline run translates them again
+        translate_students(translation_requests, strict=not last_attempt)
+        index_submitted_students([student_id for student_id, _ in translation_requests])
+
+    def index_submitted_students(student_ids):
+        """Add the new students to the compatibility index while we are in the background"""
+        from compatibility_index import index_students
+        from vibe_keywords import get_vibe_archetype
+        
+        try:
+            index_students(
+                Student.query.filter(Student.id.in_(student_ids)).all(),
+                get_vibe_archetype,
+                top_k=app.config['COMPATIBILITY_TOP_K']
+            )
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to update compatibility index for students {student_ids}: {str(e)}")
+
+    def run_translation_jobs(payloads, last_attempt):
+        """Job handler - submissions claimed together share one AI request"""
+        translate_students_answers_in_background(
+            [(payload['student_id'], payload['language']) for payload in payloads],
+            last_attempt=last_attempt
+        )
+
+    def run_student_pipeline_jobs(payloads, last_attempt):
+        """Job handler (FUSED_STUDENT_PIPELINE) - one AI request per student for the translations and the signature"""
+        from student_pipeline import process_students
+        
+        pipeline_requests = [(payload['student_id'], payload['language']) for payload in payloads]
+        logging.info(f"Starting fused pipeline for students: {pipeline_requests}")
+        process_students(pipeline_requests, strict=not last_attempt)
+        index_submitted_students([student_id for student_id, _ in pipeline_requests])
+
+    # Submission work never takes the last worker, so teacher actions do not wait behind a backlog
+    job_queue.register(
+        'translation',
+        run_translation_jobs,
+        batch_size=app.config['TRANSLATION_BATCH_SIZE'],
+        priority=app.config['JOB_PRIORITIES']['translation'],
+        max_running=max(1, app.config['JOB_WORKERS'] - 1)
+    )
+    job_queue.register(
+        'student_pipeline',
+        run_student_pipeline_jobs,
+        priority=app.config['JOB_PRIORITIES']['student_pipeline'],
+        max_running=max(1, app.config['JOB_WORKERS'] - 1)
+    )
 
     @app.route('/login')
     def login():
@@ -398,8 +465,12 @@ def register_all_routes():
             # Check if squads exist
             squads_exist = len(squads) > 0
             
-            # Check if analysis is complete (simplified check)
-            analysis_complete = all(student.archetype for student in students) if students else False
+            # Check if analysis is complete - no signature missing or out of date (answers or prompt changed)
+            from analysis_pipeline import stale_students
+            analysis_complete = not stale_students('signature', students) if students else False
+            
+            # Squad creation or batch analysis still running in the background - the page shows its progress
+            active_job = job_queue.active_job(TEACHER_JOB_KINDS)
             
             return render_template('organizer_dashboard_sophisticated.html',
                                  students=students,
@@ -407,7 +478,8 @@ def register_all_routes():
                                  solo_students_db=solo_students_db,
                                  session_password=session_password,
                                  squads_exist=squads_exist,
-                                 analysis_complete=analysis_complete)
+                                 analysis_complete=analysis_complete,
+                                 active_job=job_status(active_job) if active_job else None)
                                  
         except Exception as e:
             logging.error(f"Dashboard error: {e}")
@@ -442,10 +514,26 @@ def register_all_routes():
 
     @app.route('/squad_hub/<int:squad_id>')
     def squad_hub(squad_id):
-        """View squad details"""
+        """View squad details from the squad's materialized snapshot"""
         try:
-            squad = Squad.query.get_or_404(squad_id)
-            return render_template('squad_hub.html', squad=squad)
+            snapshot = get_snapshot(squad_id)
+            if snapshot is None:
+                return "Squad not found", 404
+            payload, etag = snapshot
+            
+            # Every member loads the same snapshot, so revisits are answered without rendering
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(render_template(
+                    'squad_hub.html',
+                    squad=payload['squad'],
+                    icebreaker_data=payload['icebreaker'],
+                    first_speaker=payload['first_speaker']
+                ))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
             
         except Exception as e:
             logging.error(f"Error loading squad hub: {e}")
@@ -483,6 +571,8 @@ def register_all_routes():
             # Store icebreakers in squad
             squad.icebreaker_text = json.dumps(icebreakers) if icebreakers else None
             db.session.commit()
+            save_snapshots([squad])
+            db.session.commit()
             
             flash(f'Icebreaker activities generated for {squad.name}', 'success')
             return redirect(url_for('organizer_dashboard'))
@@ -517,6 +607,7 @@ def register_all_routes():
             # Delete all squads and students
             Squad.query.delete()
             Student.query.delete()
+            record_reset()  # Dashboards reload instead of replaying a wholesale change
             db.session.commit()
             flash('All student and squad data cleared successfully', 'success')
         except Exception as e:
@@ -541,6 +632,32 @@ def register_all_routes():
 
     # Add missing sophisticated routes here
     
+    # Long-running organizer operations, run as tracked background jobs
+    TEACHER_JOB_KINDS = ('create_squads', 'analysis')
+
+    def start_teacher_job(kind, payload):
+        """
+        Queue a long-running organizer operation and return right away. A request for the operation
+        already running gets that job; while another operation runs the request is refused (409).
+        """
+        job = job_queue.active_job(TEACHER_JOB_KINDS)
+        if job is not None and job.kind != kind:
+            message = "別の処理を実行中です。完了までお待ちください。"  # Another operation is still running
+            logging.info(f"Refused {kind} job while {job.kind} job {job.id} is running")
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify(dict(job_status(job), success=False, message=message, status_url=url_for('teacher_job_status', job_id=job.id))), 409
+            flash(message, 'warning')
+            return redirect(url_for('organizer_dashboard'))
+        if job is None:
+            # No automatic retry - the organizer sees the failure and can start the operation again
+            job = job_queue.enqueue(kind, payload, max_attempts=1)
+            db.session.commit()
+            logging.info(f"Queued {kind} job {job.id}")
+        
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(dict(job_status(job), success=True, status_url=url_for('teacher_job_status', job_id=job.id))), 202
+        return redirect(url_for('organizer_dashboard'))
+
     @app.route('/teacher/create-squads', methods=['POST'])
     def create_squads():
         """AI-powered squad formation - The Sorting Hat of the application"""
@@ -553,94 +670,225 @@ def register_all_routes():
             logging.warning("Authentication failed in create_squads route")
             return redirect(url_for('teacher_login'))
         
+        if request.form.get('mode') == 'incremental':
+            # Late arrivals: keep the existing squads and only place unassigned students (local, no AI call)
+            add_late_arrivals_to_squads()
+            return redirect(url_for('organizer_dashboard'))
+        
+        # The AI call can take minutes - run it in the background
+        payload = {'mode': request.form.get('mode'), 'optimize': request.form.get('optimize') == '1'}
+        return start_teacher_job('create_squads', payload)
+
+    def add_late_arrivals_to_squads():
+        """
+        Incremental squad formation: place unassigned students into the existing squads
+        (or new ones) by answer similarity, touching only the newcomers and any new squads
+        """
+        from squad_formation import place_incrementally
+        
+        if job_queue.active_job(('create_squads',)):
+            flash("スクワッド作成を実行中です。完了までお待ちください。", 'warning')  # Squad creation is still running
+            return
+        
+        answer_columns = [getattr(Student, f'question{i}') for i in range(1, 7)] + \
+                         [getattr(Student, f'question{i}_jp') for i in range(1, 7)]
         try:
-            # Step 1: Clean slate - Reset all existing squad assignments
-            db.session.execute(db.text("UPDATE students SET squad_id = NULL"))
-            Squad.query.delete()
-            db.session.commit()
-            
-            # Step 2: Fetch all unassigned student submissions from database
-            unassigned_students = Student.query.filter_by(squad_id=None).all()
-            
-            if len(unassigned_students) < 3:
-                return redirect(url_for('organizer_dashboard'))
+            newcomers = Student.query.filter_by(squad_id=None).all()
+            if not newcomers:
+                flash('新しく参加した学生はいません', 'info')  # No new students to place
+                return
             
-            # Step 3: Prepare student data for AI analysis
-            students_data = []
-            student_map = {}
-            
-            for student in unassigned_students:
-                student_data = {
-                    'id': student.id,
-                    'name': student.name,
-                    'archetype': student.archetype or '個性豊かな学生',
-                    'core_strength': student.core_strength or 'Hidden Strength',
-                    'hidden_potential': student.hidden_potential or 'Undiscovered Potential',
-                    'conversation_catalyst': student.conversation_catalyst or 'Natural Connector',
-                }
-                students_data.append(student_data)
-                student_map[student.id] = student
+            # Only the answers of current squad members are needed, not full ORM objects
+            squads = Squad.query.all()
+            members_by_squad = {squad.id: [] for squad in squads}
+            for row in db.session.query(Student.id, Student.squad_id, *answer_columns).filter(Student.squad_id.isnot(None)):
+                members_by_squad[row.squad_id].append(dict(row._mapping))
             
-            logging.info(f"Sending {len(students_data)} students to AI for intelligent grouping")
+            newcomers_data = []
+            for student in newcomers:
+                student_data = {'id': student.id}
+                for i in range(1, 7):
+                    student_data[f'question{i}'] = getattr(student, f'question{i}')
+                    student_data[f'question{i}_jp'] = getattr(student, f'question{i}_jp')
+                newcomers_data.append(student_data)
             
-            # Step 4: Send to AI for intelligent squad formation
-            try:
-                from openai_integration import group_students_into_squads
-                logging.info("🤖 Calling AI for squad formation...")
-                ai_response = group_students_into_squads(students_data)
-                logging.info("🎯 AI squad formation completed successfully")
-            except Exception as ai_error:
-                logging.error(f"❌ AI squad formation failed: {str(ai_error)}")
-                # Create a simple fallback grouping
-                ai_response = create_simple_japanese_squads(students_data)
-                logging.info(f"Fallback Response: {ai_response}")
-            
-            # Step 5: Parse AI response and validate structure
-            if not isinstance(ai_response, dict) or 'squads' not in ai_response:
-                raise ValueError("Invalid AI response format")
+            result = place_incrementally(
+                [{'id': squad_id, 'members': members} for squad_id, members in members_by_squad.items()],
+                newcomers_data,
+                taken_names={squad.name for squad in squads}
+            )
             
-            squads_created = 0
+            student_map = {student.id: student for student in newcomers}
+            for student_id, squad_id in result['placements'].items():
+                student_map[student_id].squad_id = squad_id
             
-            # Step 6: Process each AI-suggested squad and save to database
-            for i, squad_data in enumerate(ai_response['squads'], 1):
-                required_keys = ['squad_name', 'shared_interests', 'member_ids']
-                if not all(key in squad_data for key in required_keys):
-                    logging.warning(f"Skipping squad with missing keys: {squad_data}")
-                    continue
-                
-                # Create new squad record
+            touched_squad_ids = set(result['placements'].values())
+            touched_squads = [squad for squad in squads if squad.id in touched_squad_ids]
+            next_rank = max([squad.squad_rank or 0 for squad in squads], default=0) + 1
+            for rank, squad_data in enumerate(result['squads'], next_rank):
                 new_squad = Squad()
-                new_squad.squad_rank = i
+                new_squad.squad_rank = rank
                 new_squad.name = squad_data['squad_name']
                 new_squad.shared_interests = squad_data['shared_interests']
                 new_squad.squad_icon = 'fa-users'  # Default icon
                 db.session.add(new_squad)
-                db.session.flush()
-                
-                # Assign students to this squad
-                members_assigned = 0
+                db.session.flush()  # Get the squad ID for student assignments
                 for student_id in squad_data['member_ids']:
-                    if student_id in student_map:
-                        student = student_map[student_id]
-                        student.squad_id = new_squad.id
-                        members_assigned += 1
-                        logging.info(f"Assigned {student.name} to squad '{squad_data['squad_name']}'")
-                
-                if members_assigned > 0:
-                    squads_created += 1
-                    logging.info(f"Created squad '{squad_data['squad_name']}' with {members_assigned} members")
-                else:
-                    db.session.delete(new_squad)
+                    student_map[student_id].squad_id = new_squad.id
+                touched_squads.append(new_squad)
             
-            # Step 7: Commit all changes to database
+            # Rebuild the hub snapshots of every squad that gained members
+            db.session.flush()
+            save_snapshots(touched_squads)
             db.session.commit()
-            logging.info(f"✅ Database commit successful! {squads_created} squads created")
-            
+            placed = len(result['placements']) + sum(len(squad['member_ids']) for squad in result['squads'])
+            logging.info(f"✅ Incremental squad formation placed {placed} of {len(newcomers)} late arrivals")
+            # N students added to squads (M new squads)
+            flash(f'{placed}人の学生をスクワッドに追加しました（新しいスクワッド: {len(result["squads"])}）', 'success')
+        
         except Exception as e:
             db.session.rollback()
-            logging.error(f"Error during squad formation: {str(e)}")
+            logging.error(f"Error during incremental squad formation: {str(e)}")
+            flash('スクワッドへの追加中にエラーが発生しました', 'error')  # Error while adding to squads
+
+    def run_create_squads_job(payload, job):
+        """
+        Background part of squad creation. The current squads are only replaced in the final
+        transaction, so a cancelled or failed run leaves the dashboard as it was.
+        """
+        # Step 1: Fetch every student submission - all of them are regrouped from scratch
+        students = Student.query.all()
         
-        return redirect(url_for('organizer_dashboard'))
+        if len(students) < 3:
+            job.report('done', force=True, message="スクワッドを作成するには3人以上の学生が必要です。")  # Need at least 3 students
+            return
+        
+        # Step 2: Prepare student data for AI analysis
+        students_data = []
+        student_map = {}
+        
+        for student in students:
+            student_data = {
+                'id': student.id,
+                'name': student.name,
+                'archetype': student.archetype or '個性豊かな学生',
+                'core_strength': student.core_strength or 'Hidden Strength',
+                'hidden_potential': student.hidden_potential or 'Undiscovered Potential',
+                'conversation_catalyst': student.conversation_catalyst or 'Natural Connector',
+            }
+            # Raw answers and demographics for the local engines (not sent to the AI)
+            student_data['country'] = student.country
+            student_data['gender'] = student.gender
+            for i in range(1, 7):
+                student_data[f'question{i}'] = getattr(student, f'question{i}')
+                student_data[f'question{i}_jp'] = getattr(student, f'question{i}_jp')
+            students_data.append(student_data)
+            student_map[student.id] = student
+        
+        # Step 3: Form squads - the request's mode, else SQUAD_FORMATION_MODE ('auto' picks by class size)
+        from squad_formation import resolve_formation_mode
+        formation_mode = resolve_formation_mode(payload.get('mode'), len(students_data), app.config)
+        logging.info(f"Squad formation mode: {formation_mode} for {len(students_data)} students")
+        job.report('forming', force=True, mode=formation_mode, students_total=len(students_data))
+        
+        try:
+            from openai_integration import group_students_into_squads
+            if formation_mode == 'local':
+                # No API call: cluster students by the similarity of their answers
+                from squad_formation import form_squads_locally
+                ai_response = form_squads_locally(students_data)
+            elif formation_mode == 'hybrid':
+                # Local membership from signatures, one small concurrent AI call per squad for naming
+                from openai_integration import generate_squad_identity
+                from squad_formation import form_squads_hybrid
+                ai_response = form_squads_hybrid(
+                    students_data,
+                    generate_squad_identity,
+                    max_workers=app.config['SQUAD_NAMING_MAX_CONCURRENCY'],
+                    progress=lambda named, total: job.report('naming', named, total, squads_named=named, squads_total=total)
+                )
+            elif formation_mode == 'hierarchical':
+                # Large cohorts: group pre-partitioned blocks with parallel AI calls
+                from squad_formation import form_squads_hierarchical, form_squads_locally
+                ai_response = form_squads_hierarchical(
+                    students_data,
+                    group_students_into_squads,
+                    form_squads_locally,
+                    block_size=app.config['SQUAD_BLOCK_SIZE'],
+                    max_workers=app.config['SQUAD_FORMATION_MAX_CONCURRENCY'],
+                    progress=lambda grouped, total: job.report('forming', grouped, total, blocks_grouped=grouped, blocks_total=total)
+                )
+            else:
+                logging.info("🤖 Calling AI for squad formation...")
+                ai_response = group_students_into_squads(students_data)
+            logging.info("🎯 AI squad formation completed successfully")
+        except Exception as ai_error:
+            logging.error(f"❌ AI squad formation failed: {str(ai_error)}")
+            # Fall back to local similarity clustering, and to simple chunking if even that fails
+            try:
+                from squad_formation import form_squads_locally
+                ai_response = form_squads_locally(students_data)
+            except Exception as local_error:
+                logging.error(f"❌ Local squad formation failed: {str(local_error)}")
+                ai_response = create_simple_japanese_squads(students_data)
+            logging.info(f"Fallback Response: {ai_response}")
+        
+        # Nothing has been written yet - a cancelled job stops here and keeps the current squads
+        job.check_cancelled()
+        
+        # Step 4: Parse AI response and validate structure
+        if not isinstance(ai_response, dict) or 'squads' not in ai_response:
+            raise ValueError("Invalid AI response format")
+        
+        # Step 5: Repair the AI's partition in memory, save all squads with one flush
+        # and assign every student in one bulk update
+        from squad_formation import repair_partition
+        from squad_optimizer import optimize_squads
+        squads_data = repair_partition(ai_response['squads'], list(student_map))
+        
+        # Optional post-pass: rebalance squads for country/gender mix while keeping similar students together
+        if payload.get('optimize') or app.config['SQUAD_OPTIMIZE_DIVERSITY']:
+            job.report('optimizing', force=True)
+            squads_data = optimize_squads(squads_data, students_data, iterations=app.config['SQUAD_OPTIMIZER_ITERATIONS'])
+        
+        job.check_cancelled()
+        job.report('saving', force=True, squads_total=len(squads_data))
+        
+        # Clean slate - reset all existing squad assignments in the same transaction as the new squads
+        db.session.execute(db.text("UPDATE students SET squad_id = NULL"))
+        Squad.query.delete()
+        record_reset()  # Dashboards reload instead of replaying a wholesale change
+        
+        new_squads = []
+        for i, squad_data in enumerate(squads_data, 1):
+            new_squad = Squad()
+            new_squad.squad_rank = i
+            new_squad.name = squad_data['squad_name']
+            new_squad.shared_interests = squad_data['shared_interests']
+            new_squad.squad_icon = 'fa-users'  # Default icon
+            new_squads.append(new_squad)
+        db.session.add_all(new_squads)
+        db.session.flush()
+        
+        assignments = [
+            {'id': student_id, 'squad_id': new_squad.id}
+            for new_squad, squad_data in zip(new_squads, squads_data)
+            for student_id in squad_data['member_ids']
+        ]
+        if assignments:
+            db.session.execute(db.update(Student), assignments)
+            record_changes('student', [assignment['id'] for assignment in assignments])
+        # Squad hubs are opened by every member at once - materialize them now
+        save_snapshots(new_squads)
+        # The squads now reflect this cohort - the pipeline reports them stale once it changes
+        from analysis_pipeline import record_clustering
+        record_clustering(students)
+        squads_created = len(new_squads)
+        
+        # Step 6: Commit all changes to database
+        db.session.commit()
+        logging.info(f"✅ Database commit successful! {squads_created} squads created")
+        job.report('done', force=True, squads_created=squads_created, message=f"🎉 {squads_created}個のスクワッドを作成しました！")  # N squads created
     
     def create_simple_japanese_squads(students_data):
         """Fallback squad creation with Japanese names when AI is unavailable"""
@@ -719,51 +967,59 @@ def register_all_routes():
     
     @app.route('/analyze-batch', methods=['POST'])
     def analyze_batch():
-        """Analyze batch of students with AI personality generation"""
+        """Start AI personality generation for the students whose traits are missing or out of date, in the background"""
         if not session.get('teacher_authenticated'):
             return redirect(url_for('teacher_login'))
         
-        try:
-            from openai_integration import generate_archetype, generate_core_strength, generate_hidden_potential, generate_conversation_catalyst
-            
-            students = Student.query.all()
-            
-            for student in students:
-                # Prepare student answers for AI analysis
-                student_answers = {
-                    'question1': student.question1,
-                    'question2': student.question2,
-                    'question3': student.question3,
-                    'question4': student.question4,
-                    'question5': student.question5,
-                    'question6': student.question6
-                }
-                
-                # Generate AI-powered personality traits if not already set
-                if not student.archetype:
-                    logging.info(f"Generating archetype for student {student.name}")
-                    student.archetype = generate_archetype(student_answers)
-                
-                if not student.core_strength:
-                    logging.info(f"Generating core strength for student {student.name}")
-                    student.core_strength = generate_core_strength(student_answers)
-                
-                if not student.hidden_potential:
-                    logging.info(f"Generating hidden potential for student {student.name}")
-                    student.hidden_potential = generate_hidden_potential(student_answers)
-                
-                if not student.conversation_catalyst:
-                    logging.info(f"Generating conversation catalyst for student {student.name}")
-                    student.conversation_catalyst = generate_conversation_catalyst(student_answers)
-            
-            db.session.commit()
-            logging.info("Batch analysis completed with AI-generated personality traits")
-            
-        except Exception as e:
-            db.session.rollback()
-            logging.error(f"Error in batch analysis: {str(e)}")
+        return start_teacher_job('analysis', {})
+
+    def run_analysis_job(payload, job):
+        """
+        Background part of batch analysis - recomputes only the stale pipeline stages (new or changed
+        answers, or a new prompt version), reports the students analyzed and stops when cancelled
+        """
+        from analysis_pipeline import run_pipeline
         
-        return redirect(url_for('organizer_dashboard'))
+        stats = run_pipeline(
+            job,
+            max_workers=app.config['ANALYSIS_MAX_CONCURRENCY'],
+            commit_batch_size=app.config['ANALYSIS_COMMIT_BATCH_SIZE'],
+            translation_batch_size=app.config['TRANSLATION_BATCH_SIZE'],
+            top_k=app.config['COMPATIBILITY_TOP_K']
+        )
+        logging.info(f"Batch analysis completed, stale stages: {stats['stale']}")
+        # N students analyzed (cancelled)
+        message = f"{stats['analyzed']}人の学生を分析しました。" + ("（キャンセルされました）" if stats['stopped'] else "")
+        if not stats['stopped'] and stats['squads_stale'] and Squad.query.count() > 0:
+            message += " スクワッドは最新の分析を反映していません。"  # Squads were formed before these changes
+        job.report('done', force=True, students_analyzed=stats['analyzed'], message=message)
+
+    job_queue.register('create_squads', run_create_squads_job, tracked=True, priority=app.config['JOB_PRIORITIES']['create_squads'], max_running=1)
+    job_queue.register('analysis', run_analysis_job, tracked=True, priority=app.config['JOB_PRIORITIES']['analysis'], max_running=1)
+
+    @app.route('/teacher/jobs/<int:job_id>')
+    def teacher_job_status(job_id):
+        """Progress of a background organizer operation (stage, students analyzed, ETA)"""
+        if not session.get('teacher_authenticated'):
+            return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+        
+        job = db.session.get(Job, job_id)
+        if job is None or job.kind not in TEACHER_JOB_KINDS:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        return jsonify(dict(job_status(job), success=True))
+
+    @app.route('/teacher/jobs/<int:job_id>/cancel', methods=['POST'])
+    def cancel_teacher_job(job_id):
+        """Cancel a background organizer operation - squads are only replaced if squad creation finishes"""
+        if not session.get('teacher_authenticated'):
+            return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+        
+        job = db.session.get(Job, job_id)
+        if job is None or job.kind not in TEACHER_JOB_KINDS:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        cancelled = job_queue.cancel(job_id)
+        logging.info(f"Organizer cancelled job {job_id}: {cancelled}")
+        return jsonify(dict(job_status(job), success=cancelled))
     
     @app.route('/clear-squads', methods=['POST'])
     def clear_squads():
@@ -777,6 +1033,7 @@ def register_all_routes():
             
             Student.query.delete()
             Squad.query.delete()
+            record_reset()  # Dashboards reload instead of replaying a wholesale change
             db.session.commit()
             
             logging.info(f"Complete database reset: {students_count} students deleted, {squads_count} squads deleted")
@@ -858,6 +1115,9 @@ try:
     with app.app_context():
         db.create_all()
         print("✅ Database tables created")
+        # Outputs stored before this point are adopted by the analysis pipeline, later ones need a recorded hash
+        from analysis_pipeline import start_tracking
+        start_tracking()
 
     # Register all routes
     register_all_routes()
@@ -868,6 +1128,12 @@ except Exception as e:
     # Still create app_instance even if there are errors
     pass
 
+@app.cli.command('backfill-tags')
+def backfill_tags_command():
+    """Store interest tags, core sparks and vibe archetype for students submitted before they were persisted"""
+    count = backfill_student_tags()
+    print(f"✅ Backfilled tags for {count} students")
+
 # This is the WSGI application that Firebase App Hosting will use
 app_instance = app
 
@@ -875,4 +1141,7 @@ if __name__ == '__main__':
     debug_mode = os.getenv('FLASK_ENV', 'production') == 'development'
     port = int(os.environ.get('PORT', 8080))
     print(f"🚀 Starting app on port {port}")
+    # With the debug reloader only the serving child process runs jobs
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.start()
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
@@ -0,0 +1,127 @@
+"""
+Change feed for the teacher dashboard delta sync.
+
+Every flush that inserts, updates or deletes a Student or Squad appends rows to the
+change_events table (a student moving between squads also touches both squads), so the
+dashboard can ask for everything after the last event ID it saw instead of reloading.
+Bulk statements bypass the ORM and must record their changes with record_changes()
+or record_reset().
+"""
+
+import logging
+
+from sqlalchemy import event, inspect, insert
+
+from models import db, Student, Squad, ChangeEvent
+
+
+def _filled(obj, field):
+    """Whether this flush sets a previously empty field"""
+    history = inspect(obj).attrs[field].history
+    return any(history.added) and not any(history.deleted)
+
+
+def _student_action(obj):
+    if _filled(obj, 'question1_jp'):
+        return 'translated'
+    if _filled(obj, 'archetype'):
+        return 'analyzed'
+    return 'update'
+
+
+def flush_changes(session):
+    """(kind, entity_id, action) of every Student/Squad change in the pending flush"""
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Student):
+            changes.append(('student', obj.id, 'create'))
+            if obj.squad_id:
+                changes.append(('squad', obj.squad_id, 'update'))
+        elif isinstance(obj, Squad):
+            changes.append(('squad', obj.id, 'create'))
+
+    for obj in session.dirty:
+        if not isinstance(obj, (Student, Squad)) or not session.is_modified(obj):
+            continue
+        if isinstance(obj, Student):
+            changes.append(('student', obj.id, _student_action(obj)))
+            history = inspect(obj).attrs.squad_id.history
+            for squad_id in [obj.squad_id] + list(history.deleted or []):
+                if squad_id:
+                    changes.append(('squad', squad_id, 'update'))
+        else:
+            changes.append(('squad', obj.id, 'update'))
+
+    for obj in session.deleted:
+        if isinstance(obj, Student):
+            changes.append(('student', obj.id, 'delete'))
+            if obj.squad_id:
+                changes.append(('squad', obj.squad_id, 'update'))
+        elif isinstance(obj, Squad):
+            changes.append(('squad', obj.id, 'delete'))
+    return changes
+
+
+def _after_flush(session, flush_context):
+    # IDs are assigned by now while new/dirty/deleted still describe the flush
+    changes = list(dict.fromkeys(change for change in flush_changes(session) if change[1] is not None))
+    if changes:
+        session.connection().execute(insert(ChangeEvent.__table__), [
+            {'kind': kind, 'entity_id': entity_id, 'action': action} for kind, entity_id, action in changes
+        ])
+
+
+def track_changes(session=None):
+    """Record Student/Squad changes of every flush of the (scoped) session"""
+    session = session or db.session
+    if not event.contains(session, 'after_flush', _after_flush):
+        event.listen(session, 'after_flush', _after_flush)
+
+
+def record_changes(kind, entity_ids, action='update'):
+    """Record changes made by bulk statements (the caller commits)"""
+    rows = [{'kind': kind, 'entity_id': entity_id, 'action': action} for entity_id in dict.fromkeys(entity_ids)]
+    if rows:
+        db.session.execute(insert(ChangeEvent.__table__), rows)
+
+
+def record_reset():
+    """
+    Record a change too large to describe (everything deleted or regrouped): older events are
+    dropped and every dashboard behind this point reloads in full (the caller commits)
+    """
+    db.session.execute(ChangeEvent.__table__.delete())
+    db.session.execute(insert(ChangeEvent.__table__), [{'kind': 'reset', 'entity_id': None, 'action': 'reset'}])
+
+
+def current_cursor():
+    """ID of the latest change event (0 when there is none)"""
+    return db.session.query(db.func.max(ChangeEvent.id)).scalar() or 0
+
+
+def changes_since(cursor, limit=500):
+    """
+    Changes after a cursor, collapsed to the latest action per entity.
+    Returns {'cursor', 'reset', 'students': {id: action}, 'squads': {id: action}}.
+    reset is True when the client must reload: a reset event happened, the cursor is
+    unknown to this database, or more changes piled up than one response carries.
+    """
+    events = ChangeEvent.query.filter(ChangeEvent.id > cursor).order_by(ChangeEvent.id).limit(limit + 1).all()
+    result = {'cursor': cursor, 'reset': False, 'students': {}, 'squads': {}}
+    if not events:
+        latest = current_cursor()
+        if cursor > latest:
+            # The cursor comes from another database (tables recreated)
+            result.update(cursor=latest, reset=True)
+        return result
+
+    if len(events) > limit or any(change.kind == 'reset' for change in events):
+        result.update(cursor=current_cursor(), reset=True)
+        return result
+
+    for change in events:
+        bucket = result['students'] if change.kind == 'student' else result['squads']
+        bucket[change.entity_id] = change.action
+    result['cursor'] = events[-1].id
+    logging.info(f"Change feed: {len(events)} events after cursor {cursor}")
+    return result
@@ -0,0 +1,199 @@
+"""
+Persisted compatibility index - every student's hashed vibe words, archetype and top-k most
+compatible students are kept in the student_similarity table, so pages read precomputed
+neighbors instead of scoring every pair on each request.
+
+Indexing a new student costs O(n): one shared-word count against every indexed student,
+and only rows whose neighbor lists change are written; a list that loses a neighbor (the
+neighbor's answers changed or it was deleted) is recomputed against every student. Writers
+are serialized within the process (the app runs a single gunicorn worker).
+Must be used inside an application context.
+"""
+
+import json
+import logging
+import threading
+import zlib
+
+import numpy as np
+
+from compatibility import compatibility_scores, top_partners, vibe_words
+
+
+def word_features(vibes_text):
+    """Hashed vibe words of a student - the stored per-student vector"""
+    return sorted({zlib.crc32(word.encode('utf-8')) for word in vibe_words(vibes_text)})
+
+
+# index_students reads every row, updates neighbor lists in memory and writes them back, so two
+# translation workers indexing at once would overwrite each other's updates - writers take turns
+_index_lock = threading.Lock()
+
+
+def _rank(neighbors, top_k):
+    """Best neighbors first; ties go to the lower student ID"""
+    return sorted(neighbors, key=lambda pair: (-pair[1], pair[0]))[:top_k]
+
+
+def _scores(own_features, own_archetype, other_ids, features, archetypes):
+    """Compatibility of one student with each of other_ids, from the stored word features"""
+    lengths = [len(features[other_id]) for other_id in other_ids]
+    all_features = np.concatenate([features[other_id] for other_id in other_ids])
+    owners = np.repeat(np.arange(len(other_ids)), lengths)
+    shared = np.bincount(owners, weights=np.isin(all_features, own_features), minlength=len(other_ids))
+    same_archetype = np.array([archetypes[other_id] == own_archetype for other_id in other_ids])
+    return np.round(compatibility_scores(shared, same_archetype), 4)
+
+
+def _top_neighbors(other_ids, scores, top_k):
+    order = np.lexsort((other_ids, -scores))[:top_k]
+    return [[int(other_ids[i]), float(scores[i])] for i in order]
+
+
+def index_students(students, archetype_fn, top_k=5):
+    """
+    Add (or refresh) the given students in the index and update the neighbor lists
+    of every student they now belong to. Rows of deleted students are purged, and every
+    list that loses a neighbor is recomputed in full, so the result matches rebuild_index.
+    Returns the number of index rows written or deleted.
+    """
+    from models import db, Student, StudentSimilarity
+
+    if not students:
+        return 0
+
+    with _index_lock:
+        rows = {row.student_id: row for row in StudentSimilarity.query.populate_existing().all()}
+        features = {student_id: np.array(json.loads(row.features), dtype=np.int64) for student_id, row in rows.items()}
+        archetypes = {student_id: row.archetype for student_id, row in rows.items()}
+        neighbors = {student_id: json.loads(row.neighbors) for student_id, row in rows.items()}
+        changed = set()
+        # Lists that lost a neighbor - a student they never saw may now belong in them
+        incomplete = set()
+
+        def forget(student_ids):
+            for other_id, other_neighbors in neighbors.items():
+                kept = [pair for pair in other_neighbors if pair[0] not in student_ids]
+                if len(kept) != len(other_neighbors):
+                    neighbors[other_id] = kept
+                    incomplete.add(other_id)
+
+        live_ids = {student_id for (student_id,) in db.session.query(Student.id)}
+        deleted_ids = set(rows) - live_ids
+        for student_id in deleted_ids:
+            db.session.delete(rows.pop(student_id))
+            del features[student_id], archetypes[student_id], neighbors[student_id]
+        forget(deleted_ids)
+
+        for student in students:
+            vibes_text = student.vibes or student.get_combined_answers()
+            own_features = np.array(word_features(vibes_text), dtype=np.int64)
+            own_archetype = archetype_fn(vibes_text)
+
+            if student.id in features:
+                # Answers changed or the ID was reused: forget the old entry everywhere first
+                del features[student.id]
+                forget({student.id})
+
+            other_ids = np.array(list(features), dtype=np.int64)
+            own_neighbors = []
+            if len(other_ids):
+                scores = _scores(own_features, own_archetype, other_ids, features, archetypes)
+                own_neighbors = _top_neighbors(other_ids, scores, top_k)
+
+                # Only students whose list is short or whose weakest neighbor scores lower can change
+                weakest = np.array([
+                    neighbors[other_id][-1][1] if len(neighbors[other_id]) >= top_k else -1.0
+                    for other_id in other_ids
+                ])
+                for i in np.flatnonzero(scores >= weakest):
+                    other_id = int(other_ids[i])
+                    updated = _rank(neighbors[other_id] + [[student.id, float(scores[i])]], top_k)
+                    if updated != neighbors[other_id]:
+                        neighbors[other_id] = updated
+                        changed.add(other_id)
+
+            features[student.id] = own_features
+            archetypes[student.id] = own_archetype
+            neighbors[student.id] = own_neighbors
+            changed.add(student.id)
+            incomplete.discard(student.id)
+
+        for student_id in incomplete:
+            other_ids = np.array([other_id for other_id in features if other_id != student_id], dtype=np.int64)
+            neighbors[student_id] = _top_neighbors(
+                other_ids, _scores(features[student_id], archetypes[student_id], other_ids, features, archetypes), top_k
+            ) if len(other_ids) else []
+            changed.add(student_id)
+
+        for student_id in changed:
+            row = rows.get(student_id)
+            if row is None:
+                row = StudentSimilarity(student_id=student_id)
+                db.session.add(row)
+            row.features = json.dumps(features[student_id].tolist())
+            row.archetype = archetypes[student_id]
+            row.neighbors = json.dumps(neighbors[student_id])
+        db.session.commit()
+
+    logging.info(f"Compatibility index: indexed {len(students)} students, {len(changed)} rows updated, "
+                 f"{len(deleted_ids)} deleted students purged")
+    return len(changed) + len(deleted_ids)
+
+
+def rebuild_index(students, archetype_fn, top_k=5):
+    """Rebuild the whole index at once with one blocked matrix product (cheaper than n single inserts)"""
+    from models import db, StudentSimilarity
+
+    vibes_texts = [student.vibes or student.get_combined_answers() for student in students]
+    archetypes = [archetype_fn(vibes_text) for vibes_text in vibes_texts]
+    partners, scores = top_partners([vibe_words(vibes_text) for vibes_text in vibes_texts], archetypes, top_k=top_k)
+
+    with _index_lock:
+        StudentSimilarity.query.delete()
+        for row, student in enumerate(students):
+            db.session.add(StudentSimilarity(
+                student_id=student.id,
+                features=json.dumps(word_features(vibes_texts[row])),
+                archetype=archetypes[row],
+                neighbors=json.dumps([[students[partner].id, round(float(score), 4)]
+                                      for partner, score in zip(partners[row], scores[row])]),
+            ))
+        db.session.commit()
+    logging.info(f"Compatibility index rebuilt for {len(students)} students")
+
+
+def ensure_indexed(archetype_fn, top_k=5):
+    """
+    Index students that are missing from the index (e.g. submitted through another code path)
+    or whose row predates them (reused IDs). Rebuilds from scratch when most of the cohort is missing.
+    """
+    from models import db, Student, StudentSimilarity
+
+    unindexed = Student.query.outerjoin(
+        StudentSimilarity, Student.id == StudentSimilarity.student_id
+    ).filter(db.or_(
+        StudentSimilarity.student_id.is_(None),
+        StudentSimilarity.updated_at < Student.created_at
+    )).all()
+    if not unindexed:
+        return
+
+    total = Student.query.count()
+    if len(unindexed) * 2 > total:
+        rebuild_index(Student.query.order_by(Student.id).all(), archetype_fn, top_k)
+    else:
+        index_students(unindexed, archetype_fn, top_k)
+
+
+def get_index_entries(student_ids):
+    """Archetype and precomputed neighbors ([[student_id, score], ...]) of the given students"""
+    from models import StudentSimilarity
+
+    if not student_ids:
+        return {}
+    rows = StudentSimilarity.query.filter(StudentSimilarity.student_id.in_(list(student_ids))).all()
+    return {
+        row.student_id: {'archetype': row.archetype, 'neighbors': json.loads(row.neighbors)}
+        for row in rows
+    }
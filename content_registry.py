@@ -0,0 +1,153 @@
+"""
+In-process registry for the static content files (questions.json, site_content.json).
+
+Each file is parsed once into per-language views that the student-facing routes read
+directly. The file's mtime is checked at most once per check interval and the views are
+rebuilt only when it changed, so edits still show up without a restart. A file that fails
+to parse keeps serving its last good version.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+QUESTIONS_PATH = 'questions.json'
+SITE_CONTENT_PATH = 'site_content.json'
+DEFAULT_LANGUAGE = 'en'
+
+# Success page text used when site_content.json has none
+DEFAULT_SUCCESS_TEXT = {
+    'thank_you': 'ありがとうございました！',
+    'id_reminder': 'このIDを保存してください。',
+    'scroll_prompt': 'スクロールしてみてください！'
+}
+
+
+class ContentFile:
+    """A JSON file and the views built from it, reloaded when its mtime changes"""
+
+    def __init__(self, path, build_views, check_interval=1.0):
+        self.path = path
+        self.build_views = build_views
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._views = build_views(None)
+
+    def views(self):
+        now = time.time()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._reload_if_changed()
+                    self._checked_at = now
+        return self._views
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            if self._mtime is not None or self._checked_at == 0.0:
+                # Logged once when the file goes missing; the last good version keeps being served
+                logging.error(f"Content file {self.path} not available: {e}")
+                self._mtime = None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._views = self.build_views(data)
+            logging.info(f"Loaded content file {self.path}")
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading {self.path}, keeping the previous version: {e}")
+        self._mtime = mtime
+
+
+def _questionnaire_views(data):
+    questions = (data or {}).get('questions', {})
+    default_questions = questions.get(DEFAULT_LANGUAGE, [])
+    return {
+        'data': data,
+        'questions': questions,
+        'default_questions': default_questions,
+        'form_labels': (data or {}).get('form_labels', {}),
+        'question_titles': {
+            language: [question.get('title', '') for question in language_questions]
+            for language, language_questions in questions.items()
+        },
+    }
+
+
+def _site_content_views(data):
+    success_page = (data or {}).get('success_page', {})
+    languages = {
+        language
+        for value in success_page.values() if isinstance(value, dict)
+        for language in value
+    } | {DEFAULT_LANGUAGE}
+
+    # Text of every success page entry per language, falling back to English
+    success_text = {}
+    for language in languages:
+        text = {}
+        for key, value in success_page.items():
+            if isinstance(value, dict) and (language in value or DEFAULT_LANGUAGE in value):
+                text[key] = value.get(language, value.get(DEFAULT_LANGUAGE))
+        success_text[language] = text or dict(DEFAULT_SUCCESS_TEXT)
+
+    return {
+        'data': data or {},
+        'success_text': success_text,
+        'app_explanation': success_page.get('app_explanation', {}),
+    }
+
+
+questionnaire_file = ContentFile(QUESTIONS_PATH, _questionnaire_views)
+site_content_file = ContentFile(SITE_CONTENT_PATH, _site_content_views)
+
+
+def get_questionnaire():
+    """The whole parsed questions.json, or None if it could not be loaded"""
+    return questionnaire_file.views()['data']
+
+
+def get_questions(language):
+    """Questions in a language, falling back to English"""
+    views = questionnaire_file.views()
+    return views['questions'].get(language, views['default_questions'])
+
+
+def get_form_labels():
+    return questionnaire_file.views()['form_labels']
+
+
+def get_question_titles(language=DEFAULT_LANGUAGE):
+    """Question titles in a language (empty if there are none)"""
+    return questionnaire_file.views()['question_titles'].get(language, [])
+
+
+def get_site_content():
+    """The whole parsed site_content.json ({} if it could not be loaded)"""
+    return site_content_file.views()['data']
+
+
+def get_app_explanation():
+    """The success page app explanation in every language"""
+    return site_content_file.views()['app_explanation']
+
+
+def get_success_text(language, student_name=None):
+    """Success page text in a language with the student's name filled in (or the placeholder removed)"""
+    views = site_content_file.views()
+    text = dict(views['success_text'].get(language, views['success_text'][DEFAULT_LANGUAGE]))
+    for key, value in text.items():
+        if isinstance(value, str) and '{name}' in value:
+            if student_name:
+                text[key] = value.replace('{name}', student_name)
+            else:
+                text[key] = value.replace(', {name}', '').replace('{name}', '')
+    return text
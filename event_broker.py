@@ -0,0 +1,158 @@
+"""
+Server-Sent Events broker for the teacher dashboard.
+
+The change_events table is the cross-worker backend: whichever gunicorn thread, worker or
+instance stores a student, translation, analysis or squad, the row lands there. One poller
+thread per process reads new rows (once per poll interval, and right after local commits)
+and fans them out to the in-process stream queues, so the database cost does not grow
+with the number of connected dashboards.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+
+# SSE event name for each (kind, action) in the change feed
+EVENT_NAMES = {
+    ('student', 'create'): 'student_submitted',
+    ('student', 'translated'): 'translation_complete',
+    ('student', 'analyzed'): 'analysis_complete',
+    ('squad', 'create'): 'squads_created',
+}
+
+
+def format_sse(event_name, data, event_id=None):
+    """Encode one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_name}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def events_from_changes(changes):
+    """
+    Turn change_events rows into (event_name, data, cursor) tuples.
+    Squads created in one batch are announced once; every other change becomes a generic 'changed'.
+    """
+    events = []
+    created_squads = []
+    for change in changes:
+        if change.kind == 'reset':
+            events.append(('reset', {'cursor': change.id}, change.id))
+            created_squads = []
+            continue
+        event_name = EVENT_NAMES.get((change.kind, change.action), 'changed')
+        if event_name == 'squads_created':
+            created_squads.append(change.entity_id)
+            continue
+        data = {'cursor': change.id, 'kind': change.kind, 'id': change.entity_id, 'action': change.action}
+        events.append((event_name, data, change.id))
+    if created_squads:
+        cursor = changes[-1].id
+        events.append(('squads_created', {'cursor': cursor, 'squad_ids': created_squads}, cursor))
+    return events
+
+
+class EventBroker:
+    """
+    Fans change feed events out to the open /teacher/events streams of this process.
+    At most max_streams streams are open at once (each holds a gunicorn thread);
+    further dashboards are told to keep polling the delta-sync API.
+    """
+
+    def __init__(self, app, poll_interval=1.0, max_streams=4):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self._streams = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._poller = None
+        self._cursor = None
+
+    def watch_commits(self, session):
+        """Poll right after local commits instead of waiting for the next interval"""
+        event.listen(session, 'after_commit', lambda committed_session: self._wakeup.set())
+
+    def subscribe(self):
+        """Open a stream queue, or None when this process already serves max_streams streams"""
+        with self._lock:
+            if len(self._streams) >= self.max_streams:
+                return None
+            stream = queue.Queue()
+            self._streams.add(stream)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._run, name='event-broker-poller', daemon=True)
+                self._poller.start()
+        self._wakeup.set()
+        return stream
+
+    def unsubscribe(self, stream):
+        with self._lock:
+            self._streams.discard(stream)
+
+    def publish(self, event_name, data, event_id=None):
+        """Send an event to every open stream of this process"""
+        message = format_sse(event_name, data, event_id)
+        with self._lock:
+            streams = list(self._streams)
+        for stream in streams:
+            stream.put(message)
+
+    def _poll(self):
+        from models import ChangeEvent
+        from change_feed import current_cursor
+
+        if self._cursor is None:
+            self._cursor = current_cursor()
+            return
+        changes = ChangeEvent.query.filter(ChangeEvent.id > self._cursor).order_by(ChangeEvent.id).limit(500).all()
+        if not changes:
+            return
+        self._cursor = changes[-1].id
+        for event_name, data, cursor in events_from_changes(changes):
+            self.publish(event_name, data, cursor)
+
+    def _run(self):
+        """Poller loop - idles without touching the database while no stream is open"""
+        from models import db
+
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                has_streams = bool(self._streams)
+            if not has_streams:
+                self._cursor = None  # Re-read the cursor when the next stream opens
+                continue
+            with self.app.app_context():
+                try:
+                    self._poll()
+                except Exception as e:
+                    logging.error(f"Event broker poll failed: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def stream(self, stream, max_seconds=300, keepalive_seconds=15, retry_ms=3000):
+        """
+        Generator of SSE messages for one subscriber. Ends after max_seconds so the thread is
+        handed back; the browser's EventSource reconnects by itself after retry_ms.
+        """
+        deadline = time.time() + max_seconds
+        try:
+            yield f'retry: {retry_ms}\n\n'
+            yield format_sse('ready', {})
+            while time.time() < deadline:
+                try:
+                    yield stream.get(timeout=min(keepalive_seconds, max(0.1, deadline - time.time())))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(stream)
@@ -0,0 +1,359 @@
+"""
+Durable background job queue backed by the jobs table.
+
+Work such as translating a submission is stored as a job row in the same transaction as the
+data it belongs to, so it is not lost when the instance is scaled to zero or restarted. A fixed
+pool of worker threads per process claims pending jobs - SELECT ... FOR UPDATE SKIP LOCKED where
+the database supports it, and always a conditional UPDATE so two workers (or instances) never
+run the same job. Failed jobs are retried with exponential backoff, and jobs left 'running' by
+a process that died are handed out again once their lease expires.
+
+Each kind has a priority and an optional cap on its running jobs, so a long translation backlog
+cannot occupy every worker while the teacher waits for squads. Waiting raises a job's priority
+by one every aging_seconds, so low-priority work still gets its turn under steady load.
+
+Handlers are called as handler(payloads, last_attempt) inside an application context and must
+be idempotent: a job may run again if its process dies before the job is marked done.
+Long-running kinds registered with tracked=True run one job at a time as handler(payload, job),
+where job is a JobHandle used to report progress and to notice that the job was cancelled.
+"""
+
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select, update
+
+from models import db, Job
+
+# Longest delay between two attempts of a job, in seconds
+MAX_BACKOFF_SECONDS = 300
+
+
+# Statuses of jobs that have not finished yet
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+def utcnow():
+    return datetime.utcnow()
+
+
+class JobCancelled(Exception):
+    """Raised by a tracked job's handler to stop once the job was cancelled"""
+
+
+class JobHandle:
+    """
+    Progress reporting and cancellation checks for one running tracked job.
+    Both go through their own short database transactions so they never commit
+    (or wait on) the handler's own work, and are throttled to one per min_interval seconds.
+    """
+
+    def __init__(self, job_id, payload, min_interval=1.0):
+        self.id = job_id
+        self.payload = payload
+        self.min_interval = min_interval
+        self.progress = {}
+        self._stage_started = time.time()
+        self._reported_at = 0.0
+        self._checked_at = 0.0
+        self._cancelled = False
+
+    def report(self, stage=None, done=None, total=None, force=False, **details):
+        """Record progress; done/total also give an ETA extrapolated from the current stage's rate"""
+        if stage and stage != self.progress.get('stage'):
+            self.progress = {key: value for key, value in self.progress.items() if key not in ('done', 'total', 'eta_seconds')}
+            self.progress['stage'] = stage
+            self._stage_started = time.time()
+        self.progress.update(details)
+        if total is not None:
+            self.progress['done'] = done or 0
+            self.progress['total'] = total
+            elapsed = time.time() - self._stage_started
+            remaining = total - (done or 0)
+            self.progress['eta_seconds'] = round(elapsed / done * remaining, 1) if done else None
+
+        now = time.time()
+        if force or now - self._reported_at >= self.min_interval:
+            self._reported_at = now
+            self._write_progress()
+
+    def _write_progress(self):
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(Job.__table__)
+                    .where(Job.__table__.c.id == self.id)
+                    # Reporting also renews the lease, so a long job is not mistaken for a stale one
+                    .values(progress=json.dumps(self.progress, ensure_ascii=False), locked_at=utcnow())
+                )
+        except Exception as e:
+            logging.warning(f"Could not store progress of job {self.id}: {str(e)}")
+
+    def cancelled(self):
+        """True once the job was cancelled (checked against the database at most once per min_interval)"""
+        now = time.time()
+        if not self._cancelled and now - self._checked_at >= self.min_interval:
+            self._checked_at = now
+            try:
+                with db.engine.connect() as connection:
+                    status = connection.execute(
+                        select(Job.__table__.c.status).where(Job.__table__.c.id == self.id)
+                    ).scalar()
+                self._cancelled = status == 'cancelled'
+            except Exception as e:
+                logging.warning(f"Could not check whether job {self.id} was cancelled: {str(e)}")
+        return self._cancelled
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled"""
+        if self.cancelled():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+
+def job_status(job):
+    """JSON-ready view of a job for status polling"""
+    progress = {}
+    if job.progress:
+        try:
+            progress = json.loads(job.progress)
+        except (json.JSONDecodeError, TypeError):
+            progress = {}
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'progress': progress,
+        'error': job.last_error if job.status == 'failed' else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished': job.status not in ACTIVE_STATUSES,
+    }
+
+
+class JobQueue:
+    """Registry of job handlers plus the worker pool that runs them"""
+
+    def __init__(self, app, num_workers=2, poll_interval=2.0, lease_seconds=600, max_attempts=5, aging_seconds=6.0):
+        self.app = app
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.aging_seconds = aging_seconds
+        self._handlers = {}
+        self._workers = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._recovered_at = None
+        self._name = f'{socket.gethostname()}:{os.getpid()}'
+
+    def register(self, kind, handler, batch_size=1, backoff_seconds=5, tracked=False, priority=0, max_running=None):
+        """
+        Register the handler of a job kind. Up to batch_size pending jobs of the kind are
+        claimed together and handed to one handler call (e.g. one AI request for several students).
+        Tracked kinds run one job per call and get a JobHandle for progress and cancellation.
+        priority is the default priority of the kind's jobs (higher runs first), and at most
+        max_running workers run them at once (None for no limit; checked when
+        claiming, so workers claiming at the same moment may briefly exceed it).
+        """
+        self._handlers[kind] = {
+            'handler': handler,
+            'batch_size': 1 if tracked else max(1, batch_size),
+            'backoff_seconds': backoff_seconds,
+            'tracked': tracked,
+            'priority': priority,
+            'max_running': max_running
+        }
+
+    def watch_commits(self, session):
+        """Claim right after local commits (which may have enqueued jobs) instead of waiting for the next poll"""
+        event.listen(session, 'after_commit', lambda committed_session: self._wakeup.set())
+
+    def enqueue(self, kind, payload, priority=None, max_attempts=None):
+        """Add a job to the session - it becomes visible to the workers when the caller commits"""
+        if priority is None:
+            priority = self._handlers.get(kind, {}).get('priority', 0)
+        job = Job(
+            kind=kind,
+            payload=json.dumps(payload, ensure_ascii=False),
+            status='pending',
+            priority=priority,
+            attempts=0,
+            max_attempts=max_attempts or self.max_attempts,
+            run_after=utcnow()
+        )
+        db.session.add(job)
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a job that has not finished; a running tracked job stops at its next check"""
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status.in_(ACTIVE_STATUSES))
+            .values(status='cancelled')
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def active_job(self, kinds):
+        """Most recent pending or running job of the given kinds, or None"""
+        return Job.query.filter(Job.kind.in_(list(kinds)), Job.status.in_(ACTIVE_STATUSES)).order_by(Job.id.desc()).first()
+
+    def start(self):
+        """Start the worker threads once per process; pending and stale jobs are picked up right away"""
+        with self._lock:
+            if self._workers or self.num_workers <= 0:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._run, args=(f'{self._name}:{i}',), name=f'job-worker-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        logging.info(f"Started {self.num_workers} job workers")
+
+    def recover_stale_jobs(self):
+        """Hand out again the jobs whose worker stopped renewing them (process killed, instance scaled down)"""
+        stale_before = utcnow() - timedelta(seconds=self.lease_seconds)
+        result = db.session.execute(
+            update(Job)
+            .where(Job.status == 'running', Job.locked_at < stale_before)
+            .values(status='pending', locked_by=None, locked_at=None, run_after=utcnow())
+        )
+        db.session.commit()
+        if result.rowcount:
+            logging.warning(f"Resumed {result.rowcount} jobs left running by a stopped worker")
+        self._recovered_at = utcnow()
+
+    def _claim(self, worker_name):
+        """
+        Claim up to one batch of same-kind pending jobs. Kinds at their max_running cap are skipped;
+        of the others, the kind whose next job has the highest aged priority is served.
+        """
+        if self._recovered_at is None or utcnow() - self._recovered_at > timedelta(seconds=self.lease_seconds / 2):
+            self.recover_stale_jobs()
+
+        now = utcnow()
+        # Workers busy with each kind - a batch counts once
+        running = dict(
+            db.session.query(Job.kind, func.count(func.distinct(Job.locked_by)))
+            .filter(Job.status == 'running')
+            .group_by(Job.kind)
+            .all()
+        )
+        best = None
+        for kind, options in list(self._handlers.items()):
+            if options['max_running'] is not None and running.get(kind, 0) >= options['max_running']:
+                continue
+            candidates = db.session.execute(
+                select(Job.id, Job.priority, Job.run_after, Job.attempts)
+                .where(Job.kind == kind, Job.status == 'pending', Job.run_after <= now)
+                .order_by(Job.priority.desc(), Job.id)
+                .limit(options['batch_size'])
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not candidates:
+                continue
+            # Starvation protection: every aging_seconds of waiting counts as one priority point
+            score = candidates[0].priority + (now - candidates[0].run_after).total_seconds() / self.aging_seconds
+            if best is None or score > best[0]:
+                best = (score, kind, candidates)
+        if best is None:
+            db.session.rollback()
+            return []
+
+        score, kind, candidates = best
+        if candidates[0].attempts:
+            # A retried job runs alone, so one bad job cannot keep failing the jobs batched with it
+            job_ids = [candidates[0].id]
+        else:
+            job_ids = [job_id for job_id, priority, run_after, attempts in candidates if not attempts]
+        claimed_ids = []
+        for job_id in job_ids:
+            # Only one worker can move a job out of 'pending'
+            result = db.session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == 'pending')
+                .values(status='running', locked_by=worker_name, locked_at=now, attempts=Job.attempts + 1)
+            )
+            if result.rowcount == 1:
+                claimed_ids.append(job_id)
+        db.session.commit()
+        if not claimed_ids:
+            return []
+        return Job.query.filter(Job.id.in_(claimed_ids)).order_by(Job.id).all()
+
+    def _execute(self, jobs):
+        kind = jobs[0].kind
+        options = self._handlers[kind]
+        job_ids = [job.id for job in jobs]
+        payloads = [json.loads(job.payload) for job in jobs]
+        last_attempt = all(job.attempts >= job.max_attempts for job in jobs)
+        attempts = {job.id: (job.attempts, job.max_attempts) for job in jobs}
+        done_values = {}
+
+        try:
+            if options['tracked']:
+                handle = JobHandle(job_ids[0], payloads[0])
+                try:
+                    options['handler'](payloads[0], handle)
+                finally:
+                    done_values['progress'] = json.dumps(handle.progress, ensure_ascii=False)
+            else:
+                options['handler'](payloads, last_attempt)
+        except JobCancelled:
+            db.session.rollback()
+            logging.info(f"Job {kind} {job_ids} stopped after being cancelled")
+            return
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Job {kind} {job_ids} failed: {str(e)}")
+            self._retry_or_fail(attempts, options['backoff_seconds'], str(e))
+            return
+
+        db.session.execute(
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.status == 'running')
+            .values(status='done', locked_by=None, locked_at=None, last_error=None, **done_values)
+        )
+        db.session.commit()
+        logging.info(f"Job {kind} {job_ids} done")
+
+    def _retry_or_fail(self, attempts, backoff_seconds, error):
+        now = utcnow()
+        for job_id, (attempt, max_attempts) in attempts.items():
+            if attempt >= max_attempts:
+                values = {'status': 'failed'}
+                logging.error(f"Job {job_id} failed permanently after {attempt} attempts")
+            else:
+                # Exponential backoff with jitter so a burst of failures does not retry in lockstep
+                delay = min(MAX_BACKOFF_SECONDS, backoff_seconds * 2 ** (attempt - 1))
+                values = {'status': 'pending', 'run_after': now + timedelta(seconds=delay * random.uniform(0.8, 1.2))}
+            db.session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == 'running')
+                .values(locked_by=None, locked_at=None, last_error=error[:1000], **values)
+            )
+        db.session.commit()
+
+    def _run(self, worker_name):
+        """Worker loop - runs batches back to back while there is work, otherwise sleeps until a commit or the poll interval"""
+        while True:
+            jobs = []
+            with self.app.app_context():
+                try:
+                    jobs = self._claim(worker_name)
+                    if jobs:
+                        self._execute(jobs)
+                except Exception as e:
+                    logging.error(f"Job worker {worker_name} error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            if not jobs:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
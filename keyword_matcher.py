@@ -0,0 +1,87 @@
+"""
+Compiled multi-keyword matcher shared by the keyword-based classifiers.
+
+Answers keyword-in-text questions with the same substring semantics as `keyword in text`,
+but for a whole keyword set at once: an Aho-Corasick automaton is built once and run over
+each distinct whitespace-separated token. A keyword without whitespace can only occur inside
+a single token, so token results are memoized across texts - students reuse the same words,
+and a text is mostly dictionary lookups. The few keywords containing spaces are checked directly.
+"""
+
+from collections import deque
+from functools import lru_cache
+
+
+class KeywordMatcher:
+    """Finds which of a fixed set of keywords occur as substrings of a text"""
+
+    def __init__(self, keywords, cache_size=4096):
+        self.keywords = list(dict.fromkeys(keywords))
+        self._spaced_keywords = [keyword for keyword in self.keywords if any(char.isspace() for char in keyword)]
+        self._build_automaton([keyword for keyword in self.keywords if keyword not in self._spaced_keywords])
+        self._token_keywords = lru_cache(maxsize=cache_size * 4)(self._scan)
+        self.find = lru_cache(maxsize=cache_size)(self._find)
+
+    def _build_automaton(self, keywords):
+        self._goto = [{}]
+        self._outputs = [frozenset()]
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._outputs.append(frozenset())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._outputs[state] = self._outputs[state] | {keyword}
+
+        # Breadth-first failure links; each state also reports every keyword its failure chain ends in
+        self._fail = [0] * len(self._goto)
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._outputs[next_state] = self._outputs[next_state] | self._outputs[self._fail[next_state]]
+
+    def _scan(self, token):
+        """Keywords (without whitespace) occurring in one token"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+        found = set()
+        for char in token:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return frozenset(found)
+
+    def _find(self, text):
+        found = set()
+        for token in set(text.split()):
+            found |= self._token_keywords(token)
+        found.update(keyword for keyword in self._spaced_keywords if keyword in text)
+        return frozenset(found)
+
+    def first(self, text, keywords):
+        """The first of the given keywords (in their order) that occurs in the text, or None"""
+        found = self.find(text)
+        return next((keyword for keyword in keywords if keyword in found), None)
+
+    def count_by_category(self, text, categories):
+        """
+        Number of distinct keywords of each category that occur in the text.
+        categories maps name -> keyword list; only categories with matches are returned, in order.
+        """
+        found = self.find(text)
+        counts = {}
+        for name, keywords in categories.items():
+            matches = sum(1 for keyword in keywords if keyword in found)
+            if matches:
+                counts[name] = matches
+        return counts
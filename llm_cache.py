@@ -0,0 +1,190 @@
+"""
+Content-addressed LLM response cache stored in the application's SQL database,
+so every gunicorn worker and Cloud Run instance shares the same responses
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, LLMCacheEntry
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+EVICTION_INTERVAL = 50  # Run eviction after this many stores per process
+
+# Per-process hit/miss counters
+cache_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'evictions': 0,
+}
+cache_stats_lock = threading.Lock()
+
+
+def _count(counter, amount=1):
+    """Increment a per-process cache counter"""
+    with cache_stats_lock:
+        cache_stats[counter] += amount
+
+
+def _config(key, default):
+    """Read a cache setting from the app config, falling back to the default"""
+    return current_app.config.get(key, default)
+
+
+def is_cache_enabled():
+    """The cache needs an application context to reach the database"""
+    return has_app_context() and _config('LLM_CACHE_ENABLED', True)
+
+
+def make_cache_key(model, messages, temperature=None, response_format=None, max_tokens=None):
+    """Hash everything that determines an LLM response into a stable cache key"""
+    request_identity = {
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'response_format': response_format,
+        'max_tokens': max_tokens,
+    }
+    serialized = json.dumps(request_identity, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def get_cached_response(cache_key):
+    """Return the cached response text for a key, or None on a miss or expired entry"""
+    table = LLMCacheEntry.__table__
+    now = datetime.utcnow()
+    oldest_allowed = now - timedelta(seconds=_config('LLM_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+
+    with db.engine.begin() as conn:
+        row = conn.execute(
+            select(table.c.id, table.c.response, table.c.created_at).where(table.c.cache_key == cache_key)
+        ).first()
+        if row is None or row.created_at < oldest_allowed:
+            _count('misses')
+            return None
+        conn.execute(
+            update(table)
+            .where(table.c.id == row.id)
+            .values(hit_count=table.c.hit_count + 1, last_used_at=now)
+        )
+
+    _count('hits')
+    return row.response
+
+
+def store_response(cache_key, model, response):
+    """Store a response; a concurrent insert of the same key by another worker is ignored"""
+    table = LLMCacheEntry.__table__
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(
+                delete(table).where(table.c.cache_key == cache_key)
+            )
+            conn.execute(
+                table.insert().values(
+                    cache_key=cache_key,
+                    model=model,
+                    response=response,
+                    hit_count=0,
+                    created_at=now,
+                    last_used_at=now,
+                )
+            )
+    except IntegrityError:
+        logging.info(f"LLM cache entry {cache_key[:12]} was stored by another worker")
+        return
+
+    _count('stores')
+    if cache_stats['stores'] % EVICTION_INTERVAL == 0:
+        evict_entries()
+
+
+def evict_entries():
+    """Delete expired entries, then the least recently used ones beyond the size limit"""
+    table = LLMCacheEntry.__table__
+    oldest_allowed = datetime.utcnow() - timedelta(seconds=_config('LLM_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+    max_entries = _config('LLM_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+    with db.engine.begin() as conn:
+        evicted = conn.execute(delete(table).where(table.c.created_at < oldest_allowed)).rowcount or 0
+
+        excess = conn.execute(select(func.count()).select_from(table)).scalar() - max_entries
+        if excess > 0:
+            lru_ids = select(table.c.id).order_by(table.c.last_used_at.asc()).limit(excess).scalar_subquery()
+            evicted += conn.execute(delete(table).where(table.c.id.in_(lru_ids))).rowcount or 0
+
+    if evicted:
+        _count('evictions', evicted)
+        logging.info(f"LLM cache evicted {evicted} entries")
+    return evicted
+
+
+def cached_completion(request, create_completion):
+    """
+    Return the response text for a chat completion request, calling the API only on a cache miss.
+    request holds the chat.completions.create keyword arguments; create_completion performs the call
+    and returns the response text. JSON-mode responses are only cached if they parse.
+    """
+    if not is_cache_enabled():
+        return create_completion()
+
+    cache_key = make_cache_key(
+        request.get('model'),
+        request.get('messages'),
+        request.get('temperature'),
+        request.get('response_format'),
+        request.get('max_tokens'),
+    )
+
+    try:
+        cached = get_cached_response(cache_key)
+    except Exception as e:
+        logging.warning(f"LLM cache lookup failed, calling the API directly: {str(e)}")
+        return create_completion()
+
+    if cached is not None:
+        logging.info(f"LLM cache hit for {cache_key[:12]}")
+        return cached
+
+    content = create_completion()
+    if not content:
+        return content
+
+    if (request.get('response_format') or {}).get('type') == 'json_object':
+        try:
+            json.loads(content)
+        except (json.JSONDecodeError, TypeError):
+            return content
+
+    try:
+        store_response(cache_key, request.get('model'), content)
+    except Exception as e:
+        logging.warning(f"LLM cache store failed: {str(e)}")
+    return content
+
+
+def get_cache_stats():
+    """Return per-process hit/miss counters together with the shared table totals"""
+    table = LLMCacheEntry.__table__
+    with cache_stats_lock:
+        stats = dict(cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            select(func.count(), func.coalesce(func.sum(table.c.hit_count), 0)).select_from(table)
+        ).first()
+    stats['entries'] = row[0]
+    stats['total_hits'] = int(row[1])
+    return stats
@@ -1,9 +1,12 @@
 import os
-from app import app_instance
+from app import app_instance, job_queue
 
 # Firebase App Hosting expects the WSGI app to be named 'app'
 app = app_instance
 
+# Start the job workers - jobs left pending by a previous instance are resumed
+job_queue.start()
+
 if __name__ == '__main__':
     # Get port from environment or default to 8080 for Firebase App Hosting
     port = int(os.environ.get('PORT', 8080))
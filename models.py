@@ -150,3 +150,106 @@ class Squad(db.Model):
     
     def __repr__(self):
         return f'<Squad {self.name}>'
+
+class LLMCacheEntry(db.Model):
+    """Model for caching LLM responses shared by every worker and instance"""
+    __tablename__ = 'llm_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False, index=True)  # SHA-256 of the request
+    model = db.Column(db.String(50), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False)
+    last_used_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<LLMCacheEntry {self.cache_key[:12]}>'
+
+class StudentSimilarity(db.Model):
+    """Model for the persisted compatibility index - one row per student with their most compatible students"""
+    __tablename__ = 'student_similarity'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True)
+    features = db.Column(db.Text, nullable=False)  # JSON list of hashed vibe words
+    archetype = db.Column(db.String(100), nullable=True)  # Keyword-based vibe archetype
+    neighbors = db.Column(db.Text, nullable=False, default='[]')  # JSON [[student_id, score], ...], best first
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<StudentSimilarity {self.student_id}>'
+
+class StudentTags(db.Model):
+    """Model for keyword-derived tags, computed once when a submission is saved"""
+    __tablename__ = 'student_tags'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True)
+    interests = db.Column(db.Text, nullable=False, default='[]')  # JSON list of interest categories with colors
+    core_sparks = db.Column(db.Text, nullable=False, default='[]')  # JSON list of hashtag strings
+    vibe_archetype = db.Column(db.String(100), nullable=True)  # Keyword-based vibe archetype name
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<StudentTags {self.student_id}>'
+
+class ChangeEvent(db.Model):
+    """Model for the dashboard change feed - one row per student/squad change, the ID is the sync cursor"""
+    __tablename__ = 'change_events'
+    __table_args__ = {'sqlite_autoincrement': True}  # Never reuse IDs - clients hold them as cursors
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'student', 'squad' or 'reset'
+    entity_id = db.Column(db.Integer, nullable=True)  # Student or squad ID (None for 'reset')
+    action = db.Column(db.String(10), nullable=False, default='update')  # 'create', 'update', 'translated', 'analyzed', 'delete' or 'reset'
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.kind}:{self.entity_id} {self.action}>'
+
+class SquadSnapshot(db.Model):
+    """Model for materialized squad hub payloads, rebuilt when a squad or its members change"""
+    __tablename__ = 'squad_snapshots'
+    
+    squad_id = db.Column(db.Integer, db.ForeignKey('squads.id', ondelete='CASCADE'), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON: squad, members, parsed icebreaker, first speaker
+    etag = db.Column(db.String(64), nullable=False)  # Strong ETag of the payload
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<SquadSnapshot {self.squad_id}>'
+
+class Job(db.Model):
+    """Model for the durable background job queue - a job survives restarts until a worker finishes it"""
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_claim', 'status', 'priority', 'run_after'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Handler name, e.g. 'translation'
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON arguments for the handler
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # 'pending', 'running', 'done', 'failed' or 'cancelled'
+    priority = db.Column(db.Integer, nullable=False, default=0)  # Higher runs first
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False)  # Not claimed before this time (UTC) - used for retry backoff
+    locked_by = db.Column(db.String(100), nullable=True)  # Worker holding the job while it runs
+    locked_at = db.Column(db.DateTime, nullable=True)  # Claim time (UTC); running jobs past their lease are resumed
+    last_error = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Text, nullable=True)  # JSON progress reported by long-running jobs (stage, done, total, ETA, message)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+class StageState(db.Model):
+    """Model for the incremental analysis pipeline - the inputs each stage's stored output was computed from"""
+    __tablename__ = 'stage_states'
+    
+    subject = db.Column(db.String(50), primary_key=True)  # 'student:<id>', 'cohort' for clustering, or 'pipeline' for the tracking start marker
+    stage = db.Column(db.String(20), primary_key=True)  # 'translate', 'signature', 'tags' or 'clustering'
+    input_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the stage version and its inputs
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())  # Never changes - tracking start is the oldest
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    
+    def __repr__(self):
+        return f'<StageState {self.subject} {self.stage}>'
@@ -1,8 +1,7 @@
 import json
 import logging
-import os
 
-from openai import OpenAI
+from ai_gateway import chat_completion
 
 
 # IMPORTANT: KEEP THIS COMMENT
@@ -12,8 +11,11 @@ from openai import OpenAI
 # - Use the response_format: { type: "json_object" } option when requesting JSON responses
 # - Request output in JSON format in the prompt
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Prompt versions - bump one whenever its prompt changes, so the incremental analysis
+# pipeline (analysis_pipeline.py) knows which stored outputs are out of date
+SQUAD_GROUPING_PROMPT_VERSION = 1
+SIGNATURE_PROMPT_VERSION = 1
+TRANSLATION_PROMPT_VERSION = 1
 
 
 def group_students_into_squads(students_data):
@@ -52,13 +54,9 @@ Respond with a JSON object in this exact format:
 
 CRITICAL: Every student must be assigned to a squad. All text output must be in Japanese."""
 
-        # Create OpenAI client with timeout
-        timeout_client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=30.0
-        )
-        
-        response = timeout_client.chat.completions.create(
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'squad_grouping',
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a social dynamics expert specializing in creating meaningful connections between students."},
@@ -68,8 +66,8 @@ CRITICAL: Every student must be assigned to a squad. All text output must be in
             temperature=0.8,
         )
 
-        if response.choices[0].message.content:
-            return json.loads(response.choices[0].message.content)
+        if content:
+            return json.loads(content)
         else:
             raise ValueError("Empty response from AI")
 
@@ -78,6 +76,57 @@ CRITICAL: Every student must be assigned to a squad. All text output must be in
         raise
 
 
+def generate_squad_identity(members_data):
+    """
+    Use AI to name one already-formed squad of 3-5 members and summarize why they fit together
+    """
+    try:
+        members_text = ""
+        for member in members_data:
+            members_text += f"\n{member['name']}:\n"
+            members_text += f"- Archetype: {member.get('archetype') or '個性豊かな学生'}\n"
+            members_text += f"- Core Strength: {member.get('core_strength') or ''}\n"
+            members_text += f"- Hidden Potential: {member.get('hidden_potential') or ''}\n"
+            members_text += f"- Conversation Catalyst: {member.get('conversation_catalyst') or ''}\n"
+
+        prompt = f"""These students have already been placed in the same squad. Their personality signatures:
+{members_text}
+
+Your mission:
+1. Create a creative, engaging Japanese squad name that reflects their collective identity.
+2. Write a short, insightful Japanese summary of their "shared_interests" or why their combination of signatures makes them a powerful team.
+
+Respond with a JSON object in this exact format:
+{{
+    "squad_name": "感動的な日本語のチーム名",
+    "shared_interests": "このチームの相乗効果に関する洞察に満ちた日本語の要約"
+}}
+
+All text output must be in Japanese."""
+
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'squad_naming',
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a social dynamics expert specializing in creating meaningful connections between students."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.8,
+            max_tokens=200,
+        )
+
+        if content:
+            return json.loads(content)
+        else:
+            raise ValueError("Empty response from AI")
+
+    except Exception as e:
+        logging.error(f"Error in AI squad naming: {str(e)}")
+        raise
+
+
 def generate_squad_icebreaker(squad_members_data, squad_name):
     """
     Generate personalized icebreaker questions using Connection Blueprint analysis
@@ -127,13 +176,9 @@ Final Instructions:
 - The flow from Act 1 to Act 3 should feel natural and increase in depth.
 - All output text must be in friendly, engaging Japanese."""
 
-        # Create OpenAI client with timeout
-        timeout_client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=30.0
-        )
-        
-        response = timeout_client.chat.completions.create(
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'icebreaker',
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are an expert social facilitator who finds deep, meaningful connections between people to create truly engaging conversation starters."},
@@ -144,8 +189,8 @@ Final Instructions:
             max_tokens=400,
         )
 
-        if response.choices[0].message.content:
-            icebreaker_data = json.loads(response.choices[0].message.content)
+        if content:
+            icebreaker_data = json.loads(content)
             logging.info(f"Generated Connection Blueprint icebreakers for {squad_name}: {icebreaker_data}")
             # Return the JSON string to store in database
             return json.dumps(icebreaker_data, ensure_ascii=False)
@@ -174,13 +219,9 @@ def translate_to_japanese(text):
             
         prompt = f"Please translate the following text to Japanese: {text}"
         
-        # Create OpenAI client with timeout
-        timeout_client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=8.0  # Reduced timeout for translations
-        )
-        
-        response = timeout_client.chat.completions.create(
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'translation',
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a professional translator. Translate the given text to natural, conversational Japanese that would be appropriate for students."},
@@ -190,8 +231,8 @@ def translate_to_japanese(text):
             max_tokens=200,
         )
         
-        if response.choices[0].message.content:
-            return response.choices[0].message.content.strip()
+        if content:
+            return content.strip()
         else:
             logging.warning("Empty response from AI translation")
             return ""
@@ -201,6 +242,282 @@ def translate_to_japanese(text):
         return ""  # Return empty string if translation fails
 
 
+# Fallback values used when a personality signature field cannot be generated
+SIGNATURE_FALLBACKS = {
+    'archetype': "個性豊かな学生",
+    'core_strength': "創造的な思考力と独自の視点を持っています。",
+    'hidden_potential': "リーダーシップの才能が眠っている可能性があります。",
+    'conversation_catalyst': "趣味や興味のあることについて話すと、とても輝いて見えます。",
+}
+
+# Upper bounds on field length so a runaway answer cannot overflow the Student columns
+SIGNATURE_MAX_LENGTHS = {
+    'archetype': 100,
+    'core_strength': 600,
+    'hidden_potential': 600,
+    'conversation_catalyst': 300,
+}
+
+
+# The four signature analysts, shared by the signature-only and the fused pipeline prompts
+SIGNATURE_MISSION = """1. archetype - "The Storyteller": Through the lens of Narrative Identity, name the student's core Archetype as a creative, inspiring Japanese title.
+   Example Titles: 「静かな森の探検家」, 「アイデアの稲妻を放つ者」, 「心の庭を育てる人」
+2. core_strength - "The Strength Finder": Analyze their answers for Agency and Communion, and write a short, powerful Japanese paragraph describing their "Core Compass"—their greatest strength as a friend and collaborator.
+3. hidden_potential - "The Horizon Scanner": Look for what is NOT said—gaps, curiosities or hesitations—and describe their "Uncharted Territory" in Japanese, framed positively as an exciting next adventure.
+4. conversation_catalyst - "The Bridge Builder": Pick the single most unique detail and write one Japanese sentence that acts as "Your First Step"—a conversation starter others can ask them.
+   Example: 「彼らの『秘密のスーパーパワー』が実際に役立った時の話を聞いてみてください。」"""
+
+
+def _validate_signature_field(field_name, value):
+    """
+    Return a cleaned signature field, or None if the AI output is unusable
+    """
+    if not isinstance(value, str):
+        return None
+    cleaned = value.strip()
+    if not cleaned or len(cleaned) > SIGNATURE_MAX_LENGTHS[field_name]:
+        return None
+    return cleaned
+
+
+def generate_personality_signature(student_answers):
+    """
+    Generate the full personality signature (archetype, core strength, hidden potential
+    and conversation catalyst) from a single JSON-mode request.
+    Each field is validated on its own and falls back independently.
+    """
+    signature = dict(SIGNATURE_FALLBACKS)
+    try:
+        # Prepare the student answers text
+        answers_text = ""
+        for i in range(1, 7):
+            question_key = f'question{i}'
+            if question_key in student_answers:
+                answers_text += f"Question {i}: {student_answers[question_key]}\n"
+
+        prompt = f"""Your Persona: You are a team of four insightful analysts reading the same student's answers.
+Student's Answers:
+{answers_text}
+
+Your Mission:
+{SIGNATURE_MISSION}
+
+Respond with a JSON object in this exact format:
+{{
+    "archetype": "日本語のアーキタイプ名",
+    "core_strength": "日本語の短い段落",
+    "hidden_potential": "日本語の短い段落",
+    "conversation_catalyst": "日本語の一文"
+}}
+
+All text output must be in Japanese."""
+
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'signature',
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a personality analyst. Write concise, warm Japanese descriptions of students."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.7,
+            max_tokens=400
+        )
+
+        if not content:
+            raise ValueError("Empty response from AI")
+
+        result = json.loads(content)
+        if not isinstance(result, dict):
+            raise ValueError("AI response is not a JSON object")
+
+        for field_name in SIGNATURE_FALLBACKS:
+            cleaned = _validate_signature_field(field_name, result.get(field_name))
+            if cleaned:
+                signature[field_name] = cleaned
+            else:
+                logging.warning(f"Invalid {field_name} in personality signature, using fallback")
+
+        logging.info(f"Generated personality signature: {signature['archetype']}")
+        return signature
+
+    except Exception as e:
+        logging.error(f"Error generating personality signature: {str(e)}")
+        return signature
+
+
+QUESTION_KEYS = [f'question{i}' for i in range(1, 7)]
+
+
+def translate_students_to_japanese(students_answers):
+    """
+    Translate the answers of one or more students to Japanese in a single JSON-mode request.
+    students_answers maps a student key (e.g. the student ID) to {question_key: text}.
+    Returns the same shape with Japanese text. Answers the AI did not return are left out,
+    so callers can apply their own fallback; empty answers translate to an empty string.
+    """
+    translations = {str(key): {} for key in students_answers}
+    payload = {}
+    for key, answers in students_answers.items():
+        for question_key in QUESTION_KEYS:
+            text = answers.get(question_key)
+            if text and text.strip():
+                payload.setdefault(str(key), {})[question_key] = text
+            else:
+                translations[str(key)][question_key] = ""
+
+    if not payload:
+        return translations
+
+    try:
+        answer_count = sum(len(answers) for answers in payload.values())
+        prompt = f"""Please translate every answer in the following JSON object to Japanese.
+Keep exactly the same student keys and question keys, and replace each value with its translation.
+
+{json.dumps({"students": payload}, ensure_ascii=False, indent=2)}
+
+Respond with a JSON object in this exact format:
+{{
+    "students": {{
+        "<student key>": {{"question1": "日本語訳", "...": "..."}}
+    }}
+}}"""
+
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'batch_translation',
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a professional translator. Translate the given text to natural, conversational Japanese that would be appropriate for students."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            max_tokens=min(200 * answer_count, 8000),
+        )
+
+        if not content:
+            logging.warning("Empty response from AI batch translation")
+            return translations
+
+        result = json.loads(content).get("students", {})
+        for key, answers in payload.items():
+            translated_answers = result.get(key)
+            if not isinstance(translated_answers, dict):
+                logging.warning(f"Batch translation is missing student {key}")
+                continue
+            for question_key in answers:
+                translated = translated_answers.get(question_key)
+                if isinstance(translated, str) and translated.strip():
+                    translations[key][question_key] = translated.strip()
+                else:
+                    logging.warning(f"Batch translation is missing {question_key} for student {key}")
+
+        return translations
+
+    except Exception as e:
+        logging.error(f"Error in batch translation to Japanese: {str(e)}")
+        return translations
+
+
+def analyze_and_translate_student(student_answers, translate=True):
+    """
+    Fused per-student pipeline: translate the six answers to Japanese and generate the
+    personality signature in one JSON-mode request (translate=False for students who
+    answered in Japanese). Returns {'translations': {question_key: text}, 'signature': {field: text}}
+    with only the parts the AI returned in usable form, so callers can apply their own fallbacks.
+    """
+    result = {'translations': {}, 'signature': {}}
+    to_translate = {}
+    for question_key in QUESTION_KEYS:
+        text = student_answers.get(question_key)
+        if translate and text and text.strip():
+            to_translate[question_key] = text
+        elif translate:
+            result['translations'][question_key] = ""
+
+    try:
+        answers_text = ""
+        for i, question_key in enumerate(QUESTION_KEYS, 1):
+            if question_key in student_answers:
+                answers_text += f"Question {i}: {student_answers[question_key]}\n"
+
+        translation_task = ""
+        translation_format = ""
+        if to_translate:
+            translation_task = f"""5. translations - "The Translator": Translate every answer in this JSON object to natural, conversational Japanese appropriate for students, keeping the question keys.
+{json.dumps(to_translate, ensure_ascii=False, indent=2)}
+"""
+            translation_format = ',\n    "translations": {"question1": "日本語訳", "...": "..."}'
+
+        prompt = f"""Your Persona: You are a team of insightful analysts reading the same student's answers.
+Student's Answers:
+{answers_text}
+
+Your Mission:
+{SIGNATURE_MISSION}
+{translation_task}
+Respond with a JSON object in this exact format:
+{{
+    "archetype": "日本語のアーキタイプ名",
+    "core_strength": "日本語の短い段落",
+    "hidden_potential": "日本語の短い段落",
+    "conversation_catalyst": "日本語の一文"{translation_format}
+}}
+
+All text output must be in Japanese."""
+
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'student_pipeline',
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a personality analyst and professional translator. Write concise, warm Japanese for students."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.5,
+            max_tokens=400 + 200 * len(to_translate)
+        )
+
+        if not content:
+            raise ValueError("Empty response from AI")
+
+        response = json.loads(content)
+        if not isinstance(response, dict):
+            raise ValueError("AI response is not a JSON object")
+
+        for field_name in SIGNATURE_FALLBACKS:
+            cleaned = _validate_signature_field(field_name, response.get(field_name))
+            if cleaned:
+                result['signature'][field_name] = cleaned
+            else:
+                logging.warning(f"Invalid {field_name} in fused pipeline response")
+
+        translations = response.get("translations")
+        translations = translations if isinstance(translations, dict) else {}
+        for question_key in to_translate:
+            translated = translations.get(question_key)
+            if isinstance(translated, str) and translated.strip():
+                result['translations'][question_key] = translated.strip()
+            else:
+                logging.warning(f"Fused pipeline response is missing the translation of {question_key}")
+
+        return result
+
+    except Exception as e:
+        logging.error(f"Error in fused translation and signature request: {str(e)}")
+        return result
+
+
+def translate_answers_to_japanese(answers):
+    """
+    Translate all six answers of one student to Japanese in a single request
+    """
+    return translate_students_to_japanese({'student': answers})['student']
+
+
 def generate_archetype(student_answers):
     """
     Generate a creative Japanese nickname for the student
@@ -225,13 +542,9 @@ Output Requirement:
 Respond with ONLY the Japanese title for the archetype.
 Example Titles: 「静かな森の探検家」(Explorer of the Quiet Forest), 「アイデアの稲妻を放つ者」(One Who Unleashes the Lightning of Ideas), 「心の庭を育てる人」(The Gardener of the Heart's Garden)."""
 
-        # Create OpenAI client with shorter timeout for faster processing
-        timeout_client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=8.0  # Reduced from 30 to 8 seconds
-        )
-        
-        response = timeout_client.chat.completions.create(
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'personality_trait',
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a creative nickname generator. Create concise Japanese nicknames."},
@@ -241,8 +554,8 @@ Example Titles: 「静かな森の探検家」(Explorer of the Quiet Forest), 
             max_tokens=30  # Reduced tokens for faster response
         )
         
-        if response.choices[0].message.content:
-            result = response.choices[0].message.content.strip()
+        if content:
+            result = content.strip()
             logging.info(f"Generated archetype: {result}")
             return result
         else:
@@ -276,13 +589,9 @@ Based on the student's answers, write a short, powerful paragraph in Japanese de
 Output Requirement:
 Respond with ONLY the Japanese paragraph describing their core strength."""
 
-        # Create OpenAI client with shorter timeout for faster processing
-        timeout_client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=8.0  # Reduced from 30 to 8 seconds
-        )
-        
-        response = timeout_client.chat.completions.create(
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'personality_trait',
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a personality analyst. Write concise Japanese sentences about strengths."},
@@ -292,8 +601,8 @@ Respond with ONLY the Japanese paragraph describing their core strength."""
             max_tokens=60  # Reduced tokens for faster response
         )
         
-        if response.choices[0].message.content:
-            result = response.choices[0].message.content.strip()
+        if content:
+            result = content.strip()
             logging.info(f"Generated core strength: {result}")
             return result
         else:
@@ -327,13 +636,9 @@ Based on their answers, identify their "Uncharted Territory"—a hidden potentia
 Output Requirement:
 Respond with ONLY the Japanese paragraph describing their hidden potential."""
 
-        # Create OpenAI client with shorter timeout for faster processing
-        timeout_client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=8.0  # Reduced from 30 to 8 seconds
-        )
-        
-        response = timeout_client.chat.completions.create(
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'personality_trait',
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a personality analyst. Write concise Japanese sentences about hidden potential."},
@@ -343,8 +648,8 @@ Respond with ONLY the Japanese paragraph describing their hidden potential."""
             max_tokens=60  # Reduced tokens for faster response
         )
         
-        if response.choices[0].message.content:
-            result = response.choices[0].message.content.strip()
+        if content:
+            result = content.strip()
             logging.info(f"Generated hidden potential: {result}")
             return result
         else:
@@ -379,13 +684,9 @@ Output Requirement:
 Respond with ONLY the Japanese sentence for the conversation catalyst.
 Example: 「彼らの『秘密のスーパーパワー』が実際に役立った時の話を聞いてみてください。」"""
 
-        # Create OpenAI client with shorter timeout for faster processing
-        timeout_client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=8.0  # Reduced from 30 to 8 seconds
-        )
-        
-        response = timeout_client.chat.completions.create(
+        # Run the request on the pooled client for this timeout profile
+        content = chat_completion(
+            'personality_trait',
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a conversation expert. Write concise Japanese sentences about conversation starters."},
@@ -395,8 +696,8 @@ Example: 「彼らの『秘密のスーパーパワー』が実際に役立っ
             max_tokens=60  # Reduced tokens for faster response
         )
         
-        if response.choices[0].message.content:
-            result = response.choices[0].message.content.strip()
+        if content:
+            result = content.strip()
             logging.info(f"Generated conversation catalyst: {result}")
             return result
         else:
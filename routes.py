@@ -1,8 +1,30 @@
+"""
+Legacy route module - NOT loaded by the application. app.py registers every live route in
+register_all_routes(), and this module cannot be imported next to it (health_check is defined
+twice). Add and fix routes in app.py; nothing here is reachable.
+"""
+
 import logging
-from flask import render_template, request, redirect, url_for, session, jsonify, flash
-from app import app, db, csrf
-from models import Student, SessionSettings, Squad
+from flask import render_template, request, redirect, url_for, session, jsonify, flash, get_template_attribute, Response, make_response
+from app import app, db, csrf, job_queue
+from models import Student, SessionSettings, Squad, Job
 from forms import StudentForm, TeacherLoginForm, StudentLoginForm
+from analysis_engine import circuit_breaker_state
+from translation_batcher import translate_students, TRANSLATION_ERROR_TEXT
+from student_pipeline import process_students
+from analysis_pipeline import run_pipeline, stale_students, record_clustering
+from squad_formation import resolve_formation_mode, form_squads_hierarchical, form_squads_locally, form_squads_hybrid, place_incrementally, repair_partition
+from squad_optimizer import optimize_squads
+from compatibility import vibe_words, describe_pair, paginate
+from compatibility_index import index_students, ensure_indexed, get_index_entries
+from vibe_keywords import assign_squad_icon, get_vibe_archetype
+from student_tags import save_student_tags, get_student_tags, get_tags_for_students
+from change_feed import record_changes, record_reset, current_cursor, changes_since
+from event_broker import EventBroker
+from squad_waiters import AssignmentBoard
+from job_queue import job_status
+from squad_snapshots import save_snapshots, get_snapshot
+from content_registry import get_questionnaire, get_questions, get_form_labels, get_question_titles, get_success_text, get_app_explanation
 
 # Health check route for Firebase App Hosting
 @app.route('/health')
@@ -32,18 +54,6 @@ def health_check():
     """Health check endpoint for Firebase App Hosting"""
     return jsonify({"status": "healthy", "message": "VibeCheck is running"}), 200
 
-def load_questionnaire_data():
-    """Load questionnaire data from questions.json file"""
-    try:
-        with open('questions.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logging.error("questions.json file not found")
-        return None
-    except json.JSONDecodeError:
-        logging.error("Error decoding questions.json")
-        return None
-
 @app.route('/')
 def index():
     """Language selection homepage"""
@@ -69,29 +79,16 @@ def session_password():
     """Session password page that shows questionnaire when authenticated"""
     # If already authenticated, show the questionnaire form
     if session.get('session_authenticated'):
-        # Load questionnaire data
-        questionnaire_data = load_questionnaire_data()
-        if not questionnaire_data:
-
+        # Questionnaire content is parsed once and cached per language
+        if not get_questionnaire():
             return render_template('session_password.html')
         
         # Get selected language from session, default to English
         selected_language = session.get('selected_language', 'en')
         
         # Get questions for the selected language
-        questions = questionnaire_data['questions'].get(selected_language, questionnaire_data['questions']['en'])
-        form_labels = questionnaire_data['form_labels']
-        
-        # Log question descriptions to verify full text is loading
-        print(f"=== QUESTIONNAIRE DEBUG INFO ===")
-        print(f"Selected language: {selected_language}")
-        print(f"Number of questions loaded: {len(questions)}")
-        for i, question in enumerate(questions):
-            print(f"Question {i+1} - Title: {question.get('title', 'N/A')}")
-            print(f"Question {i+1} - Description: {question.get('description', 'N/A')}")
-            print(f"Question {i+1} - Description length: {len(question.get('description', ''))}")
-            print("---")
-        print("=== END DEBUG INFO ===")
+        questions = get_questions(selected_language)
+        form_labels = get_form_labels()
         
         form = StudentForm()
         return render_template('questionnaire.html', form=form, questions=questions, form_labels=form_labels, selected_language=selected_language)
@@ -117,63 +114,73 @@ def translate_student_answers_in_background(student_id, student_language):
     """
     Background function dedicated only to translation - including special handling for Japanese students
     """
-    with app.app_context():
-        try:
-            from openai_integration import translate_to_japanese
-            
-            student = Student.query.get(student_id)
-            if not student:
-                logging.error(f"Could not find student with ID {student_id} to translate.")
-                return
-                
-            logging.info(f"Starting translation for student {student_id} ({student.name}) in language: {student_language}")
-            
-            # Special handling for Japanese students
-            if student_language == 'ja':
-                # Student chose Japanese - copy original answers to _jp fields
-                student.question1_jp = student.question1
-                student.question2_jp = student.question2
-                student.question3_jp = student.question3
-                student.question4_jp = student.question4
-                student.question5_jp = student.question5
-                student.question6_jp = student.question6
-                logging.info(f"Japanese detected for student {student_id}, copied original answers")
-            else:
-                # Student chose other language - translate to Japanese
-                logging.info(f"Translating answers for student {student_id} from {student_language} to Japanese")
-                
-                # Translate each answer individually with error handling and rate limiting
-                translations = []
-                import time
-                for i, answer in enumerate([student.question1, student.question2, student.question3, 
-                                          student.question4, student.question5, student.question6], 1):
-                    try:
-                        translation = translate_to_japanese(answer)
-                        translations.append(translation)
-                        logging.info(f"Question {i} translated successfully for student {student_id}")
-                        # Add small delay to prevent rate limiting
-                        time.sleep(0.2)
-                    except Exception as e:
-                        logging.error(f"Translation failed for question {i} of student {student_id}: {str(e)}")
-                        translations.append("翻訳エラー")  # Use error message for failed translations
-                
-                # Assign translations to student
-                student.question1_jp = translations[0]
-                student.question2_jp = translations[1]
-                student.question3_jp = translations[2]
-                student.question4_jp = translations[3]
-                student.question5_jp = translations[4]
-                student.question6_jp = translations[5]
-                
-                logging.info(f"Successfully processed translations for student {student_id}")
-            
-            # Save changes to database
-            db.session.commit()
-            logging.info(f"Translation completed and saved for student {student_id}")
-            
-        except Exception as e:
-            logging.error(f"Translation error for student {student_id}: {str(e)}")
-            db.session.rollback()
+    translate_students_answers_in_background([(student_id, student_language)])
+
+def translate_students_answers_in_background(translation_requests, last_attempt=True):
+    """
+    Translate a burst of submissions with one AI request covering all six answers of every student.
+    Failed translations are retried by the job queue; only the last attempt stores the error message.
+    """
+    logging.info(f"Starting translation for students: {translation_requests}")
+    translate_students(translation_requests, fallback_text=TRANSLATION_ERROR_TEXT, strict=not last_attempt)  # Use error message for failed translations
+    index_submitted_students([student_id for student_id, _ in translation_requests])
+
+def index_submitted_students(student_ids):
+    """Add the new students to the compatibility index while we are in the background"""
+    try:
+        index_students(
+            Student.query.filter(Student.id.in_(student_ids)).all(),
+            get_vibe_archetype,
+            top_k=app.config['COMPATIBILITY_TOP_K']
+        )
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to update compatibility index for students {student_ids}: {str(e)}")
+
+def run_translation_jobs(payloads, last_attempt):
+    """Job handler - submissions claimed together share one AI request"""
+    translate_students_answers_in_background(
+        [(payload['student_id'], payload['language']) for payload in payloads],
+        last_attempt=last_attempt
+    )
+
+def run_student_pipeline_jobs(payloads, last_attempt):
+    """Job handler (FUSED_STUDENT_PIPELINE) - one AI request per student for the translations and the signature"""
+    pipeline_requests = [(payload['student_id'], payload['language']) for payload in payloads]
+    logging.info(f"Starting fused pipeline for students: {pipeline_requests}")
+    process_students(pipeline_requests, fallback_text=TRANSLATION_ERROR_TEXT, strict=not last_attempt)  # Use error message for failed translations
+    index_submitted_students([student_id for student_id, _ in pipeline_requests])
+
+# Submission work never takes the last worker, so teacher actions do not wait behind a backlog
+job_queue.register(
+    'translation',
+    run_translation_jobs,
+    batch_size=app.config['TRANSLATION_BATCH_SIZE'],
+    priority=app.config['JOB_PRIORITIES']['translation'],
+    max_running=max(1, app.config['JOB_WORKERS'] - 1)
+)
+job_queue.register(
+    'student_pipeline',
+    run_student_pipeline_jobs,
+    priority=app.config['JOB_PRIORITIES']['student_pipeline'],
+    max_running=max(1, app.config['JOB_WORKERS'] - 1)
+)
+
+# Live dashboard events, fed from the change feed
+event_broker = EventBroker(
+    app,
+    poll_interval=app.config['SSE_POLL_INTERVAL'],
+    max_streams=app.config['SSE_MAX_STREAMS']
+)
+event_broker.watch_commits(db.session)
+
+# Students waiting for their squad, answered from memory
+assignment_board = AssignmentBoard(
+    app,
+    poll_interval=app.config['SQUAD_WAIT_POLL_INTERVAL'],
+    max_parked=app.config['SQUAD_WAIT_MAX_PARKED']
+)
+assignment_board.watch_commits(db.session)
 
 @app.route('/submit-form', methods=['POST'])
 def submit_form():
@@ -243,6 +250,13 @@ def submit_form():
             try:
                 db.session.add(student)
                 print('Student added to database session')
+                # Tags are computed once here so the dashboard only reads them
+                db.session.flush()
+                save_student_tags(student)
+                # Translation (or fused translation + analysis) job is committed with the student so it survives a restart
+                student_language = session.get('selected_language', 'en')
+                job_kind = 'student_pipeline' if app.config['FUSED_STUDENT_PIPELINE'] else 'translation'
+                job_queue.enqueue(job_kind, {'student_id': student.id, 'language': student_language})
                 db.session.commit()
                 print('--- Database save successful ---')
             except Exception as db_error:
@@ -250,17 +264,7 @@ def submit_form():
                 raise db_error
                 
             logging.info(f"New student registered: {student.name} (ID: {student.id}, Submission ID: {submission_id})")
-            
-            # Start background translation in a separate thread
-            import threading
-            student_language = session.get('selected_language', 'en')
-            translation_thread = threading.Thread(
-                target=translate_student_answers_in_background,
-                args=(student.id, student_language),
-                daemon=True
-            )
-            translation_thread.start()
-            logging.info(f"Started background translation for student {student.id} in language {student_language}")
+            logging.info(f"Queued background {job_kind} for student {student.id} in language {student_language}")
             
             # Store submission ID in session for success page
             session['submission_id'] = submission_id
@@ -297,46 +301,12 @@ def success():
     submission_id = session.get('submission_id')
     student_name = session.get('student_name')
     
-    # Load site content for multilingual support
-    site_content = None
-    try:
-        with open('site_content.json', 'r', encoding='utf-8') as f:
-            site_content = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logging.error(f"Error loading site_content.json: {e}")
-        site_content = {}
-    
     # Get user's selected language, default to English
     lang = session.get('selected_language', 'en')
     print(f"--- DEBUG: Language selected is: {lang} ---")
     
-    # Create dictionary with language-specific text
-    success_text = {}
-    if site_content and 'success_page' in site_content:
-        success_page = site_content['success_page']
-        
-        # Get text for user's language, fallback to English
-        success_text['thank_you'] = success_page.get('thank_you', {}).get(lang, 
-            success_page.get('thank_you', {}).get('en', 'Thank you, {name}!'))
-        success_text['id_reminder'] = success_page.get('id_reminder', {}).get(lang,
-            success_page.get('id_reminder', {}).get('en', 'Please save this ID.'))
-        success_text['scroll_prompt'] = success_page.get('scroll_prompt', {}).get(lang,
-            success_page.get('scroll_prompt', {}).get('en', 'Scroll down for a surprise!'))
-        
-        # Format the thank_you message with student name, or default
-        if student_name:
-            success_text['thank_you'] = success_text['thank_you'].format(name=student_name)
-        else:
-            # Remove {name} placeholder if no name available
-            success_text['thank_you'] = success_text['thank_you'].replace(', {name}', '').replace('{name}', '')
-    
-    # Default fallback values if no site_content
-    if not success_text:
-        success_text = {
-            'thank_you': 'ありがとうございました！',
-            'id_reminder': 'このIDを保存してください。',
-            'scroll_prompt': 'スクロールしてみてください！'
-        }
+    # Language-specific text from the cached site content (Japanese defaults if there is none)
+    success_text = get_success_text(lang, student_name)
     
     # Default submission_id if missing
     if not submission_id:
@@ -346,7 +316,7 @@ def success():
     print(f"--- DEBUG: submission_id: {submission_id}, student_name: {student_name} ---")
     
     # Get app explanation for all languages (for template flexibility)
-    app_explanation = site_content.get('success_page', {}).get('app_explanation', {})
+    app_explanation = get_app_explanation()
     
     # Clear the session data after displaying
     session.pop('submission_id', None)
@@ -369,45 +339,61 @@ def find_squad():
         if not submission_id:
             return render_template('find_squad.html')
         
-        # Find student by submission ID
-        student = Student.query.filter_by(submission_id=submission_id).first()
+        # Find student by submission ID (from the in-memory board, not a query per request)
+        known, squad_id = assignment_board.lookup(submission_id)
         
-        if not student:
+        if not known:
             return render_template('find_squad.html')
         
         # Check if student has been assigned to a squad
-        if student.squad_id:
+        if squad_id:
             # Redirect to the squad hub
-            return redirect(url_for('squad_hub', squad_id=student.squad_id))
+            return redirect(url_for('squad_hub', squad_id=squad_id))
         else:
-            # No squad assigned yet
-            return render_template('find_squad.html')
+            # No squad assigned yet - the page waits for it
+            return render_template('find_squad.html', waiting_submission_id=submission_id)
     
     # GET request - show the form
     return render_template('find_squad.html')
 
+@app.route('/find-squad/wait')
+def wait_for_squad():
+    """Long-poll until the student with this submission ID is assigned to a squad"""
+    submission_id = request.args.get('submission_id', '').strip().upper()
+    if not submission_id:
+        return jsonify({'success': False, 'error': 'submission_id is required'}), 400
+    
+    result = assignment_board.wait(submission_id, timeout=app.config['SQUAD_WAIT_TIMEOUT'])
+    if result['status'] == 'unknown':
+        return jsonify({'success': False, 'status': 'unknown', 'error': 'Unknown submission ID'}), 404
+    
+    response = {'success': True, 'status': result['status'], 'retry_after': result['retry_after']}
+    if result['status'] == 'assigned':
+        response['redirect'] = url_for('squad_hub', squad_id=result['squad_id'])
+    return jsonify(response)
+
 @app.route('/squad-hub/<int:squad_id>')
 def squad_hub(squad_id):
-    """Display the squad hub for a specific squad"""
+    """Display the squad hub for a specific squad from its materialized snapshot"""
     try:
-        # Fetch the squad with all its members
-        squad = Squad.query.get_or_404(squad_id)
-        
-        # Randomly select a first speaker from squad members
-        first_speaker = random.choice(squad.members) if squad.members else None
-        
-        # Parse the JSON icebreaker_text into a Python object
-        icebreaker_data = None
-        if squad.icebreaker_text:
-            try:
-                icebreaker_data = json.loads(squad.icebreaker_text)
-                logging.info(f"Successfully parsed icebreaker data for squad {squad_id}: {icebreaker_data}")
-            except (json.JSONDecodeError, TypeError) as e:
-                logging.error(f"Error parsing icebreaker JSON for squad {squad_id}: {e}")
-                # If JSON parsing fails, create a fallback structure
-                icebreaker_data = None
-        
-        return render_template('squad_hub.html', squad=squad, icebreaker_data=icebreaker_data, first_speaker=first_speaker)
+        snapshot = get_snapshot(squad_id)
+        if snapshot is None:
+            return redirect(url_for('find_squad'))
+        payload, etag = snapshot
+        
+        # Every member loads the same snapshot, so revisits are answered without rendering
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(render_template(
+                'squad_hub.html',
+                squad=payload['squad'],
+                icebreaker_data=payload['icebreaker'],
+                first_speaker=payload['first_speaker']
+            ))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         logging.error(f"Error accessing squad hub {squad_id}: {str(e)}")
@@ -426,22 +412,18 @@ def student_profile(student_id):
                                  student=None,
                                  error_message="Profile not found")
         
-        # Load questionnaire data for displaying question titles
-        try:
-            questions = load_questionnaire_data()
-            en_questions = questions.get('en', [])
-        except:
-            en_questions = []
+        # English question titles from the cached questionnaire content
+        en_titles = get_question_titles('en')
         
         # Create a mapping of answers to questions for easy display (including Japanese translations)
-        if len(en_questions) >= 6:
+        if len(en_titles) >= 6:
             student_answers = [
-                {'question': en_questions[0]['title'], 'answer': student.question1, 'answer_jp': getattr(student, 'question1_jp', '')},
-                {'question': en_questions[1]['title'], 'answer': student.question2, 'answer_jp': getattr(student, 'question2_jp', '')},
-                {'question': en_questions[2]['title'], 'answer': student.question3, 'answer_jp': getattr(student, 'question3_jp', '')},
-                {'question': en_questions[3]['title'], 'answer': student.question4, 'answer_jp': getattr(student, 'question4_jp', '')},
-                {'question': en_questions[4]['title'], 'answer': student.question5, 'answer_jp': getattr(student, 'question5_jp', '')},
-                {'question': en_questions[5]['title'], 'answer': student.question6, 'answer_jp': getattr(student, 'question6_jp', '')},
+                {'question': en_titles[0], 'answer': student.question1, 'answer_jp': getattr(student, 'question1_jp', '')},
+                {'question': en_titles[1], 'answer': student.question2, 'answer_jp': getattr(student, 'question2_jp', '')},
+                {'question': en_titles[2], 'answer': student.question3, 'answer_jp': getattr(student, 'question3_jp', '')},
+                {'question': en_titles[3], 'answer': student.question4, 'answer_jp': getattr(student, 'question4_jp', '')},
+                {'question': en_titles[4], 'answer': student.question5, 'answer_jp': getattr(student, 'question5_jp', '')},
+                {'question': en_titles[5], 'answer': student.question6, 'answer_jp': getattr(student, 'question6_jp', '')},
             ]
         else:
             # Fallback question titles if questions.json is not available
@@ -455,8 +437,7 @@ def student_profile(student_id):
             ]
         
         # Get enhanced profile data (legacy compatibility)
-        vibes_text = student.vibes or student.get_combined_answers()
-        interests = get_interest_categories_with_colors(vibes_text)
+        interests = get_student_tags(student)['interests']
         
         # Personality Signature data (new AI-generated fields)
         personality_signature = {
@@ -521,10 +502,7 @@ def organizer_dashboard():
         solo_students_db = Student.query.filter_by(squad_id=None).all()
 
         squads_exist = Squad.query.count() > 0
-        unanalyzed_students_count = Student.query.filter(
-            db.or_(Student.archetype.is_(None), Student.archetype == "")
-        ).count()
-        analysis_complete = unanalyzed_students_count == 0
+        analysis_complete = not stale_students('signature')
 
         return render_template('teacher.html', 
                              students=students,
@@ -552,6 +530,9 @@ def teacher():
         return redirect(url_for('teacher_login'))
     
     try:
+        # Read the change cursor first: changes racing with this render are replayed by the delta sync
+        change_cursor = current_cursor()
+        
         # Fetch all students from database
         students = Student.query.order_by(Student.created_at.desc()).all()
         logging.info(f"Teacher accessed dashboard. Found {len(students)} students.")
@@ -564,7 +545,8 @@ def teacher():
             if advice_key in session:
                 ai_advice[student['id']] = session[advice_key]
         
-        # Add interest visualization data to students
+        # Add interest visualization data to students (precomputed at submission)
+        tags_by_id = get_tags_for_students(students)
         students_with_interests = []
         for student in students:
             student_dict = {
@@ -574,7 +556,7 @@ def teacher():
                 'country': student.country,
                 'gender': student.gender,
                 'created_at': student.created_at,
-                'interests': get_interest_categories_with_colors(student.vibes or student.get_combined_answers())
+                'interests': tags_by_id[student.id]['interests']
             }
             students_with_interests.append(student_dict)
         
@@ -589,11 +571,11 @@ def teacher():
         # Squad Creation: Check if any Squad records exist
         squads_exist = Squad.query.count() > 0
         
-        # Batch Analysis: Check if there are students that still need analysis (archetype field is empty/null)
-        unanalyzed_students_count = Student.query.filter(
-            db.or_(Student.archetype.is_(None), Student.archetype == "")
-        ).count()
-        analysis_complete = unanalyzed_students_count == 0
+        # Batch Analysis: Check if any student's signature is missing or out of date (answers or prompt changed)
+        analysis_complete = not stale_students('signature')
+        
+        # Squad creation or batch analysis still running in the background - the page shows its progress
+        active_job = job_queue.active_job(TEACHER_JOB_KINDS)
         
         return render_template('teacher.html', 
                              students=students_with_interests,
@@ -602,7 +584,9 @@ def teacher():
                              ai_advice=ai_advice,
                              session_password=current_session_password,
                              squads_exist=squads_exist,
-                             analysis_complete=analysis_complete)
+                             analysis_complete=analysis_complete,
+                             change_cursor=change_cursor,
+                             active_job=job_status(active_job) if active_job else None)
     
     except Exception as e:
         print("!!! TEACHER DASHBOARD CRASHED !!!")
@@ -611,6 +595,69 @@ def teacher():
         # Return a simple error message instead of crashing
         return "The teacher dashboard encountered an error. Check the console for details.", 500
 
+def dashboard_status():
+    """Counters and flags the dashboard header, buttons and translation notice are drawn from"""
+    return {
+        'student_count': Student.query.count(),
+        'solo_count': Student.query.filter_by(squad_id=None).count(),
+        'pending_translations': Student.query.filter(
+            db.or_(Student.question1_jp.is_(None), Student.question1_jp == "")
+        ).count(),
+        'squads_exist': Squad.query.count() > 0,
+        'analysis_complete': not stale_students('signature'),
+    }
+
+@app.route('/teacher/api/changes')
+def teacher_changes():
+    """Delta sync for the dashboard - students and squads changed since a cursor, as rendered cards"""
+    if not session.get('teacher_authenticated'):
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    changes = changes_since(request.args.get('since', 0, type=int))
+    response = {'success': True, 'cursor': changes['cursor'], 'reset': changes['reset']}
+    if changes['reset'] or not (changes['students'] or changes['squads']):
+        return jsonify(response)
+    
+    squad_card = get_template_attribute('_teacher_cards.html', 'squad_card')
+    solo_student_card = get_template_attribute('_teacher_cards.html', 'solo_student_card')
+    
+    # Render the current state of everything touched; IDs that no longer exist were deleted
+    changed_student_ids = list(changes['students'])
+    students = Student.query.filter(Student.id.in_(changed_student_ids)).all() if changed_student_ids else []
+    changed_squad_ids = list(changes['squads'])
+    squads = Squad.query.filter(Squad.id.in_(changed_squad_ids)).all() if changed_squad_ids else []
+    
+    response['students'] = [
+        {
+            'id': student.id,
+            'squad_id': student.squad_id,
+            'html': str(solo_student_card(student)) if student.squad_id is None else None
+        }
+        for student in students
+    ]
+    response['deleted_students'] = sorted(set(changed_student_ids) - {student.id for student in students})
+    response['squads'] = [{'id': squad.id, 'html': str(squad_card(squad))} for squad in squads]
+    response['deleted_squads'] = sorted(set(changed_squad_ids) - {squad.id for squad in squads})
+    response['status'] = dashboard_status()
+    return jsonify(response)
+
+@app.route('/teacher/events')
+def teacher_events():
+    """Server-Sent Events stream of submissions, translations, analyses and squad creation"""
+    if not session.get('teacher_authenticated'):
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    stream = event_broker.subscribe()
+    if stream is None:
+        # Every stream slot is taken - the dashboard keeps polling /teacher/api/changes instead
+        return jsonify({'success': False, 'error': 'Too many event streams'}), 503
+    
+    return Response(
+        event_broker.stream(stream, max_seconds=app.config['SSE_STREAM_SECONDS']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/teacher/new-session-password', methods=['POST'])
 def new_session_password():
     """Generate new session password for teacher"""
@@ -628,291 +675,131 @@ def teacher_logout():
     session.pop('teacher_authenticated', None)
     return redirect(url_for('teacher'))
 
-# Global circuit breaker state for AI functions
-circuit_breaker_state = {
-    'failure_count': 0,
-    'last_failure_time': None,
-    'circuit_open': False,
-    'success_count': 0
-}
-
-def intelligent_ai_call_with_retry(ai_function, student_answers, function_name, fallback_value, max_retries=3):
-    """
-    Intelligent retry mechanism with circuit breaker pattern and adaptive timeout
-    """
-    import time
-    
-    # Circuit breaker check
-    if circuit_breaker_state['circuit_open']:
-        if time.time() - circuit_breaker_state['last_failure_time'] > 60:  # Reset after 1 minute
-            circuit_breaker_state['circuit_open'] = False
-            circuit_breaker_state['failure_count'] = 0
-            print(f"🔄 Circuit breaker reset for {function_name}")
-        else:
-            print(f"⚡ Circuit breaker open for {function_name}, using fallback")
-            return fallback_value
-    
-    start_time = time.time()
-    
-    for attempt in range(max_retries):
-        try:
-            # Calculate delay with exponential backoff (1s, 2s, 4s)
-            if attempt > 0:
-                delay = min(2 ** (attempt - 1), 8)  # Cap at 8 seconds
-                print(f"⏳ Retrying {function_name} in {delay}s (attempt {attempt + 1}/{max_retries})")
-                time.sleep(delay)
-            
-            # Call the AI function with timeout monitoring
-            attempt_start = time.time()
-            result = ai_function(student_answers)
-            attempt_duration = time.time() - attempt_start
-            
-            # Validate result quality
-            if result and result.strip() and result != fallback_value and len(result.strip()) > 5:
-                # Success - reset circuit breaker
-                circuit_breaker_state['failure_count'] = 0
-                circuit_breaker_state['success_count'] += 1
-                circuit_breaker_state['circuit_open'] = False
-                
-                total_duration = time.time() - start_time
-                print(f"✓ {function_name} succeeded on attempt {attempt + 1} ({attempt_duration:.1f}s, total: {total_duration:.1f}s)")
-                return result
-            else:
-                print(f"⚠ {function_name} returned low-quality result on attempt {attempt + 1}")
-                if attempt == max_retries - 1:
-                    circuit_breaker_state['failure_count'] += 1
-                    return fallback_value
-                    
-        except Exception as e:
-            error_type = type(e).__name__
-            print(f"✗ {function_name} failed on attempt {attempt + 1}: {error_type} - {str(e)}")
-            
-            # Handle different error types
-            if "timeout" in str(e).lower() or "timed out" in str(e).lower():
-                print(f"🕐 Timeout error for {function_name}")
-            elif "rate limit" in str(e).lower():
-                print(f"⏱ Rate limit error for {function_name}, extending delay")
-                if attempt < max_retries - 1:
-                    time.sleep(10)  # Extended delay for rate limits
-            
-            if attempt == max_retries - 1:
-                circuit_breaker_state['failure_count'] += 1
-                circuit_breaker_state['last_failure_time'] = time.time()
-                
-                # Open circuit breaker after 3 consecutive failures
-                if circuit_breaker_state['failure_count'] >= 3:
-                    circuit_breaker_state['circuit_open'] = True
-                    print(f"⚡ Circuit breaker opened for {function_name}")
-                
-                return fallback_value
+@app.route('/teacher/llm-cache-stats')
+def llm_cache_stats():
+    """Report LLM response cache hit/miss counters and size, and the AI calls running or waiting per priority class"""
+    if not session.get('teacher_authenticated'):
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
     
-    return fallback_value
+    from llm_cache import get_cache_stats
+    from ai_scheduler import ai_scheduler
+    return jsonify(dict(get_cache_stats(), ai_scheduler=ai_scheduler.stats()))
 
 @app.route('/teacher/analyze-batch', methods=['POST'])
 def analyze_batch():
-    """Analyze the next batch of students with intelligent retry mechanism"""
+    """Start bringing every student's translations, signature and tags up to date in the background"""
     print("--- User clicked 'Analyze Batch'. Route was called. ---")
     
     # Check if teacher is authenticated
     if not session.get('teacher_authenticated'):
         return redirect(url_for('teacher_login'))
     
-    try:
-        # Find all students who have not yet been analyzed (archetype field is empty or null)
-        # Reduced batch size to 2 for better reliability and faster processing
-        unanalyzed_students = Student.query.filter(
-            db.or_(Student.archetype.is_(None), Student.archetype == "")
-        ).limit(2).all()
-        
-        print(f"Found {len(unanalyzed_students)} students to analyze.")
-        
-        if not unanalyzed_students:
-            flash("すべての学生の分析が完了しました。", "info")
-            return redirect(url_for('teacher'))
-        
-        # Import AI personality generation functions
-        from openai_integration import generate_archetype, generate_core_strength, generate_hidden_potential, generate_conversation_catalyst
-        
-        import time
-        successfully_analyzed = 0
-        total_ai_calls = 0
-        successful_ai_calls = 0
-        fallback_used = 0
-        batch_start_time = time.time()
-        
-        # Process each student in the batch with enhanced monitoring
-        for student_idx, student in enumerate(unanalyzed_students):
-            try:
-                student_start_time = time.time()
-                print(f"🔄 Processing student {student_idx + 1}/{len(unanalyzed_students)}: {student.name}")
-                
-                # Prepare student answers for AI analysis
-                student_answers = {
-                    'question1': student.question1,
-                    'question2': student.question2,
-                    'question3': student.question3,
-                    'question4': student.question4,
-                    'question5': student.question5,
-                    'question6': student.question6
-                }
-                
-                # Generate personality signature using intelligent retry mechanism
-                ai_functions = [
-                    (generate_archetype, "archetype", "個性豊かな学生"),
-                    (generate_core_strength, "core_strength", "創造的な思考力と独自の視点を持っています。"),
-                    (generate_hidden_potential, "hidden_potential", "リーダーシップの才能が眠っている可能性があります。"),
-                    (generate_conversation_catalyst, "conversation_catalyst", "趣味や興味のあることについて話すと、とても輝いて見えます。")
-                ]
-                
-                student_results = {}
-                
-                for ai_func, field_name, fallback in ai_functions:
-                    total_ai_calls += 1
-                    result = intelligent_ai_call_with_retry(ai_func, student_answers, field_name, fallback)
-                    
-                    if result != fallback:
-                        successful_ai_calls += 1
-                    else:
-                        fallback_used += 1
-                    
-                    student_results[field_name] = result
-                
-                # Assign results to student
-                student.archetype = student_results['archetype']
-                student.core_strength = student_results['core_strength']
-                student.hidden_potential = student_results['hidden_potential']
-                student.conversation_catalyst = student_results['conversation_catalyst']
-                
-                # Save changes to database after each student
-                db.session.commit()
-                successfully_analyzed += 1
-                
-                student_duration = time.time() - student_start_time
-                print(f"✅ Completed {student.name} in {student_duration:.1f}s")
-                
-                logging.info(f"Successfully analyzed student {student.name} (ID: {student.id})")
-                
-            except Exception as e:
-                logging.error(f"Error analyzing student {student.name}: {str(e)}")
-                # Set fallback values for this student
-                student.archetype = "個性豊かな学生"
-                student.core_strength = "創造的な思考力と独自の視点を持っています。"
-                student.hidden_potential = "リーダーシップの才能が眠っている可能性があります。"
-                student.conversation_catalyst = "趣味や興味のあることについて話すと、とても輝いて見えます。"
-                db.session.commit()
-                successfully_analyzed += 1
-                fallback_used += 4
-        
-        # Count remaining unanalyzed students
-        remaining_count = Student.query.filter(
-            db.or_(Student.archetype.is_(None), Student.archetype == "")
-        ).count()
-        
-        # Calculate batch performance metrics
-        batch_duration = time.time() - batch_start_time
-        success_rate = (successful_ai_calls / total_ai_calls * 100) if total_ai_calls > 0 else 0
-        
-        # Create enhanced status message with performance metrics
-        if remaining_count == 0:
-            flash(f"🎉 {successfully_analyzed}人の学生を分析しました。すべての分析が完了しました！ (成功率: {success_rate:.1f}%, 処理時間: {batch_duration:.1f}s)", "success")
-        else:
-            flash(f"📊 {successfully_analyzed}人の学生を分析しました。残り{remaining_count}人の学生が分析待ちです。 (成功率: {success_rate:.1f}%, フォールバック使用: {fallback_used}回)", "info")
-        
-        # Log detailed performance metrics
-        print(f"📈 Batch Performance Summary:")
-        print(f"   Students processed: {successfully_analyzed}")
-        print(f"   Total AI calls: {total_ai_calls}")
-        print(f"   Successful AI calls: {successful_ai_calls}")
-        print(f"   Fallback used: {fallback_used}")
-        print(f"   Success rate: {success_rate:.1f}%")
-        print(f"   Total time: {batch_duration:.1f}s")
-        print(f"   Average time per student: {batch_duration/successfully_analyzed:.1f}s")
-        print(f"   Circuit breaker state: {'Open' if circuit_breaker_state['circuit_open'] else 'Closed'}")
-        
-    except Exception as e:
-        logging.error(f"Error in analyze_batch: {str(e)}")
-        flash("分析中にエラーが発生しました。もう一度お試しください。", "error")
+    return start_teacher_job('analysis', {}, "バッチ分析をバックグラウンドで開始しました。")  # Batch analysis started in the background
+
+def start_teacher_job(kind, payload, started_message):
+    """
+    Queue a long-running teacher operation unless one is already running, and return right away.
+    JSON callers get the job (202) to poll /teacher/jobs/<id>; forms go back to the dashboard, which shows its progress.
+    """
+    job = job_queue.active_job(TEACHER_JOB_KINDS)
+    if job is None:
+        # No automatic retry - the teacher sees the failure and can start the operation again
+        job = job_queue.enqueue(kind, payload, max_attempts=1)
+        db.session.commit()
+        logging.info(f"Queued {kind} job {job.id}")
+        flash(started_message, "info")
+    else:
+        flash("別の処理を実行中です。完了までお待ちください。", "info")  # Another operation is still running
     
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(job_status(job), success=True, status_url=url_for('teacher_job_status', job_id=job.id))), 202
     return redirect(url_for('teacher'))
 
-
-
-def assign_squad_icon(squad_name):
+def run_analysis_job(payload, job):
     """
-    Assign Font Awesome icon based on keywords in squad name
+    Background part of 'Analyze Batch' - recomputes only the stale pipeline stages (new or changed
+    answers, or a new prompt version), reports the students analyzed and stops when cancelled
     """
-    squad_name_lower = squad_name.lower()
-    
-    # Icon mapping based on common keywords
-    icon_keywords = {
-        'explorer': 'fa-compass',
-        'adventure': 'fa-compass',
-        'travel': 'fa-compass',
-        '探検': 'fa-compass',
-        'アドベンチャー': 'fa-compass',
-        
-        'creative': 'fa-palette',
-        'art': 'fa-palette',
-        'design': 'fa-palette',
-        'クリエイティブ': 'fa-palette',
-        'アート': 'fa-palette',
-        
-        'music': 'fa-music',
-        'sound': 'fa-music',
-        'ミュージック': 'fa-music',
-        '音楽': 'fa-music',
-        
-        'tech': 'fa-laptop-code',
-        'coding': 'fa-laptop-code',
-        'digital': 'fa-laptop-code',
-        'テック': 'fa-laptop-code',
-        'コーディング': 'fa-laptop-code',
-        
-        'sports': 'fa-running',
-        'fitness': 'fa-running',
-        'active': 'fa-running',
-        'スポーツ': 'fa-running',
-        
-        'stars': 'fa-star',
-        'dream': 'fa-star',
-        'future': 'fa-star',
-        'スター': 'fa-star',
-        'ドリーム': 'fa-star',
-        
-        'unity': 'fa-users',
-        'team': 'fa-users',
-        'harmony': 'fa-users',
-        'ユニティ': 'fa-users',
-        'チーム': 'fa-users',
-        'ハーモニー': 'fa-users',
-        
-        'gaming': 'fa-gamepad',
-        'game': 'fa-gamepad',
-        'ゲーム': 'fa-gamepad',
-        
-        'book': 'fa-book',
-        'reading': 'fa-book',
-        'study': 'fa-book',
-        '本': 'fa-book',
-        
-        'fire': 'fa-fire',
-        'energy': 'fa-fire',
-        'power': 'fa-fire',
-        'パワー': 'fa-fire',
-        
-        'rocket': 'fa-rocket',
-        'space': 'fa-rocket',
-        'innovation': 'fa-rocket',
-        'ロケット': 'fa-rocket',
-    }
+    stats = run_pipeline(
+        job,
+        max_workers=app.config['ANALYSIS_MAX_CONCURRENCY'],
+        commit_batch_size=app.config['ANALYSIS_COMMIT_BATCH_SIZE'],
+        translation_batch_size=app.config['TRANSLATION_BATCH_SIZE'],
+        top_k=app.config['COMPATIBILITY_TOP_K'],
+        fallback_text=TRANSLATION_ERROR_TEXT
+    )
+    logging.info(f"Pipeline stale stages: {stats['stale']}")
+    # Squads formed before these changes are not re-formed automatically - tell the teacher
+    squads_note = " スクワッドは最新の分析を反映していません。" if not stats['stopped'] and stats['squads_stale'] and Squad.query.count() > 0 else ""
+    analysis = stats['analysis']
+    if analysis is None and not stats['stopped']:
+        message = "すべての学生の分析が完了しました。"  # Every student is already analyzed
+        if stats['translated'] or stats['tagged']:
+            message += f" (翻訳更新: {stats['translated']}人, タグ更新: {stats['tagged']}人)"
+        job.report('done', force=True, message=message + squads_note, category="info")
+        return
+    
+    successfully_analyzed = stats['analyzed']
+    total_ai_calls = analysis['total_ai_calls'] if analysis else 0
+    successful_ai_calls = analysis['successful_ai_calls'] if analysis else 0
+    fallback_used = analysis['fallback_used'] if analysis else 0
+    batch_duration = analysis['duration'] if analysis else 0.0
+    
+    # Count students whose signature is still missing or out of date
+    remaining_count = len(stale_students('signature'))
+    
+    # Calculate batch performance metrics
+    success_rate = (successful_ai_calls / total_ai_calls * 100) if total_ai_calls > 0 else 0
+    
+    # Create enhanced status message with performance metrics
+    if stats['stopped']:
+        message, category = f"⏹ 分析をキャンセルしました。{successfully_analyzed}人の学生を分析済み、残り{remaining_count}人です。", "info"
+    elif remaining_count == 0:
+        message, category = f"🎉 {successfully_analyzed}人の学生を分析しました。すべての分析が完了しました！ (成功率: {success_rate:.1f}%, 処理時間: {batch_duration:.1f}s)", "success"
+    else:
+        message, category = f"📊 {successfully_analyzed}人の学生を分析しました。残り{remaining_count}人の学生が分析待ちです。 (成功率: {success_rate:.1f}%, フォールバック使用: {fallback_used}回)", "info"
+    job.report('done', force=True, students_analyzed=successfully_analyzed, message=message + squads_note, category=category)
+    
+    # Log detailed performance metrics
+    print(f"📈 Batch Performance Summary:")
+    print(f"   Students translated: {stats['translated']}")
+    print(f"   Students processed: {successfully_analyzed}")
+    print(f"   Students skipped (circuit open): {analysis['skipped'] if analysis else 0}")
+    print(f"   Students tagged: {stats['tagged']}")
+    print(f"   Total AI calls: {total_ai_calls}")
+    print(f"   Successful AI calls: {successful_ai_calls}")
+    print(f"   Fallback used: {fallback_used}")
+    print(f"   Success rate: {success_rate:.1f}%")
+    print(f"   Total time: {batch_duration:.1f}s")
+    if successfully_analyzed:
+        print(f"   Average time per student: {batch_duration/successfully_analyzed:.1f}s")
+    print(f"   Circuit breaker state: {'Open' if circuit_breaker_state['circuit_open'] else 'Closed'}")
+
+@app.route('/teacher/jobs/<int:job_id>')
+def teacher_job_status(job_id):
+    """Progress of a background teacher operation (stage, students analyzed, squads named, ETA)"""
+    if not session.get('teacher_authenticated'):
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
     
-    # Check for keywords in squad name
-    for keyword, icon in icon_keywords.items():
-        if keyword in squad_name_lower:
-            return icon
+    job = db.session.get(Job, job_id)
+    if job is None or job.kind not in TEACHER_JOB_KINDS:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(dict(job_status(job), success=True))
+
+@app.route('/teacher/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_teacher_job(job_id):
+    """Cancel a background teacher operation - squads are only replaced if squad creation finishes"""
+    if not session.get('teacher_authenticated'):
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
     
-    # Default icon if no keywords match
-    return 'fa-users'
+    job = db.session.get(Job, job_id)
+    if job is None or job.kind not in TEACHER_JOB_KINDS:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    cancelled = job_queue.cancel(job_id)
+    logging.info(f"Teacher cancelled job {job_id}: {cancelled}")
+    return jsonify(dict(job_status(job), success=cancelled))
+
+
 
 def create_simple_japanese_squads(students_data):
     """
@@ -967,6 +854,74 @@ def create_simple_japanese_squads(students_data):
     return {'squads': squads}
 
 
+def add_late_arrivals_to_squads():
+    """
+    Incremental squad formation: place unassigned students into the existing squads
+    (or new ones) by answer similarity, touching only the newcomers and any new squads
+    """
+    answer_columns = [getattr(Student, f'question{i}') for i in range(1, 7)] + \
+                     [getattr(Student, f'question{i}_jp') for i in range(1, 7)]
+    
+    try:
+        newcomers = Student.query.filter_by(squad_id=None).all()
+        if not newcomers:
+            flash('新しく参加した学生はいません', 'info')  # No new students to place
+            return
+        
+        # Only the answers of current squad members are needed, not full ORM objects
+        squads = Squad.query.all()
+        members_by_squad = {squad.id: [] for squad in squads}
+        for row in db.session.query(Student.id, Student.squad_id, *answer_columns).filter(Student.squad_id.isnot(None)):
+            members_by_squad[row.squad_id].append(dict(row._mapping))
+        
+        newcomers_data = []
+        for student in newcomers:
+            student_data = {'id': student.id}
+            for i in range(1, 7):
+                student_data[f'question{i}'] = getattr(student, f'question{i}')
+                student_data[f'question{i}_jp'] = getattr(student, f'question{i}_jp')
+            newcomers_data.append(student_data)
+        
+        result = place_incrementally(
+            [{'id': squad_id, 'members': members} for squad_id, members in members_by_squad.items()],
+            newcomers_data,
+            taken_names={squad.name for squad in squads}
+        )
+        
+        student_map = {student.id: student for student in newcomers}
+        for student_id, squad_id in result['placements'].items():
+            student_map[student_id].squad_id = squad_id
+        
+        touched_squad_ids = set(result['placements'].values())
+        touched_squads = [squad for squad in squads if squad.id in touched_squad_ids]
+        next_rank = max([squad.squad_rank or 0 for squad in squads], default=0) + 1
+        for rank, squad_data in enumerate(result['squads'], next_rank):
+            new_squad = Squad()
+            new_squad.squad_rank = rank
+            new_squad.name = squad_data['squad_name']
+            new_squad.shared_interests = squad_data['shared_interests']
+            new_squad.squad_icon = assign_squad_icon(squad_data['squad_name'])
+            db.session.add(new_squad)
+            db.session.flush()  # Get the squad ID for student assignments
+            for student_id in squad_data['member_ids']:
+                student_map[student_id].squad_id = new_squad.id
+            touched_squads.append(new_squad)
+        
+        # Rebuild the hub snapshots of every squad that gained members
+        db.session.flush()
+        save_snapshots(touched_squads)
+        db.session.commit()
+        placed = len(result['placements']) + sum(len(squad['member_ids']) for squad in result['squads'])
+        logging.info(f"✅ Incremental squad formation placed {placed} of {len(newcomers)} late arrivals")
+        # N students added to squads (M new squads)
+        flash(f'{placed}人の学生をスクワッドに追加しました（新しいスクワッド: {len(result["squads"])}）', 'success')
+    
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error during incremental squad formation: {str(e)}")
+        flash('スクワッドへの追加中にエラーが発生しました', 'error')  # Error while adding to squads
+
+
 @app.route('/teacher/create-squads', methods=['POST'])
 def create_squads():
     """AI-powered squad formation - The Sorting Hat of the application"""
@@ -982,157 +937,161 @@ def create_squads():
         logging.warning("Authentication failed in create_squads route")
         return redirect(url_for('teacher_login'))
     
+    if request.form.get('mode') == 'incremental':
+        # Late arrivals: keep existing squads and only place unassigned students (local, no AI call)
+        add_late_arrivals_to_squads()
+        return redirect(url_for('teacher'))
+    
+    # Formation and naming can take minutes with a slow API - run them in the background
+    payload = {'mode': request.form.get('mode'), 'optimize': request.form.get('optimize') == '1'}
+    return start_teacher_job('create_squads', payload, "スクワッド作成をバックグラウンドで開始しました。")  # Squad creation started in the background
+
+def run_create_squads_job(payload, job):
+    """
+    Background part of squad creation. The current squads are only replaced in the final
+    transaction, so a cancelled or failed run leaves the dashboard as it was.
+    """
+    # Step 1: Fetch every student submission - all of them are regrouped from scratch
+    students = Student.query.all()
+    
+    if len(students) < 3:
+        job.report('done', force=True, message="スクワッドを作成するには3人以上の学生が必要です。", category="info")  # Need at least 3 students
+        return
+    
+    # Step 2: Prepare student data with their pre-analyzed personality signatures for AI analysis
+    students_data = []
+    student_map = {}  # For efficient lookups during assignment
+    
+    for student in students:
+        student_data = {
+            'id': student.id,
+            'name': student.name,
+            'archetype': student.archetype,
+            'core_strength': student.core_strength,
+            'hidden_potential': student.hidden_potential,
+            'conversation_catalyst': student.conversation_catalyst,
+        }
+        # Raw answers and demographics for the local engines (not sent to the AI)
+        student_data['country'] = student.country
+        student_data['gender'] = student.gender
+        for i in range(1, 7):
+            student_data[f'question{i}'] = getattr(student, f'question{i}')
+            student_data[f'question{i}_jp'] = getattr(student, f'question{i}_jp')
+        students_data.append(student_data)
+        student_map[student.id] = student
+    
+    logging.info(f"Sending {len(students_data)} students to AI for intelligent grouping")
+    
+    # Step 3: Send to AI for intelligent squad formation with Japanese names
+    formation_mode = resolve_formation_mode(payload.get('mode'), len(students_data), app.config)
+    logging.info(f"Squad formation mode: {formation_mode}")
+    job.report('forming', force=True, mode=formation_mode, students_total=len(students_data))
     try:
-        # Step 1: Clean slate - Reset all existing squad assignments
-        # First unassign all students from squads
-        db.session.execute(db.text("UPDATE students SET squad_id = NULL"))
-        # Then delete all squads
-        Squad.query.delete()
-        db.session.commit()
-        
-        # Step 2: Fetch all unassigned student submissions from database
-        unassigned_students = Student.query.filter_by(squad_id=None).all()
-        
-        if len(unassigned_students) < 3:
-            return redirect(url_for('teacher'))
-        
-        # Step 3: Prepare student data with their pre-analyzed personality signatures for AI analysis
-        students_data = []
-        student_map = {}  # For efficient lookups during assignment
-        
-        for student in unassigned_students:
-            student_data = {
-                'id': student.id,
-                'name': student.name,
-                'archetype': student.archetype,
-                'core_strength': student.core_strength,
-                'hidden_potential': student.hidden_potential,
-                'conversation_catalyst': student.conversation_catalyst,
-            }
-            students_data.append(student_data)
-            student_map[student.id] = student
-        
-        logging.info(f"Sending {len(students_data)} students to AI for intelligent grouping")
-        
-        # Step 4: Send to AI for intelligent squad formation with Japanese names
-        try:
-            from openai_integration import group_students_into_squads
+        from openai_integration import group_students_into_squads, generate_squad_identity
+        if formation_mode == 'local':
+            # No API call: cluster students by the similarity of their answers
+            ai_response = form_squads_locally(students_data)
+        elif formation_mode == 'hybrid':
+            # Local membership from signatures, one small concurrent AI call per squad for naming
+            ai_response = form_squads_hybrid(
+                students_data,
+                generate_squad_identity,
+                max_workers=app.config['SQUAD_NAMING_MAX_CONCURRENCY'],
+                progress=lambda named, total: job.report('naming', named, total, squads_named=named, squads_total=total)
+            )
+        elif formation_mode == 'hierarchical':
+            # Large cohorts: group pre-partitioned blocks with parallel AI calls
+            ai_response = form_squads_hierarchical(
+                students_data,
+                group_students_into_squads,
+                form_squads_locally,
+                block_size=app.config['SQUAD_BLOCK_SIZE'],
+                max_workers=app.config['SQUAD_FORMATION_MAX_CONCURRENCY'],
+                progress=lambda grouped, total: job.report('forming', grouped, total, blocks_grouped=grouped, blocks_total=total)
+            )
+        else:
             # Add timeout handling for AI request
             logging.info("🤖 Calling AI for squad formation...")
             ai_response = group_students_into_squads(students_data)
-            logging.info("🎯 AI squad formation completed successfully")
-            logging.info(f"AI Response: {ai_response}")
-        except Exception as ai_error:
-            logging.error(f"❌ AI squad formation failed: {str(ai_error)}")
-            # Create a simple fallback grouping in Japanese style
-            logging.info("🔄 Using fallback Japanese squad creation...")
+        logging.info("🎯 AI squad formation completed successfully")
+        logging.info(f"AI Response: {ai_response}")
+    except Exception as ai_error:
+        logging.error(f"❌ AI squad formation failed: {str(ai_error)}")
+        # Fall back to local similarity clustering, and to simple chunking if even that fails
+        logging.info("🔄 Using local squad formation fallback...")
+        try:
+            ai_response = form_squads_locally(students_data)
+        except Exception as local_error:
+            logging.error(f"❌ Local squad formation failed: {str(local_error)}")
             ai_response = create_simple_japanese_squads(students_data)
-            logging.info(f"Fallback Response: {ai_response}")
-        
-        # Step 5: Parse AI response and validate structure
-        if not isinstance(ai_response, dict) or 'squads' not in ai_response:
-            raise ValueError("Invalid AI response format - expected dict with 'squads' key")
-        
-        squads_created = 0
-        
-        # Step 6: Process each AI-suggested squad and save to database
-        for i, squad_data in enumerate(ai_response['squads'], 1):
-            # Validate squad structure
-            required_keys = ['squad_name', 'shared_interests', 'member_ids']
-            if not all(key in squad_data for key in required_keys):
-                logging.warning(f"Skipping squad with missing keys: {squad_data}")
-                continue
-            
-            # Create new squad record with creative name and shared interests
-            new_squad = Squad()
-            new_squad.squad_rank = i
-            new_squad.name = squad_data['squad_name']
-            new_squad.shared_interests = squad_data['shared_interests']
-            new_squad.squad_icon = assign_squad_icon(squad_data['squad_name'])
-            db.session.add(new_squad)
-            db.session.flush()  # Get the squad ID for student assignments
-            
-            # Assign students to this squad
-            members_assigned = 0
-            for student_id in squad_data['member_ids']:
-                if student_id in student_map:
-                    student = student_map[student_id]
-                    student.squad_id = new_squad.id
-                    members_assigned += 1
-                    logging.info(f"Assigned {student.name} to squad '{squad_data['squad_name']}'")
-                else:
-                    logging.warning(f"Student ID {student_id} not found in database")
-            
-            if members_assigned > 0:
-                squads_created += 1
-                logging.info(f"Created squad '{squad_data['squad_name']}' with {members_assigned} members")
-            else:
-                # Remove empty squads
-                db.session.delete(new_squad)
-        
-        # Step 7: Orphan Adoption - Add unassigned students to existing squads
-        logging.info("🔍 Checking for unassigned students...")
-        
-        # Get all student IDs that were successfully assigned to squads by AI
-        assigned_student_ids = set()
-        for student in Student.query.all():
-            if student.squad_id is not None:
-                assigned_student_ids.add(student.id)
-        
-        # Get all student IDs that should have been assigned
-        all_student_ids = set(student_map.keys())
-        
-        # Find students that were missed by AI
-        unassigned_students = all_student_ids - assigned_student_ids
-        
-        if unassigned_students:
-            logging.warning(f"🚨 Found {len(unassigned_students)} unassigned students: {unassigned_students}")
-            
-            # Orphan Adoption Algorithm - Add each orphan to the smallest existing squad
-            for student_id in unassigned_students:
-                student = student_map[student_id]
-                
-                # Find the squad with the fewest members
-                squads_with_counts = db.session.query(
-                    Squad,
-                    db.func.count(Student.id).label('member_count')
-                ).outerjoin(Student, Squad.id == Student.squad_id).group_by(Squad.id).all()
-                
-                if squads_with_counts:
-                    # Find the squad with minimum members
-                    best_squad, min_count = min(squads_with_counts, key=lambda x: x.member_count)
-                    
-                    # Add the orphan to this squad
-                    student.squad_id = best_squad.id
-                    
-                    logging.info(f"✅ Adopted {student.name} (ID: {student_id}) into squad '{best_squad.name}' (was {min_count} members)")
-                else:
-                    logging.error(f"❌ No existing squads found to adopt {student.name}")
-        else:
-            logging.info("✅ All students successfully assigned to squads by AI")
-        
-        # Step 8: Commit all changes to database
-        logging.info(f"💾 Committing {squads_created} squads to database...")
-        db.session.commit()
-        logging.info("✅ Database commit successful!")
-        
-        if squads_created > 0:
-            logging.info(f"🎉 Squad formation complete: {squads_created} squads created")
-        else:
-            logging.warning("⚠️ No squads were created!")
-        
-    except Exception as e:
-        db.session.rollback()
-        logging.error(f"Error during squad formation: {str(e)}")
-    
-    return redirect(url_for('teacher'))
-
-
-
-
-
-
+        logging.info(f"Fallback Response: {ai_response}")
+    
+    # Nothing has been written yet - a cancelled job stops here and keeps the current squads
+    job.check_cancelled()
+    
+    # Step 4: Parse AI response and validate structure
+    if not isinstance(ai_response, dict) or 'squads' not in ai_response:
+        raise ValueError("Invalid AI response format - expected dict with 'squads' key")
+    
+    # Step 5: Repair duplicates, unknown IDs, missed students and size violations in memory
+    squads_data = repair_partition(ai_response['squads'], list(student_map))
+    
+    # Optional post-pass: rebalance squads for country/gender mix while keeping similar students together
+    if payload.get('optimize') or app.config['SQUAD_OPTIMIZE_DIVERSITY']:
+        job.report('optimizing', force=True)
+        squads_data = optimize_squads(squads_data, students_data, iterations=app.config['SQUAD_OPTIMIZER_ITERATIONS'])
+    
+    job.check_cancelled()
+    job.report('saving', force=True, squads_total=len(squads_data))
+    
+    # Step 6: Clean slate - reset all existing squad assignments in the same transaction as the new squads
+    db.session.execute(db.text("UPDATE students SET squad_id = NULL"))
+    Squad.query.delete()
+    record_reset()  # Dashboards reload instead of replaying a wholesale change
+    
+    # Step 7: Save all squads with one flush, then assign every student in one bulk update
+    new_squads = []
+    for i, squad_data in enumerate(squads_data, 1):
+        new_squad = Squad()
+        new_squad.squad_rank = i
+        new_squad.name = squad_data['squad_name']
+        new_squad.shared_interests = squad_data['shared_interests']
+        new_squad.squad_icon = assign_squad_icon(squad_data['squad_name'])
+        new_squads.append(new_squad)
+    db.session.add_all(new_squads)
+    db.session.flush()  # Get the squad IDs for student assignments
+    
+    assignments = [
+        {'id': student_id, 'squad_id': new_squad.id}
+        for new_squad, squad_data in zip(new_squads, squads_data)
+        for student_id in squad_data['member_ids']
+    ]
+    if assignments:
+        db.session.execute(db.update(Student), assignments)
+        record_changes('student', [assignment['id'] for assignment in assignments])
+    # Squad hubs are opened by every member at once - materialize them now
+    save_snapshots(new_squads)
+    # The squads now reflect this cohort - the pipeline reports them stale once it changes
+    record_clustering(students)
+    squads_created = len(new_squads)
+    logging.info(f"Assigned {len(assignments)} students to {squads_created} squads")
+    
+    # Step 8: Commit all changes to database
+    logging.info(f"💾 Committing {squads_created} squads to database...")
+    db.session.commit()
+    logging.info("✅ Database commit successful!")
+    
+    if squads_created > 0:
+        logging.info(f"🎉 Squad formation complete: {squads_created} squads created")
+    else:
+        logging.warning("⚠️ No squads were created!")
+    # N squads created
+    job.report('done', force=True, squads_created=squads_created, message=f"🎉 {squads_created}個のスクワッドを作成しました！", category="success")
 
+# Long-running teacher operations, run as tracked background jobs
+TEACHER_JOB_KINDS = ('create_squads', 'analysis')
+job_queue.register('create_squads', run_create_squads_job, tracked=True, priority=app.config['JOB_PRIORITIES']['create_squads'], max_running=1)
+job_queue.register('analysis', run_analysis_job, tracked=True, priority=app.config['JOB_PRIORITIES']['analysis'], max_running=1)
 
 def generate_squad_icebreaker_with_ai(member_data, squad_name):
     """
@@ -1291,6 +1250,7 @@ def clear_squads():
         
         # Step 3: Delete all squad records
         Squad.query.delete()
+        record_reset()  # Dashboards reload instead of replaying a wholesale change
         
         # Commit all changes
         db.session.commit()
@@ -1339,6 +1299,8 @@ def generate_icebreaker(squad_id):
         # Save the icebreaker to the database
         squad.icebreaker_text = icebreaker_text
         db.session.commit()
+        save_snapshots([squad])
+        db.session.commit()
         
         logging.info(f"Generated icebreaker for squad {squad.name} (ID: {squad_id})")
         
@@ -1381,288 +1343,13 @@ def get_ai_advice(student_id):
     
     return redirect(url_for('teacher'))
 
-def get_interest_categories_with_colors(vibes_text):
-    """Extract interest categories and assign colors for visualization"""
-    vibes_lower = vibes_text.lower()
-    
-    # Define interest categories with colors and keywords
-    interest_categories = {
-        'Gaming': {
-            'keywords': ['game', 'gaming', 'games', 'video games', 'gamer', 'esports', 'pc', 'console', 'minecraft', 'fortnite'],
-            'color': '#E91E63',  # Pink
-            'icon': 'fas fa-gamepad'
-        },
-        'Music': {
-            'keywords': ['music', 'musical', 'musician', 'singing', 'guitar', 'piano', 'song', 'instrument', 'band'],
-            'color': '#9C27B0',  # Purple
-            'icon': 'fas fa-music'
-        },
-        'Art & Design': {
-            'keywords': ['art', 'drawing', 'painting', 'creative', 'design', 'sketch', 'photography', 'photo'],
-            'color': '#FF9800',  # Orange
-            'icon': 'fas fa-palette'
-        },
-        'Technology': {
-            'keywords': ['technology', 'tech', 'programming', 'coding', 'computer', 'software', 'app'],
-            'color': '#2196F3',  # Blue
-            'icon': 'fas fa-code'
-        },
-        'Sports': {
-            'keywords': ['sport', 'sports', 'football', 'basketball', 'soccer', 'tennis', 'athletic', 'fitness', 'gym'],
-            'color': '#4CAF50',  # Green
-            'icon': 'fas fa-running'
-        },
-        'Anime & Manga': {
-            'keywords': ['anime', 'manga', 'cosplay', 'otaku', 'japanese', 'japan'],
-            'color': '#FF5722',  # Deep Orange
-            'icon': 'fas fa-star'
-        },
-        'Adventure': {
-            'keywords': ['travel', 'traveling', 'adventure', 'explore', 'trip', 'nature', 'outdoor', 'hiking', 'camping'],
-            'color': '#795548',  # Brown
-            'icon': 'fas fa-mountain'
-        },
-        'Reading': {
-            'keywords': ['reading', 'books', 'literature', 'novel', 'story', 'study', 'academic'],
-            'color': '#607D8B',  # Blue Grey
-            'icon': 'fas fa-book'
-        },
-        'Food': {
-            'keywords': ['food', 'cooking', 'baking', 'cuisine', 'restaurant', 'eat', 'chef'],
-            'color': '#FF9800',  # Amber
-            'icon': 'fas fa-utensils'
-        },
-        'Movies & TV': {
-            'keywords': ['movie', 'film', 'cinema', 'netflix', 'watch', 'tv', 'series'],
-            'color': '#673AB7',  # Deep Purple
-            'icon': 'fas fa-film'
-        },
-        'Dance': {
-            'keywords': ['dance', 'dancing', 'ballet', 'hip hop', 'choreography'],
-            'color': '#E91E63',  # Pink
-            'icon': 'fas fa-music'
-        },
-        'Social': {
-            'keywords': ['friends', 'social', 'party', 'people', 'community', 'group'],
-            'color': '#FFEB3B',  # Yellow
-            'icon': 'fas fa-users'
-        }
-    }
-    
-    # Find matching categories
-    found_interests = []
-    for category, data in interest_categories.items():
-        matches = sum(1 for keyword in data['keywords'] if keyword in vibes_lower)
-        if matches > 0:
-            found_interests.append({
-                'name': category,
-                'color': data['color'],
-                'icon': data['icon'],
-                'intensity': min(matches / len(data['keywords']) * 2, 1.0),  # Normalize intensity
-                'match_count': matches
-            })
-    
-    # Sort by match count (highest first)
-    found_interests.sort(key=lambda x: x['match_count'], reverse=True)
-    
-    return found_interests[:4]  # Return top 4 interests
-
-def get_creative_vibe_archetype(student):
-    """Determine student's creative vibe archetype based on mystery generator answers"""
-    # Handle both new format and legacy format
-    if hasattr(student, 'question1') and student.question1:
-        combined_text = ' '.join([
-            student.question1 or '',
-            student.question2 or '',
-            student.question3 or '',
-            student.question4 or '',
-            student.question5 or '',
-            student.question6 or '',
-
-        ]).lower()
-    else:
-        # Fallback to legacy vibes field
-        combined_text = (student.vibes or '').lower()
-    
-    # Creative archetype detection with meme-worthy titles
-    creative_archetypes = {
-        'Midnight Philosopher': {
-            'keywords': ['thinking', 'deep', 'philosophy', 'existential', 'meaning', 'life', 'questions', 'universe', 'wondering', 'pondering', 'reflect'],
-            'icon': 'fas fa-moon',
-            'description': 'Deep thinker who ponders life\'s mysteries'
-        },
-        'Certified Meme Historian': {
-            'keywords': ['memes', 'funny', 'internet', 'viral', 'tiktok', 'instagram', 'social media', 'trends', 'jokes', 'humor', 'laugh'],
-            'icon': 'fas fa-laugh-squint',
-            'description': 'Master of internet culture and digital humor'
-        },
-        'Low-Key Genius': {
-            'keywords': ['smart', 'coding', 'programming', 'math', 'science', 'learning', 'studying', 'tech', 'computer', 'solving', 'intelligent'],
-            'icon': 'fas fa-brain',
-            'description': 'Brilliant mind hiding behind casual vibes'
-        },
-        'Chaos Coordinator': {
-            'keywords': ['random', 'chaos', 'unpredictable', 'spontaneous', 'weird', 'crazy', 'wild', 'energy', 'hyperactive', 'chaotic'],
-            'icon': 'fas fa-bolt',
-            'description': 'Thrives in beautiful chaos and spontaneity'
-        },
-        'Vibe Curator': {
-            'keywords': ['music', 'playlist', 'aesthetic', 'vibes', 'mood', 'atmosphere', 'chill', 'lofi', 'beats', 'spotify', 'sound'],
-            'icon': 'fas fa-headphones',
-            'description': 'Creates the perfect atmosphere for any moment'
-        },
-        'Digital Nomad': {
-            'keywords': ['gaming', 'online', 'virtual', 'digital', 'streaming', 'twitch', 'discord', 'pc', 'console', 'esports', 'game'],
-            'icon': 'fas fa-gamepad',
-            'description': 'Lives and breathes in digital realms'
-        },
-        'Snack Connoisseur': {
-            'keywords': ['food', 'eating', 'snacks', 'cooking', 'restaurant', 'hungry', 'delicious', 'taste', 'cuisine', 'baking', 'cook'],
-            'icon': 'fas fa-cookie-bite',
-            'description': 'Finds joy in culinary adventures and treats'
-        },
-        'Plot Twist Enthusiast': {
-            'keywords': ['movies', 'series', 'shows', 'netflix', 'anime', 'drama', 'story', 'plot', 'character', 'binge', 'watch'],
-            'icon': 'fas fa-film',
-            'description': 'Lives for compelling stories and epic narratives'
-        },
-        'Energy Drink Personified': {
-            'keywords': ['energy', 'hyper', 'active', 'sports', 'running', 'gym', 'fitness', 'workout', 'adrenaline', 'intense', 'fast'],
-            'icon': 'fas fa-fire',
-            'description': 'Pure kinetic energy in human form'
-        },
-        'Professional Procrastinator': {
-            'keywords': ['sleep', 'lazy', 'procrastinate', 'later', 'tomorrow', 'bed', 'nap', 'chill', 'relaxing', 'nothing', 'rest'],
-            'icon': 'fas fa-bed',
-            'description': 'Masters the art of strategic delay'
-        },
-        'Social Algorithm': {
-            'keywords': ['friends', 'social', 'people', 'party', 'talking', 'hanging out', 'group', 'together', 'communication', 'connect'],
-            'icon': 'fas fa-users',
-            'description': 'Naturally connects people and builds communities'
-        },
-        'Creative Hurricane': {
-            'keywords': ['art', 'drawing', 'creative', 'design', 'painting', 'craft', 'making', 'building', 'creating', 'imagination', 'artistic'],
-            'icon': 'fas fa-palette',
-            'description': 'Creates beauty from pure imagination'
-        },
-        'Adventure Architect': {
-            'keywords': ['adventure', 'explore', 'travel', 'discovery', 'journey', 'new', 'experience', 'outdoor', 'hiking', 'nature'],
-            'icon': 'fas fa-compass',
-            'description': 'Builds epic quests from everyday moments'
-        },
-        'Zen Master': {
-            'keywords': ['calm', 'peaceful', 'meditation', 'nature', 'quiet', 'serene', 'balance', 'mindful', 'tranquil', 'peace'],
-            'icon': 'fas fa-leaf',
-            'description': 'Brings inner peace to chaotic worlds'
-        }
-    }
-    
-    # Calculate scores for each archetype
-    archetype_scores = {}
-    for archetype_name, archetype_data in creative_archetypes.items():
-        score = sum(1 for keyword in archetype_data['keywords'] if keyword in combined_text)
-        if score > 0:
-            archetype_scores[archetype_name] = score
-    
-    # Return the highest scoring archetype or default
-    if archetype_scores:
-        best_archetype = max(archetype_scores, key=archetype_scores.get)
-        return {
-            'name': best_archetype,
-            'icon': creative_archetypes[best_archetype]['icon'],
-            'description': creative_archetypes[best_archetype]['description']
-        }
-    else:
-        return {
-            'name': 'Mysterious Entity',
-            'icon': 'fas fa-star',
-            'description': 'A unique presence that defies categorization'
-        }
-
-# Legacy function for backward compatibility
-def get_vibe_archetype(vibes_text):
-    """Legacy function - returns archetype name only"""
-    class FakeStudent:
-        def __init__(self, vibes):
-            self.vibes = vibes
-            self.question1 = None
-    
-    result = get_creative_vibe_archetype(FakeStudent(vibes_text))
-    return result['name']
-
-def get_core_sparks(vibes_text):
-    """Extract core interests as hashtags with Japanese translations"""
-    vibes_lower = vibes_text.lower()
-    
-    # Define keywords with Japanese translations
-    spark_translations = {
-        'gaming': 'ゲーム',
-        'music': '音楽',
-        'art': 'アート',
-        'travel': '旅行',
-        'sports': 'スポーツ',
-        'technology': 'テクノロジー',
-        'reading': '読書',
-        'food': '食べ物',
-        'movies': '映画',
-        'anime': 'アニメ',
-        'dance': 'ダンス',
-        'photography': '写真',
-        'fitness': 'フィットネス',
-        'nature': '自然',
-        'creative': '創造的',
-        'adventure': '冒険'
-    }
-    
-    # Enhanced keyword mapping
-    keyword_mapping = {
-        'game': 'gaming', 'games': 'gaming', 'gamer': 'gaming', 'video games': 'gaming',
-        'musical': 'music', 'musician': 'music', 'singing': 'music', 'song': 'music',
-        'drawing': 'art', 'painting': 'art', 'design': 'art', 'sketch': 'art',
-        'traveling': 'travel', 'trip': 'travel', 'explore': 'travel',
-        'sport': 'sports', 'athletic': 'sports', 'football': 'sports', 'basketball': 'sports',
-        'tech': 'technology', 'programming': 'technology', 'coding': 'technology',
-        'books': 'reading', 'novel': 'reading', 'literature': 'reading',
-        'cooking': 'food', 'baking': 'food', 'cuisine': 'food',
-        'movie': 'movies', 'film': 'movies', 'cinema': 'movies',
-        'manga': 'anime', 'cosplay': 'anime',
-        'dancing': 'dance', 'ballet': 'dance',
-        'photo': 'photography', 'camera': 'photography',
-        'gym': 'fitness', 'workout': 'fitness', 'exercise': 'fitness',
-        'outdoor': 'nature', 'hiking': 'nature', 'camping': 'nature',
-        'design': 'creative', 'artist': 'creative'
-    }
-    
-    found_sparks = set()
-    
-    # Check for direct matches
-    for spark in spark_translations.keys():
-        if spark in vibes_lower:
-            found_sparks.add(spark)
-    
-    # Check for mapped keywords
-    for keyword, spark in keyword_mapping.items():
-        if keyword in vibes_lower:
-            found_sparks.add(spark)
-    
-    # Convert to hashtag format with translations
-    sparks = []
-    for spark in sorted(found_sparks)[:4]:  # Limit to 4 main sparks
-        japanese = spark_translations.get(spark, '？')
-        sparks.append(f'#{spark} ({japanese})')
-    
-    return sparks if sparks else ['#unique (ユニーク)']
-
-
-
 @app.route('/recommendations/<int:student_id>')
 def student_recommendations(student_id):
     """Display AI-powered recommendations for a specific student"""
     student = Student.query.get_or_404(student_id)
     
     # Use basic archetype and fallback recommendations to avoid API timeout issues
-    archetype = get_vibe_archetype(student.vibes)
+    archetype = get_student_tags(student)['vibe_archetype']
     
     # Create fallback recommendations based on archetype
     recommendations = {
@@ -1714,21 +1401,26 @@ def student_recommendations(student_id):
                          recommendations=recommendations,
                          enhanced_profile=enhanced_profile)
 
-@app.route('/teacher/ai-insights')
-def teacher_ai_insights():
-    """Teacher page with AI-powered insights about students and squad formation"""
-    if not session.get('teacher_authenticated'):
-        return redirect(url_for('teacher_login'))
+def build_compatibility_page(page, per_page):
+    """
+    Compatibility data for one page of students: their profiles and top partners,
+    read from the persisted compatibility index
+    """
+    ensure_indexed(get_vibe_archetype, app.config['COMPATIBILITY_TOP_K'])
     
-    students = Student.query.all()
+    total = Student.query.count()
+    page, pages, start, end = paginate(total, page, per_page)
+    students = Student.query.order_by(Student.id).offset(start).limit(end - start).all()
+    index_entries = get_index_entries([student.id for student in students])
     
-    if len(students) < 2:
-        return redirect(url_for('teacher'))
+    partner_ids = {partner_id for entry in index_entries.values() for partner_id, _ in entry['neighbors']}
+    partners = {student.id: student for student in Student.query.filter(Student.id.in_(partner_ids)).all()}
+    index_entries.update(get_index_entries(partner_ids - set(index_entries)))
     
-    # Generate profiles for all students using fallback to avoid API timeouts
     student_profiles = []
+    compatibility_matrix = []
     for student in students:
-        archetype = get_vibe_archetype(student.vibes)
+        archetype = index_entries[student.id]['archetype']
         student_profiles.append({
             'student': student,
             'profile': {
@@ -1743,48 +1435,76 @@ def teacher_ai_insights():
             },
             'basic_archetype': archetype
         })
-    
-    # Analyze compatibility between students using keyword matching
-    compatibility_matrix = []
-    for i, profile1 in enumerate(student_profiles):
-        for j, profile2 in enumerate(student_profiles[i+1:], i+1):
-            # Basic compatibility based on shared keywords and archetypes
-            vibes1 = set(profile1['student'].vibes.lower().split())
-            vibes2 = set(profile2['student'].vibes.lower().split())
-            shared_words = vibes1.intersection(vibes2)
-            
-            # Calculate compatibility score
-            base_score = min(0.9, len(shared_words) * 0.15)
-            archetype_bonus = 0.2 if profile1['basic_archetype'] == profile2['basic_archetype'] else 0.0
-            compatibility_score = min(0.95, base_score + archetype_bonus)
-            
-            # Determine shared interests from common keywords
-            interest_keywords = ['game', 'music', 'art', 'sport', 'food', 'travel', 'tech', 'read', 'movie', 'dance']
-            shared_interests = []
-            for keyword in interest_keywords:
-                if any(keyword in word for word in shared_words):
-                    shared_interests.append(keyword)
-            
-            if not shared_interests and shared_words:
-                shared_interests = list(shared_words)[:3]
-            elif not shared_interests:
-                shared_interests = ['communication', 'teamwork']
-            
+        words = vibe_words(student.vibes or student.get_combined_answers())
+        for partner_id, score in index_entries[student.id]['neighbors']:
+            partner = partners.get(partner_id)
+            if partner is None:
+                continue  # Deleted since it was indexed
             compatibility_matrix.append({
-                'student1': profile1['student'],
-                'student2': profile2['student'],
-                'compatibility': {
-                    'compatibility_score': compatibility_score,
-                    'shared_interests': shared_interests[:3],
-                    'complementary_aspects': f'{profile1["basic_archetype"]} and {profile2["basic_archetype"]} perspectives combine well',
-                    'collaboration_potential': f'Strong collaboration potential with {compatibility_score:.0%} compatibility',
-                    'potential_conflicts': 'None identified'
-                }
+                'student1': student,
+                'student2': partner,
+                'compatibility': describe_pair(words, vibe_words(partner.vibes or partner.get_combined_answers()),
+                                               archetype, index_entries[partner_id]['archetype'], score)
             })
     
-    return render_template('ai_insights.html', 
-                         student_profiles=student_profiles,
-                         compatibility_matrix=compatibility_matrix)
+    return {
+        'page': page,
+        'pages': pages,
+        'per_page': per_page,
+        'total': total,
+        'student_profiles': student_profiles,
+        'compatibility_matrix': compatibility_matrix,
+    }
+
+@app.route('/teacher/ai-insights')
+def teacher_ai_insights():
+    """Teacher page with AI-powered insights about students and squad formation"""
+    if not session.get('teacher_authenticated'):
+        return redirect(url_for('teacher_login'))
+    
+    if Student.query.count() < 2:
+        return redirect(url_for('teacher'))
+    
+    insights = build_compatibility_page(
+        request.args.get('page', 1, type=int),
+        app.config['COMPATIBILITY_PAGE_SIZE']
+    )
+    
+    return render_template('ai_insights.html', **insights)
+
+@app.route('/teacher/api/compatibility')
+def teacher_compatibility_api():
+    """Paginated JSON version of the compatibility insights"""
+    if not session.get('teacher_authenticated'):
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    
+    per_page = min(max(1, request.args.get('per_page', app.config['COMPATIBILITY_PAGE_SIZE'], type=int)), 100)
+    insights = build_compatibility_page(request.args.get('page', 1, type=int), per_page)
+    
+    partners_by_student = defaultdict(list)
+    for pair in insights['compatibility_matrix']:
+        partners_by_student[pair['student1'].id].append({
+            'id': pair['student2'].id,
+            'name': pair['student2'].name,
+            'compatibility_score': round(pair['compatibility']['compatibility_score'], 2),
+            'shared_interests': pair['compatibility']['shared_interests'],
+        })
+    
+    return jsonify({
+        'page': insights['page'],
+        'pages': insights['pages'],
+        'per_page': insights['per_page'],
+        'total': insights['total'],
+        'students': [
+            {
+                'id': profile['student'].id,
+                'name': profile['student'].name,
+                'archetype': profile['basic_archetype'],
+                'partners': partners_by_student[profile['student'].id],
+            }
+            for profile in insights['student_profiles']
+        ]
+    })
 
 @app.route('/reset-database')
 def reset_database():
@@ -1798,6 +1518,7 @@ def reset_database():
         
         # Delete all session settings
         SessionSettings.query.delete()
+        record_reset()  # Dashboards reload instead of replaying a wholesale change
         
         # Commit the changes
         db.session.commit()
@@ -1820,6 +1541,7 @@ def seed_database():
         # Delete students first to avoid foreign key constraint violation
         Student.query.delete()
         Squad.query.delete()
+        record_reset()  # Dashboards reload instead of replaying a wholesale change
         db.session.commit()
         
         # Realistic Gen Z names from Japan, Vietnam, and China
@@ -2140,6 +1862,8 @@ def seed_database():
             
             # Add to database session
             db.session.add(student)
+            db.session.flush()
+            save_student_tags(student)
         
         # Commit all students to database
         db.session.commit()
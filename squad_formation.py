@@ -0,0 +1,503 @@
+"""
+Squad formation strategies used by /teacher/create-squads
+"""
+
+import heapq
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from flask import current_app, has_app_context
+
+from text_vectors import CJK_PATTERN, normalize_rows, student_text, tfidf_matrix
+
+MIN_SQUAD_SIZE = 3
+MAX_SQUAD_SIZE = 5
+TARGET_SQUAD_SIZE = 4
+
+FORMATION_MODES = ['auto', 'ai', 'hierarchical', 'local', 'hybrid']
+
+SIGNATURE_TEXT_FIELDS = ['archetype', 'core_strength', 'hidden_potential', 'conversation_catalyst']
+
+LOCAL_SQUAD_NAMES = [
+    "チームハーモニー",  # Team Harmony
+    "クリエイティブスピリッツ",  # Creative Spirits
+    "アドベンチャーフレンズ",  # Adventure Friends
+    "ドリームチェイサーズ",  # Dream Chasers
+    "フューチャースターズ",  # Future Stars
+    "ユニティーパワー",  # Unity Power
+    "スターライトクルー",  # Starlight Crew
+    "サンライズトライブ",  # Sunrise Tribe
+]
+
+
+def resolve_formation_mode(requested_mode, student_count, config):
+    """
+    Pick the formation mode for this run. 'auto' sends small classes to a single AI call
+    and switches to hierarchical formation once the class outgrows one prompt;
+    'local' forms squads from answer similarity without any API call, and 'hybrid'
+    clusters signatures locally and only uses the AI to name each squad.
+    """
+    mode = requested_mode if requested_mode in FORMATION_MODES else config['SQUAD_FORMATION_MODE']
+    if mode == 'auto':
+        mode = 'hierarchical' if student_count > config['SQUAD_HIERARCHICAL_THRESHOLD'] else 'ai'
+    return mode
+
+
+def split_into_blocks(students_data, block_size):
+    """
+    Pre-partition students locally into blocks of at most block_size.
+    Students are ordered by archetype first so similar signatures tend to share a block,
+    and block sizes differ by at most one so no block is left with a tiny remainder.
+    """
+    ordered = sorted(students_data, key=lambda student: (student.get('archetype') or '', student['id']))
+    block_count = max(1, math.ceil(len(ordered) / block_size))
+    base_size, remainder = divmod(len(ordered), block_count)
+
+    blocks = []
+    start = 0
+    for i in range(block_count):
+        size = base_size + (1 if i < remainder else 0)
+        blocks.append(ordered[start:start + size])
+        start += size
+    return blocks
+
+
+def _valid_squads(squads):
+    """Squads that have every key create_squads needs, with member_ids as a list"""
+    valid = []
+    for squad in squads or []:
+        if not isinstance(squad, dict) or not all(key in squad for key in ['squad_name', 'shared_interests', 'member_ids']):
+            logging.warning(f"Skipping squad with missing keys: {squad}")
+            continue
+        if not isinstance(squad['member_ids'], list):
+            logging.warning(f"Skipping squad with invalid member_ids: {squad}")
+            continue
+        valid.append(squad)
+    return valid
+
+
+def repair_partition(squads, student_ids, taken_names=(), min_size=MIN_SQUAD_SIZE, max_size=MAX_SQUAD_SIZE):
+    """
+    Turn a proposed partition (e.g. the AI's squads) into a valid one entirely in memory,
+    moving as few students as possible:
+    - duplicate IDs keep their first squad, unknown IDs are dropped, empty squads disappear
+    - members beyond max_size and students missing from every squad become unplaced
+    - undersized squads are topped up from the unplaced students, then from squads above min_size;
+      only if that cannot cover them is the smallest undersized squad dissolved
+    - the remaining unplaced students go to the smallest squads with room (min-heap by size);
+      any left over when every squad is full form new squads (borrowing from the largest squads
+      to reach min_size), and only overflow into existing squads when nothing can be borrowed
+    Returns the repaired squads in the same format.
+    """
+    known_ids = set(student_ids)
+    seen = set()
+    repaired = []
+    unplaced = []
+    stats = {'duplicates': 0, 'unknown': 0, 'trimmed': 0, 'missing': 0, 'dissolved': 0, 'donated': 0}
+
+    for squad in _valid_squads(squads):
+        members = []
+        for student_id in squad['member_ids']:
+            if student_id not in known_ids:
+                stats['unknown'] += 1
+            elif student_id in seen:
+                stats['duplicates'] += 1
+            else:
+                seen.add(student_id)
+                members.append(student_id)
+        stats['trimmed'] += len(members[max_size:])
+        unplaced.extend(members[max_size:])
+        if members:
+            repaired.append(dict(squad, member_ids=members[:max_size]))
+
+    missing = [student_id for student_id in student_ids if student_id not in seen]
+    stats['missing'] = len(missing)
+    unplaced.extend(missing)
+
+    # Dissolve the smallest undersized squads until the rest can be brought up to size
+    while len(repaired) > 1:
+        undersized = [squad for squad in repaired if len(squad['member_ids']) < min_size]
+        if not undersized:
+            break
+        needed = sum(min_size - len(squad['member_ids']) for squad in undersized)
+        spare = len(unplaced) + sum(len(squad['member_ids']) - min_size for squad in repaired if len(squad['member_ids']) > min_size)
+        if spare >= needed:
+            break
+        smallest = min(undersized, key=lambda squad: len(squad['member_ids']))
+        repaired.remove(smallest)
+        unplaced.extend(smallest['member_ids'])
+        stats['dissolved'] += 1
+
+    # Top up undersized squads: unplaced students first, then members of the largest squads
+    donors = [(-len(squad['member_ids']), index) for index, squad in enumerate(repaired) if len(squad['member_ids']) > min_size]
+    heapq.heapify(donors)
+    for squad in repaired:
+        while len(squad['member_ids']) < min_size and (unplaced or donors):
+            if unplaced:
+                squad['member_ids'].append(unplaced.pop(0))
+                continue
+            _, donor_index = heapq.heappop(donors)
+            donor = repaired[donor_index]
+            squad['member_ids'].append(donor['member_ids'].pop())
+            stats['donated'] += 1
+            if len(donor['member_ids']) > min_size:
+                heapq.heappush(donors, (-len(donor['member_ids']), donor_index))
+
+    # Place everyone else on the smallest squads with room
+    open_squads = [(len(squad['member_ids']), index) for index, squad in enumerate(repaired) if len(squad['member_ids']) < max_size]
+    heapq.heapify(open_squads)
+    leftovers = []
+    for student_id in unplaced:
+        if not open_squads:
+            leftovers.append(student_id)
+            continue
+        size, index = heapq.heappop(open_squads)
+        repaired[index]['member_ids'].append(student_id)
+        if size + 1 < max_size:
+            heapq.heappush(open_squads, (size + 1, index))
+
+    # Too few leftovers for a new squad: borrow members from the largest squads if they can spare them
+    spare = sum(len(squad['member_ids']) - min_size for squad in repaired if len(squad['member_ids']) > min_size)
+    if leftovers and len(leftovers) < min_size and spare >= min_size - len(leftovers):
+        while len(leftovers) < min_size:
+            donor = max(repaired, key=lambda squad: len(squad['member_ids']))
+            leftovers.append(donor['member_ids'].pop())
+            stats['donated'] += 1
+
+    if leftovers and (len(leftovers) >= min_size or not repaired):
+        names = _unused_names(len(leftovers), set(taken_names) | {squad['squad_name'] for squad in repaired})
+        start = 0
+        for squad_index, size in enumerate(plan_squad_sizes(len(leftovers), min_size, max_size)):
+            repaired.append({
+                'squad_name': names[squad_index],
+                'shared_interests': "様々な興味と個性を持つ多様なグループです",  # Diverse group with various interests and personalities
+                'member_ids': leftovers[start:start + size],
+            })
+            start += size
+    else:
+        for student_id in leftovers:
+            min(repaired, key=lambda squad: len(squad['member_ids']))['member_ids'].append(student_id)
+
+    if any(stats.values()):
+        logging.info(f"Repaired squad partition: {stats}")
+    return repaired
+
+
+def _form_block(app, block, group_fn, fallback_fn):
+    """Worker task: group one block with the AI, falling back locally if the call fails"""
+    try:
+        if app is not None:
+            # Worker threads need their own app context to use the shared LLM response cache
+            with app.app_context():
+                response = group_fn(block)
+        else:
+            response = group_fn(block)
+        if not isinstance(response, dict) or not isinstance(response.get('squads'), list):
+            raise ValueError("Invalid AI response format - expected dict with 'squads' key")
+    except Exception as e:
+        logging.error(f"❌ AI squad formation failed for a block of {len(block)} students: {str(e)}")
+        response = fallback_fn(block)
+
+    if not _valid_squads(response['squads']):
+        logging.warning(f"AI returned no usable squads for a block of {len(block)} students, using fallback")
+        response = fallback_fn(block)
+    return repair_partition(response['squads'], [student['id'] for student in block])
+
+
+def _map_with_progress(executor, fn, items, progress):
+    """executor.map that calls progress(done, total) as each item finishes, results kept in order"""
+    futures = [executor.submit(fn, item) for item in items]
+    if progress is not None:
+        for done, future in enumerate(as_completed(futures), 1):
+            progress(done, len(futures))
+    return [future.result() for future in futures]
+
+
+def form_squads_hierarchical(students_data, group_fn, fallback_fn, block_size=24, max_workers=4, progress=None):
+    """
+    Map-reduce squad formation for large cohorts.
+    Students are pre-partitioned locally into blocks, each block is grouped by its own AI call
+    in parallel, and the per-block squads are balanced and merged into one response
+    in the same {'squads': [...]} format as group_students_into_squads.
+    progress(blocks_done, block_count) is called as each block finishes.
+    """
+    blocks = split_into_blocks(students_data, block_size)
+    app = current_app._get_current_object() if has_app_context() else None
+    logging.info(f"Hierarchical squad formation: {len(students_data)} students in {len(blocks)} blocks")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(blocks))), thread_name_prefix='squad-block') as executor:
+        block_results = _map_with_progress(executor, lambda block: _form_block(app, block, group_fn, fallback_fn), blocks, progress)
+
+    squads = [squad for block_squads in block_results for squad in block_squads]
+    logging.info(f"Hierarchical squad formation produced {len(squads)} squads")
+    return {'squads': squads}
+
+
+def plan_squad_sizes(student_count, min_size=MIN_SQUAD_SIZE, max_size=MAX_SQUAD_SIZE, target_size=TARGET_SQUAD_SIZE):
+    """Split student_count into squad sizes as close to target_size as the size limits allow"""
+    if student_count <= 0:
+        return []
+    squad_count = max(1, round(student_count / target_size))
+    while squad_count > 1 and student_count / squad_count < min_size:
+        squad_count -= 1
+    while student_count / squad_count > max_size:
+        squad_count += 1
+    base_size, remainder = divmod(student_count, squad_count)
+    return [base_size + (1 if i < remainder else 0) for i in range(squad_count)]
+
+
+def _initial_centroids(vectors, squad_count):
+    """Deterministic farthest-point seeding, starting from the student closest to the cohort mean"""
+    gram = vectors @ vectors.T
+    chosen = [int(np.argmax(gram.sum(axis=1)))]
+    closest = gram[chosen[0]].copy()
+    closest[chosen[0]] = np.inf
+    for _ in range(1, squad_count):
+        next_index = int(np.argmin(closest))
+        chosen.append(next_index)
+        closest = np.maximum(closest, gram[next_index])
+        closest[chosen] = np.inf
+    return vectors[chosen]
+
+
+def _assign_with_capacity(similarity, capacity):
+    """
+    Assign every student to a squad without exceeding its capacity.
+    Each round, unplaced students propose to their most similar squad that still has room,
+    and every squad accepts its most similar proposers up to its remaining capacity.
+    Raises ValueError if the squads cannot hold every student (the rounds would never end).
+    """
+    student_count, squad_count = similarity.shape
+    assignment = np.full(student_count, -1, dtype=np.int64)
+    remaining = np.array(capacity, dtype=np.int64)
+    if len(remaining) != squad_count or remaining.clip(min=0).sum() < student_count:
+        raise ValueError(f"Squad capacity {remaining.clip(min=0).sum()} cannot hold {student_count} students")
+
+    while (assignment < 0).any():
+        unplaced = np.flatnonzero(assignment < 0)
+        scores = np.where(remaining > 0, similarity[unplaced], -np.inf)
+        choice = np.argmax(scores, axis=1)
+        score = scores[np.arange(len(unplaced)), choice]
+
+        order = np.lexsort((-score, choice))
+        sorted_choice = choice[order]
+        _, group_start = np.unique(sorted_choice, return_index=True)
+        group_offsets = np.zeros(squad_count, dtype=np.int64)
+        group_offsets[sorted_choice[group_start]] = group_start
+        rank = np.arange(len(order)) - group_offsets[sorted_choice]
+
+        accepted = rank < remaining[sorted_choice]
+        accepted_students = unplaced[order[accepted]]
+        assignment[accepted_students] = sorted_choice[accepted]
+        remaining -= np.bincount(sorted_choice[accepted], minlength=squad_count)
+
+    return assignment
+
+
+def balanced_clusters(vectors, sizes, max_iterations=10):
+    """
+    Size-constrained k-means on unit vectors: returns each row's cluster index,
+    with exactly sizes[k] rows in cluster k. Fully deterministic.
+    """
+    squad_count = len(sizes)
+    if squad_count == 1:
+        return np.zeros(len(vectors), dtype=np.int64)
+
+    centroids = _initial_centroids(vectors, squad_count)
+    assignment = None
+    for _ in range(max_iterations):
+        new_assignment = _assign_with_capacity(vectors @ centroids.T, sizes)
+        if assignment is not None and np.array_equal(new_assignment, assignment):
+            break
+        assignment = new_assignment
+        membership = np.zeros((squad_count, len(vectors)), dtype=vectors.dtype)
+        membership[assignment, np.arange(len(vectors))] = 1.0
+        sums = membership @ vectors
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+    return assignment
+
+
+def _shared_keywords(vectors, member_rows, feature_names, limit=3):
+    """Top features of a squad's centroid, weighted towards terms more than one member used"""
+    member_vectors = vectors[member_rows]
+    weight = member_vectors.sum(axis=0) * np.count_nonzero(member_vectors, axis=0)
+    keywords = []
+    for column in np.argsort(-weight, kind='stable')[:limit * 4]:
+        if weight[column] <= 0 or len(keywords) == limit:
+            break
+        keyword = feature_names.get(int(column))
+        # Whole words only - CJK character bigrams and word pairs read badly as keywords
+        if keyword and ' ' not in keyword and not CJK_PATTERN.search(keyword) and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords
+
+
+def _cluster_squads(students_data, texts_fn):
+    """
+    Cluster students into balanced squads by the similarity of the texts texts_fn returns for them.
+    Squads get a local placeholder name and keywords shared by their members.
+    """
+    ordered = sorted(students_data, key=lambda student: student['id'])
+    if not ordered:
+        return []
+
+    feature_names = {}
+    vectors = tfidf_matrix([texts_fn(student) for student in ordered], feature_names)
+    # Only columns some student actually uses matter; dropping the rest keeps the matrix small
+    used_columns = np.flatnonzero(vectors.any(axis=0))
+    vectors = vectors[:, used_columns]
+    feature_names = {index: feature_names[int(column)] for index, column in enumerate(used_columns)}
+    sizes = plan_squad_sizes(len(ordered))
+    assignment = balanced_clusters(vectors, sizes)
+
+    squads = []
+    for squad_index in range(len(sizes)):
+        member_rows = np.flatnonzero(assignment == squad_index)
+        keywords = _shared_keywords(vectors, member_rows, feature_names)
+        if keywords:
+            shared_interests = f"共通のキーワード: {'、'.join(keywords)}"  # Shared keywords
+        else:
+            shared_interests = "様々な興味と個性を持つ多様なグループです"  # Diverse group with various interests and personalities
+        squads.append({
+            'squad_name': LOCAL_SQUAD_NAMES[squad_index % len(LOCAL_SQUAD_NAMES)],
+            'shared_interests': shared_interests,
+            'member_ids': [ordered[row]['id'] for row in member_rows],
+        })
+    return squads
+
+
+def form_squads_locally(students_data):
+    """
+    Form squads without any API call: students' answers are turned into hashed n-gram
+    TF-IDF vectors and clustered into balanced squads of MIN_SQUAD_SIZE-MAX_SQUAD_SIZE by similarity.
+    Returns the same {'squads': [...]} format as group_students_into_squads.
+    """
+    squads = _cluster_squads(students_data, student_text)
+    logging.info(f"Local squad formation: {len(students_data)} students in {len(squads)} squads")
+    return {'squads': squads}
+
+
+def signature_text(student_data):
+    """Text of a student's personality signature, falling back to the answers if not analyzed yet"""
+    text = student_text(student_data, SIGNATURE_TEXT_FIELDS)
+    return text if text.strip() else student_text(student_data)
+
+
+def _name_squad(app, squad, members, naming_fn):
+    """Worker task: ask the AI for one squad's name and summary, keeping the local ones on failure"""
+    try:
+        if app is not None:
+            # Worker threads need their own app context to use the shared LLM response cache
+            with app.app_context():
+                identity = naming_fn(members)
+        else:
+            identity = naming_fn(members)
+        if identity.get('squad_name') and identity.get('shared_interests'):
+            return dict(squad, squad_name=identity['squad_name'], shared_interests=identity['shared_interests'])
+        logging.warning(f"AI returned an incomplete squad identity: {identity}")
+    except Exception as e:
+        logging.error(f"❌ AI squad naming failed for a squad of {len(members)}: {str(e)}")
+    return squad
+
+
+def form_squads_hybrid(students_data, naming_fn, max_workers=16, progress=None):
+    """
+    Hybrid squad formation: membership comes from local clustering of the personality signatures,
+    then each squad is named by its own small AI call, all running concurrently.
+    Prompt size stays at 3-5 members however large the class is.
+    progress(squads_named, squad_count) is called as each squad is named.
+    """
+    squads = _cluster_squads(students_data, signature_text)
+    if not squads:
+        return {'squads': []}
+
+    students_by_id = {student['id']: student for student in students_data}
+    app = current_app._get_current_object() if has_app_context() else None
+    logging.info(f"Hybrid squad formation: naming {len(squads)} squads with up to {max_workers} parallel AI calls")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(squads))), thread_name_prefix='squad-naming') as executor:
+        named_squads = _map_with_progress(
+            executor,
+            lambda squad: _name_squad(app, squad, [students_by_id[student_id] for student_id in squad['member_ids']], naming_fn),
+            squads,
+            progress
+        )
+
+    return {'squads': named_squads}
+
+
+def _unused_names(count, taken_names):
+    """Local squad names not already used by a squad in this session"""
+    names = [name for name in LOCAL_SQUAD_NAMES if name not in taken_names]
+    round_number = 2
+    while len(names) < count:
+        names.extend(f"{name} {round_number}" for name in LOCAL_SQUAD_NAMES if f"{name} {round_number}" not in taken_names)
+        round_number += 1
+    return names[:count]
+
+
+def place_incrementally(existing_squads, newcomers, taken_names=()):
+    """
+    Place late arrivals without touching anyone already in a squad.
+
+    existing_squads is a list of {'id', 'members': [student data]} and newcomers a list of student data.
+    Newcomers join the existing squad whose members' answers are most similar to theirs while squads
+    have room (MAX_SQUAD_SIZE). Those that do not fit - at least MIN_SQUAD_SIZE of them, so a new squad
+    is never too small - form new squads among themselves; squads only overflow when fewer than
+    MIN_SQUAD_SIZE students arrive and every squad is full.
+    Returns {'placements': {student_id: squad_id}, 'squads': [new squads in group_students_into_squads format]}.
+    """
+    newcomers = sorted(newcomers, key=lambda student: student['id'])
+    existing_squads = [squad for squad in existing_squads if squad['members']]
+    if not newcomers:
+        return {'placements': {}, 'squads': []}
+    if not existing_squads:
+        squads = _cluster_squads(newcomers, student_text) if len(newcomers) >= MIN_SQUAD_SIZE else []
+        for squad, name in zip(squads, _unused_names(len(squads), set(taken_names))):
+            squad['squad_name'] = name
+        return {'placements': {}, 'squads': squads}
+
+    members = [member for squad in existing_squads for member in squad['members']]
+    vectors = tfidf_matrix([student_text(student) for student in members + newcomers])
+    member_vectors, newcomer_vectors = vectors[:len(members)], vectors[len(members):]
+
+    squad_rows = np.repeat(np.arange(len(existing_squads)), [len(squad['members']) for squad in existing_squads])
+    membership = np.zeros((len(existing_squads), len(members)), dtype=vectors.dtype)
+    membership[squad_rows, np.arange(len(members))] = 1.0
+    centroids = normalize_rows(membership @ member_vectors)
+    similarity = newcomer_vectors @ centroids.T
+
+    free_slots = np.array([max(0, MAX_SQUAD_SIZE - len(squad['members'])) for squad in existing_squads], dtype=np.int64)
+    overflow = max(0, len(newcomers) - int(free_slots.sum()))
+    if 0 < overflow < MIN_SQUAD_SIZE:
+        if len(newcomers) >= MIN_SQUAD_SIZE:
+            # Hold back enough newcomers that the new squad reaches the minimum size
+            overflow = MIN_SQUAD_SIZE
+        else:
+            # Too few to start a squad: let the smallest squads grow past the maximum
+            smallest_first = np.argsort([len(squad['members']) for squad in existing_squads], kind='stable')
+            for extra_slot in range(overflow):
+                free_slots[smallest_first[extra_slot % len(smallest_first)]] += 1
+            overflow = 0
+
+    # The newcomers least similar to every existing squad start the new squads
+    best_fit = similarity.max(axis=1)
+    new_squad_rows = np.argsort(best_fit, kind='stable')[:overflow]
+    joining_rows = np.setdiff1d(np.arange(len(newcomers)), new_squad_rows)
+
+    placements = {}
+    if len(joining_rows):
+        assignment = _assign_with_capacity(similarity[joining_rows], free_slots)
+        for row, squad_index in zip(joining_rows, assignment):
+            placements[newcomers[row]['id']] = existing_squads[squad_index]['id']
+
+    squads = _cluster_squads([newcomers[row] for row in new_squad_rows], student_text) if overflow else []
+    for squad, name in zip(squads, _unused_names(len(squads), set(taken_names))):
+        squad['squad_name'] = name
+
+    logging.info(f"Incremental squad formation: {len(placements)} students joined existing squads, {len(squads)} new squads")
+    return {'placements': placements, 'squads': squads}
@@ -0,0 +1,196 @@
+"""
+Diversity-aware squad optimizer - improves any squad partition (from the AI or a local algorithm)
+by simulated annealing over member swaps and moves.
+
+The objective rewards answer similarity inside squads and penalizes squads dominated by one
+country or gender (sum of squared counts) and squads far from the average size. All candidate
+deltas are computed in batches with NumPy from incrementally maintained per-squad aggregates,
+so each swap or move costs O(n) to apply and evaluating thousands of candidates is cheap.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+from squad_formation import MAX_SQUAD_SIZE, MIN_SQUAD_SIZE
+from text_vectors import student_text, tfidf_matrix
+
+DEFAULT_OBJECTIVE_WEIGHTS = {
+    'similarity': 1.0,
+    'country': 0.25,
+    'gender': 0.15,
+    'size': 1.0,
+}
+
+
+def _encode(values):
+    """Map category values to integer codes"""
+    codes = {}
+    return np.array([codes.setdefault(value or '', len(codes)) for value in values], dtype=np.int64), len(codes)
+
+
+def _category_counts(assignment, categories, squad_count, category_count):
+    counts = np.zeros((squad_count, category_count), dtype=np.int64)
+    np.add.at(counts, (assignment, categories), 1)
+    return counts
+
+
+def score_partition(similarity, assignment, countries, genders, squad_count, weights):
+    """Objective value of a partition (higher is better)"""
+    same_squad = assignment[:, None] == assignment[None, :]
+    intra_similarity = similarity[same_squad].sum() / 2
+    country_counts = _category_counts(assignment, countries, squad_count, countries.max() + 1)
+    gender_counts = _category_counts(assignment, genders, squad_count, genders.max() + 1)
+    sizes = np.bincount(assignment, minlength=squad_count)
+    size_penalty = ((sizes - len(assignment) / squad_count) ** 2).sum()
+    return (weights['similarity'] * intra_similarity
+            - weights['country'] * (country_counts ** 2).sum()
+            - weights['gender'] * (gender_counts ** 2).sum()
+            - weights['size'] * size_penalty)
+
+
+def _aggregates(similarity, assignment, countries, genders, squad_count, country_count, gender_count):
+    """Similarity of each student to each squad, per-squad category counts and squad sizes"""
+    membership = np.zeros((len(assignment), squad_count), dtype=similarity.dtype)
+    membership[np.arange(len(assignment)), assignment] = 1.0
+    return (similarity @ membership,
+            _category_counts(assignment, countries, squad_count, country_count),
+            _category_counts(assignment, genders, squad_count, gender_count),
+            np.bincount(assignment, minlength=squad_count))
+
+
+def _swap_deltas(i, j, assignment, similarity, squad_similarity, countries, genders,
+                 country_counts, gender_counts, weights):
+    """Score change of student i (squad g) trading places with student j (squad h), for arrays of pairs"""
+    g, h = assignment[i], assignment[j]
+    ci, cj, gi, gj = countries[i], countries[j], genders[i], genders[j]
+    swap_similarity = (squad_similarity[i, h] - squad_similarity[i, g]
+                       + squad_similarity[j, g] - squad_similarity[j, h] - 2 * similarity[i, j])
+    swap_country = np.where(ci != cj, 2 * (country_counts[g, cj] - country_counts[g, ci]
+                                           + country_counts[h, ci] - country_counts[h, cj]) + 4, 0)
+    swap_gender = np.where(gi != gj, 2 * (gender_counts[g, gj] - gender_counts[g, gi]
+                                          + gender_counts[h, gi] - gender_counts[h, gj]) + 4, 0)
+    return (weights['similarity'] * swap_similarity
+            - weights['country'] * swap_country - weights['gender'] * swap_gender)
+
+
+def _move_deltas(m, mh, assignment, squad_similarity, countries, genders,
+                 country_counts, gender_counts, sizes, weights):
+    """Score change of student m leaving its squad mg for squad mh, for arrays of moves"""
+    mg, cm, gm = assignment[m], countries[m], genders[m]
+    return (weights['similarity'] * (squad_similarity[m, mh] - squad_similarity[m, mg])
+            - weights['country'] * (2 * (country_counts[mh, cm] - country_counts[mg, cm]) + 2)
+            - weights['gender'] * (2 * (gender_counts[mh, gm] - gender_counts[mg, gm]) + 2)
+            - weights['size'] * (2 * (sizes[mh] - sizes[mg]) + 2))
+
+
+def optimize_squads(squads, students_data, iterations=20000, batch_size=256, weights=None, seed=0,
+                    initial_temperature=0.5, final_temperature=0.005,
+                    min_size=MIN_SQUAD_SIZE, max_size=MAX_SQUAD_SIZE):
+    """
+    Improve a partition's similarity/diversity/size objective and return the squads
+    with their members rearranged; names and summaries stay with their squad.
+    students_data needs each student's 'id', 'country', 'gender' and answers.
+    Each round evaluates batch_size swaps and batch_size moves at once, accepts them by the
+    Metropolis rule and applies those that do not touch a squad already changed this round,
+    so every applied delta is exact. The best partition seen is returned. Deterministic for a seed.
+    """
+    weights = dict(DEFAULT_OBJECTIVE_WEIGHTS, **(weights or {}))
+    students_by_id = {student['id']: student for student in students_data}
+    squads = [dict(squad, member_ids=[i for i in squad['member_ids'] if i in students_by_id]) for squad in squads]
+    member_ids = [student_id for squad in squads for student_id in squad['member_ids']]
+    squad_count, student_count = len(squads), len(member_ids)
+    if squad_count < 2 or student_count < 2:
+        return squads
+
+    start_time = time.time()
+    assignment = np.repeat(np.arange(squad_count), [len(squad['member_ids']) for squad in squads])
+    vectors = tfidf_matrix([student_text(students_by_id[student_id]) for student_id in member_ids])
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0.0)
+    countries, country_count = _encode(students_by_id[student_id].get('country') for student_id in member_ids)
+    genders, gender_count = _encode(students_by_id[student_id].get('gender') for student_id in member_ids)
+
+    # Incrementally maintained aggregates: similarity of each student to each squad, category counts, sizes
+    squad_similarity, country_counts, gender_counts, sizes = _aggregates(
+        similarity, assignment, countries, genders, squad_count, country_count, gender_count
+    )
+
+    initial_score = score_partition(similarity, assignment, countries, genders, squad_count, weights)
+    current_score = best_score = initial_score
+    best_assignment = assignment.copy()
+    rng = np.random.default_rng(seed)
+    evaluated = applied = 0
+
+    while evaluated < iterations:
+        temperature = initial_temperature * (final_temperature / initial_temperature) ** (evaluated / iterations)
+
+        # Swaps: student i trades places with student j; moves: student m leaves its squad for squad mh
+        i = rng.integers(student_count, size=batch_size)
+        j = rng.integers(student_count, size=batch_size)
+        m = rng.integers(student_count, size=batch_size)
+        mh = rng.integers(squad_count, size=batch_size)
+        g, h, mg = assignment[i], assignment[j], assignment[m]
+        swap_delta = _swap_deltas(i, j, assignment, similarity, squad_similarity, countries, genders,
+                                  country_counts, gender_counts, weights)
+        move_delta = _move_deltas(m, mh, assignment, squad_similarity, countries, genders,
+                                  country_counts, gender_counts, sizes, weights)
+        swap_valid = g != h
+        move_valid = (mg != mh) & (sizes[mg] > min_size) & (sizes[mh] < max_size)
+
+        deltas = np.concatenate([swap_delta, move_delta])
+        valid = np.concatenate([swap_valid, move_valid])
+        with np.errstate(over='ignore'):
+            accepted = valid & ((deltas > 0) | (rng.random(2 * batch_size) < np.exp(np.minimum(deltas, 0) / temperature)))
+        evaluated += 2 * batch_size
+
+        touched = set()
+        for candidate in np.flatnonzero(accepted):
+            if candidate < batch_size:
+                a, b, squad_a, squad_b = i[candidate], j[candidate], g[candidate], h[candidate]
+                if squad_a in touched or squad_b in touched:
+                    continue
+                assignment[a], assignment[b] = squad_b, squad_a
+                squad_similarity[:, squad_a] += similarity[:, b] - similarity[:, a]
+                squad_similarity[:, squad_b] += similarity[:, a] - similarity[:, b]
+                country_counts[squad_a, countries[a]] -= 1
+                country_counts[squad_a, countries[b]] += 1
+                country_counts[squad_b, countries[b]] -= 1
+                country_counts[squad_b, countries[a]] += 1
+                gender_counts[squad_a, genders[a]] -= 1
+                gender_counts[squad_a, genders[b]] += 1
+                gender_counts[squad_b, genders[b]] -= 1
+                gender_counts[squad_b, genders[a]] += 1
+            else:
+                candidate -= batch_size
+                a, squad_a, squad_b = m[candidate], mg[candidate], mh[candidate]
+                if squad_a in touched or squad_b in touched:
+                    continue
+                assignment[a] = squad_b
+                squad_similarity[:, squad_a] -= similarity[:, a]
+                squad_similarity[:, squad_b] += similarity[:, a]
+                country_counts[squad_a, countries[a]] -= 1
+                country_counts[squad_b, countries[a]] += 1
+                gender_counts[squad_a, genders[a]] -= 1
+                gender_counts[squad_b, genders[a]] += 1
+                sizes[squad_a] -= 1
+                sizes[squad_b] += 1
+                candidate += batch_size
+            touched.update((squad_a, squad_b))
+            current_score += deltas[candidate]
+            applied += 1
+
+        if current_score > best_score:
+            best_score = current_score
+            best_assignment = assignment.copy()
+
+    optimized = []
+    for squad_index, squad in enumerate(squads):
+        members = [member_ids[row] for row in np.flatnonzero(best_assignment == squad_index)]
+        if members:
+            optimized.append(dict(squad, member_ids=members))
+
+    logging.info(f"Squad optimizer: score {initial_score:.2f} -> {best_score:.2f}, "
+                 f"{evaluated} candidates evaluated, {applied} applied in {time.time() - start_time:.2f}s")
+    return optimized
@@ -0,0 +1,203 @@
+"""
+Materialized squad hub snapshots.
+
+The squad hub payload (squad, members, parsed icebreaker and the randomly chosen first
+speaker) is built once - when squads are created or an icebreaker is generated - and stored
+in the squad_snapshots table with a strong ETag, so every member opening the hub at the same
+moment gets the same cacheable response and repeat visits are answered with 304.
+
+A squad's snapshot is dropped when a flush or a bulk statement changes a field the payload
+shows (PAYLOAD_FIELDS) on the squad or one of its members, or moves a member in or out; other
+writes such as translations or tags leave it alone. A missing snapshot is rebuilt on the next
+request. The first speaker is drawn from a generator seeded by the membership, so rebuilding
+a squad whose members did not change keeps its first speaker - and its ETag if nothing else changed.
+"""
+
+import hashlib
+import json
+import logging
+import random
+
+from sqlalchemy import delete, event, inspect, select
+
+from models import db, Student, Squad, SquadSnapshot
+
+# Bump when squad_hub.html changes what it shows, so cached pages are not revalidated as current
+SNAPSHOT_VERSION = 1
+
+# Columns build_payload reads - changing any other column does not invalidate a snapshot
+PAYLOAD_FIELDS = {
+    Squad: ('name', 'squad_rank', 'shared_interests', 'squad_icon', 'icebreaker_text'),
+    Student: ('name', 'archetype', 'country', 'submission_id', 'squad_id'),
+}
+
+
+def pick_first_speaker(squad_id, member_data):
+    """Random member, the same one for as long as the squad keeps the same members"""
+    if not member_data:
+        return None
+    seed = f"{squad_id}:{','.join(str(member['id']) for member in member_data)}"
+    return random.Random(seed).choice(member_data)
+
+
+def build_payload(squad, members):
+    """Everything the squad hub page shows, including the first speaker"""
+    icebreaker_data = None
+    if squad.icebreaker_text:
+        try:
+            icebreaker_data = json.loads(squad.icebreaker_text)
+        except (json.JSONDecodeError, TypeError) as e:
+            logging.error(f"Error parsing icebreaker JSON for squad {squad.id}: {e}")
+
+    member_data = [
+        {
+            'id': member.id,
+            'name': member.name,
+            'archetype': member.archetype,
+            'country': member.country,
+            'submission_id': member.submission_id,
+        }
+        for member in sorted(members, key=lambda member: member.id)
+    ]
+    first_speaker = pick_first_speaker(squad.id, member_data)
+
+    return {
+        'squad': {
+            'id': squad.id,
+            'name': squad.name,
+            'squad_rank': squad.squad_rank,
+            'shared_interests': squad.shared_interests,
+            'squad_icon': squad.squad_icon,
+            'members': member_data,
+        },
+        'icebreaker': icebreaker_data,
+        'first_speaker': first_speaker,
+    }
+
+
+def save_snapshots(squads):
+    """Materialize the snapshots of the given squads (members loaded in one query; the caller commits)"""
+    if not squads:
+        return {}
+    members_by_squad = {squad.id: [] for squad in squads}
+    for member in Student.query.filter(Student.squad_id.in_(list(members_by_squad))).all():
+        members_by_squad[member.squad_id].append(member)
+
+    snapshots = {}
+    for squad in squads:
+        payload = build_payload(squad, members_by_squad[squad.id])
+        serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        etag = hashlib.sha256(f'{SNAPSHOT_VERSION}:{serialized}'.encode('utf-8')).hexdigest()
+        db.session.merge(SquadSnapshot(squad_id=squad.id, payload=serialized, etag=etag))
+        snapshots[squad.id] = (payload, etag)
+    return snapshots
+
+
+def get_snapshot(squad_id):
+    """(payload, etag) of a squad, building and storing the snapshot if needed; None if there is no such squad"""
+    snapshot = db.session.get(SquadSnapshot, squad_id)
+    if snapshot is not None:
+        return json.loads(snapshot.payload), snapshot.etag
+
+    squad = db.session.get(Squad, squad_id)
+    if squad is None:
+        return None
+    payload, etag = save_snapshots([squad])[squad_id]
+    try:
+        db.session.commit()
+    except Exception as e:
+        # Another request stored it first - serve what was built here
+        db.session.rollback()
+        logging.info(f"Squad snapshot {squad_id} stored concurrently: {str(e)}")
+    return payload, etag
+
+
+def _payload_changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in PAYLOAD_FIELDS[type(obj)])
+
+
+def _flushed_squad_ids(session):
+    """Squads whose payload the pending flush changes"""
+    squad_ids = set()
+    for obj in session.new:
+        if isinstance(obj, Student):
+            squad_ids.add(obj.squad_id)
+    for obj in session.dirty:
+        if not isinstance(obj, (Student, Squad)) or not _payload_changed(obj):
+            continue
+        if isinstance(obj, Squad):
+            squad_ids.add(obj.id)
+        else:
+            # A moved member changes both the squad it left and the one it joined
+            squad_ids.add(obj.squad_id)
+            squad_ids.update(inspect(obj).attrs.squad_id.history.deleted or [])
+    for obj in session.deleted:
+        if isinstance(obj, (Student, Squad)):
+            squad_ids.add(obj.squad_id if isinstance(obj, Student) else obj.id)
+    squad_ids.discard(None)
+    return squad_ids
+
+
+def _after_flush(session, flush_context):
+    squad_ids = _flushed_squad_ids(session)
+    if squad_ids:
+        session.connection().execute(delete(SquadSnapshot.__table__).where(SquadSnapshot.squad_id.in_(squad_ids)))
+
+
+def _bulk_squad_ids(orm_execute_state, model):
+    """Squads whose payload a bulk UPDATE/DELETE on the model may change; None when that cannot be told"""
+    session = orm_execute_state.session
+    squad_column = Student.squad_id if model is Student else Squad.id
+    parameters = orm_execute_state.parameters
+
+    if orm_execute_state.is_update and isinstance(parameters, list):
+        # Bulk UPDATE by primary key: one parameter dict per row
+        changed = set().union(*parameters) & set(PAYLOAD_FIELDS[model])
+        if not changed:
+            return set()
+        row_ids = [row['id'] for row in parameters]
+        squad_ids = set(session.scalars(select(squad_column).where(model.id.in_(row_ids))))
+        if model is Student:
+            squad_ids.update(row['squad_id'] for row in parameters if 'squad_id' in row)
+        return squad_ids
+
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_update:
+        values = getattr(statement, '_values', None)
+        if not values:
+            return None
+        changed = {getattr(column, 'key', column) for column in values} & set(PAYLOAD_FIELDS[model])
+        if not changed:
+            return set()
+        if model is Student and 'squad_id' in changed:
+            # Members move to squads given by the statement
+            return None
+    query = select(squad_column)
+    if statement.whereclause is not None:
+        query = query.where(statement.whereclause)
+    return set(session.scalars(query))
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in PAYLOAD_FIELDS:
+        return
+    squad_ids = _bulk_squad_ids(orm_execute_state, mapper.class_)
+    statement = delete(SquadSnapshot.__table__)
+    if squad_ids is not None:
+        squad_ids.discard(None)
+        if not squad_ids:
+            return
+        statement = statement.where(SquadSnapshot.squad_id.in_(squad_ids))
+    orm_execute_state.session.execute(statement)
+
+
+def track_snapshot_invalidation(session=None):
+    """Drop snapshots whenever the session changes what a squad hub shows"""
+    session = session or db.session
+    if not event.contains(session, 'after_flush', _after_flush):
+        event.listen(session, 'after_flush', _after_flush)
+        event.listen(session, 'do_orm_execute', _do_orm_execute)
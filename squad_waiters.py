@@ -0,0 +1,128 @@
+"""
+"Wait for my squad" support for students on /find-squad.
+
+An in-memory assignment board maps every submission ID to its squad (or None) and is reloaded
+with one query only when the change feed cursor moves, so any number of students polling
+for their squad cost no per-request database lookups. Waiters park on a condition that is
+released for all of them as soon as a reload sees new assignments; one poller thread per
+process watches the cursor (and wakes up right after local commits) while anyone is parked.
+
+Each parked request holds a gunicorn thread, so at most max_parked requests park per process;
+the others get the current answer from memory with a retry_after hint.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from sqlalchemy import event
+
+
+class AssignmentBoard:
+    """Submission ID -> squad ID board shared by every request of the process"""
+
+    def __init__(self, app, poll_interval=1.0, max_parked=4):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.max_parked = max_parked
+        self._squads = {}
+        self._cursor = None
+        self._loaded_at = 0.0
+        self._parked = 0
+        self._condition = threading.Condition()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._poller = None
+
+    def watch_commits(self, session):
+        """Re-check the board right after local commits instead of waiting for the next interval"""
+        event.listen(session, 'after_commit', lambda committed_session: self._wakeup.set())
+
+    def refresh(self, force=False):
+        """Reload the board if the change feed moved (needs an application context)"""
+        from models import db, Student
+        from change_feed import current_cursor
+
+        if not force and time.time() - self._loaded_at < self.poll_interval:
+            return
+        with self._refresh_lock:
+            if not force and time.time() - self._loaded_at < self.poll_interval:
+                return  # Another thread refreshed while this one waited for the lock
+            cursor = current_cursor()
+            if cursor != self._cursor:
+                rows = db.session.query(Student.submission_id, Student.squad_id).all()
+                with self._condition:
+                    self._squads = {submission_id: squad_id for submission_id, squad_id in rows if submission_id}
+                    self._cursor = cursor
+                    self._condition.notify_all()
+                logging.info(f"Assignment board reloaded at cursor {cursor}: {len(rows)} students")
+            self._loaded_at = time.time()
+
+    def lookup(self, submission_id):
+        """(known, squad_id) for a submission ID"""
+        self.refresh()
+        with self._condition:
+            known = submission_id in self._squads
+        if not known:
+            # Possibly submitted since the last reload
+            self.refresh(force=True)
+        with self._condition:
+            return submission_id in self._squads, self._squads.get(submission_id)
+
+    def wait(self, submission_id, timeout=25):
+        """
+        Wait until the student has a squad or the timeout passes.
+        Returns {'status': 'assigned'|'waiting'|'unknown', 'squad_id', 'retry_after'}.
+        """
+        known, squad_id = self.lookup(submission_id)
+        if squad_id or not known:
+            return {'status': 'assigned' if squad_id else 'unknown', 'squad_id': squad_id, 'retry_after': None}
+
+        with self._condition:
+            if self._parked >= self.max_parked:
+                # No thread to spare - answer now and spread the retries out
+                return {'status': 'waiting', 'squad_id': None, 'retry_after': round(random.uniform(2, 5), 1)}
+            self._parked += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._run, name='assignment-board-poller', daemon=True)
+                self._poller.start()
+
+        deadline = time.time() + timeout
+        try:
+            with self._condition:
+                while True:
+                    squad_id = self._squads.get(submission_id)
+                    remaining = deadline - time.time()
+                    if squad_id or remaining <= 0 or submission_id not in self._squads:
+                        break
+                    self._condition.wait(remaining)
+        finally:
+            with self._condition:
+                self._parked -= 1
+
+        if squad_id:
+            return {'status': 'assigned', 'squad_id': squad_id, 'retry_after': None}
+        if submission_id not in self._squads:
+            return {'status': 'unknown', 'squad_id': None, 'retry_after': None}
+        return {'status': 'waiting', 'squad_id': None, 'retry_after': 0}
+
+    def _run(self):
+        """Poller loop - idles without touching the database while nobody is parked"""
+        from models import db
+
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._condition:
+                has_waiters = self._parked > 0
+            if not has_waiters:
+                continue
+            with self.app.app_context():
+                try:
+                    self.refresh(force=True)
+                except Exception as e:
+                    logging.error(f"Assignment board refresh failed: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
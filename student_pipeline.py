@@ -0,0 +1,81 @@
+"""
+Fused per-student pipeline (opt-in with FUSED_STUDENT_PIPELINE).
+
+Right after a submission, one structured AI request returns both the Japanese translations
+of the six answers and the personality signature, instead of a batched translation request
+now and a signature request when the teacher runs batch analysis. Students arrive on the
+dashboard already analyzed, and batch analysis only picks up the ones whose signature failed.
+"""
+
+import logging
+
+from analysis_engine import SIGNATURE_FIELDS
+from translation_batcher import QUESTION_FIELDS
+
+
+class PipelineIncomplete(Exception):
+    """Raised by process_students(strict=True) when some translations or signature fields are missing"""
+
+
+def process_students(pipeline_requests, fallback_text=None, strict=False):
+    """
+    Translate and analyze students with one AI request each.
+    pipeline_requests is a list of (student_id, student_language) pairs; students who chose
+    Japanese get their original answers copied and only the signature is requested.
+    Missing translations get fallback_text (None keeps the original answer); missing signature
+    fields are left empty for batch analysis. With strict=True nothing is stored and
+    PipelineIncomplete is raised instead, so the job is retried.
+    Must be called inside an application context.
+    """
+    from models import db, Student
+    from openai_integration import analyze_and_translate_student
+    from analysis_pipeline import record_stage
+
+    language_by_id = dict(pipeline_requests)
+    students = Student.query.filter(Student.id.in_(language_by_id.keys())).all()
+    for student_id in set(language_by_id) - {student.id for student in students}:
+        logging.error(f"Could not find student with ID {student_id} to process.")
+
+    results = {}
+    translated_students = []
+    signed_students = []
+    for student in students:
+        translate = language_by_id[student.id] != 'ja'
+        answers = {field: getattr(student, field) for field in QUESTION_FIELDS}
+        result = analyze_and_translate_student(answers, translate=translate)
+        results[student.id] = result
+        if not translate or len(result['translations']) == len(QUESTION_FIELDS):
+            translated_students.append(student)
+        if len(result['signature']) == len(SIGNATURE_FIELDS):
+            signed_students.append(student)
+    incomplete_ids = [
+        student.id for student in students
+        if student not in translated_students or student not in signed_students
+    ]
+
+    if strict and incomplete_ids:
+        raise PipelineIncomplete(f"Fused pipeline incomplete for students {sorted(incomplete_ids)}")
+
+    for student in students:
+        result = results[student.id]
+        for field in QUESTION_FIELDS:
+            if language_by_id[student.id] == 'ja':
+                # Student chose Japanese - copy original answers to _jp fields
+                translated = getattr(student, field)
+            else:
+                translated = result['translations'].get(field)
+                if translated is None:
+                    logging.error(f"Translation failed for {field} of student {student.id}")
+                    translated = fallback_text if fallback_text is not None else getattr(student, field)
+            setattr(student, f'{field}_jp', translated)
+        for field in SIGNATURE_FIELDS:
+            if field in result['signature']:
+                setattr(student, field, result['signature'][field])
+            else:
+                logging.error(f"Signature field {field} failed for student {student.id}, left for batch analysis")
+
+    # Incomplete outputs stay stale for the next pipeline run
+    record_stage('translate', translated_students)
+    record_stage('signature', signed_students)
+    db.session.commit()
+    logging.info(f"Fused pipeline completed and saved for students {sorted(language_by_id)}")
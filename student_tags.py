@@ -0,0 +1,93 @@
+"""
+Keyword-derived student tags (interest categories, core sparks, vibe archetype), computed once
+when a submission is saved and stored in the student_tags table so pages only read them.
+"""
+
+import json
+import logging
+
+from vibe_keywords import get_core_sparks, get_interest_categories_with_colors, get_vibe_archetype
+
+# Bump when the keyword classifiers or the compatibility index features change (see analysis_pipeline.py)
+TAGS_VERSION = 1
+
+
+def compute_tags(student):
+    """Run the keyword classifiers over a student's vibes"""
+    vibes_text = student.vibes or student.get_combined_answers()
+    return {
+        'interests': get_interest_categories_with_colors(vibes_text),
+        'core_sparks': get_core_sparks(vibes_text),
+        'vibe_archetype': get_vibe_archetype(vibes_text),
+    }
+
+
+def save_student_tags(student):
+    """
+    Compute and store the tags of a flushed student in the current session (the caller commits).
+    merge() overwrites a leftover row in case the student ID was reused.
+    """
+    from models import db, StudentTags
+    from analysis_pipeline import record_stage
+
+    tags = compute_tags(student)
+    record_stage('tags', [student])
+    db.session.merge(StudentTags(
+        student_id=student.id,
+        interests=json.dumps(tags['interests'], ensure_ascii=False),
+        core_sparks=json.dumps(tags['core_sparks'], ensure_ascii=False),
+        vibe_archetype=tags['vibe_archetype'],
+    ))
+    return tags
+
+
+def get_tags_for_students(students):
+    """
+    Stored tags for many students with one query, keyed by student ID.
+    Students without a current row (not backfilled yet) have their tags computed on the fly.
+    """
+    from models import StudentTags
+
+    if not students:
+        return {}
+    rows = {row.student_id: row for row in StudentTags.query.filter(
+        StudentTags.student_id.in_([student.id for student in students])
+    )}
+
+    tags_by_id = {}
+    for student in students:
+        row = rows.get(student.id)
+        if row is None or (row.updated_at and student.created_at and row.updated_at < student.created_at):
+            tags_by_id[student.id] = compute_tags(student)
+        else:
+            tags_by_id[student.id] = {
+                'interests': json.loads(row.interests),
+                'core_sparks': json.loads(row.core_sparks),
+                'vibe_archetype': row.vibe_archetype,
+            }
+    return tags_by_id
+
+
+def get_student_tags(student):
+    """Stored tags of one student"""
+    return get_tags_for_students([student])[student.id]
+
+
+def backfill_student_tags(only_missing=True):
+    """Store tags for existing students; with only_missing=False every row is recomputed"""
+    from models import db, Student, StudentTags
+
+    query = Student.query
+    if only_missing:
+        query = query.outerjoin(StudentTags, Student.id == StudentTags.student_id).filter(db.or_(
+            StudentTags.student_id.is_(None),
+            StudentTags.updated_at < Student.created_at
+        ))
+
+    count = 0
+    for student in query.all():
+        save_student_tags(student)
+        count += 1
+    db.session.commit()
+    logging.info(f"Backfilled tags for {count} students")
+    return count
@@ -0,0 +1,72 @@
+"""
+Shared fixtures: a bare Flask app bound to the models on a fresh SQLite file, and the real
+application (app.py) with its test client for route-level tests. Both push an application
+context for the whole test.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+from flask import Flask
+
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "test.db"}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture(scope='session')
+def vibecheck(tmp_path_factory):
+    """The app.py module on its own database; Firebase sign-in (needs service account credentials) is replaced"""
+    def verify_firebase_token(id_token):
+        raise ValueError("Firebase sign-in is not available in tests")
+
+    firebase_setup = types.ModuleType('firebase_setup')
+    firebase_setup.verify_firebase_token = verify_firebase_token
+    sys.modules.setdefault('firebase_setup', firebase_setup)
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path_factory.mktemp("app") / "app.db"}'
+
+    import app as vibecheck
+    vibecheck.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return vibecheck
+
+
+@pytest.fixture
+def client(vibecheck):
+    """Test client signed in as the organizer, on empty tables"""
+    from analysis_pipeline import start_tracking
+
+    with vibecheck.app.app_context():
+        db.drop_all()
+        db.create_all()
+        start_tracking()
+        client = vibecheck.app.test_client()
+        with client.session_transaction() as session:
+            session['teacher_authenticated'] = True
+            session['user_info'] = {'uid': 'teacher', 'email': 'teacher@example.com', 'name': 'Teacher'}
+        yield client
+        db.session.remove()
+
+
+@pytest.fixture
+def run_jobs(vibecheck):
+    """Run queued background jobs in the test thread until none is left; returns the jobs run"""
+    def run():
+        finished = []
+        while True:
+            jobs = vibecheck.job_queue._claim('test-worker')
+            if not jobs:
+                return finished
+            finished.extend(job.id for job in jobs)
+            vibecheck.job_queue._execute(jobs)
+    return run
@@ -0,0 +1,68 @@
+"""
+Translation failures keep the original answers but stay stale, outputs that predate hash
+tracking are adopted, and the tracking start does not move when stage rows are updated.
+"""
+
+from datetime import datetime
+
+import pytest
+
+import analysis_pipeline
+import openai_integration
+from models import db, Student, StageState
+from translation_batcher import translate_students
+
+
+def add_student(number, **fields):
+    student = Student(name=f'Student {number}', country='USA', gender='Male', submission_id=f'AAA-{number:03d}', **fields)
+    for q in range(1, 7):
+        setattr(student, f'question{q}', f'I like music {number} {q}')
+    db.session.add(student)
+    db.session.commit()
+    return student
+
+
+@pytest.fixture
+def translation_outage(monkeypatch):
+    monkeypatch.setattr(openai_integration, 'translate_students_to_japanese', lambda answers: {})
+
+
+def test_failed_translation_keeps_answers_and_stays_stale(app, translation_outage):
+    analysis_pipeline.start_tracking()
+    student = add_student(1)
+
+    translate_students([(student.id, 'en')])
+
+    assert student.question1_jp == student.question1
+    for _ in range(2):
+        stale = analysis_pipeline.stale_students('translate', adopt=True)
+        db.session.commit()
+        assert [s.id for s in stale] == [student.id]
+
+
+def test_outputs_predating_tracking_are_adopted(app):
+    legacy = add_student(1, created_at=datetime(2020, 1, 1))
+    for q in range(1, 7):
+        setattr(legacy, f'question{q}_jp', '音楽が好き')
+    db.session.add(StageState(subject='student:999', stage='tags', input_hash='h', created_at=datetime(2021, 1, 1)))
+    db.session.commit()
+
+    assert analysis_pipeline.stale_students('translate', adopt=True) == []
+    db.session.commit()
+    assert db.session.get(StageState, (f'student:{legacy.id}', 'translate')) is not None
+
+
+def test_tracking_start_ignores_updates(app):
+    analysis_pipeline.start_tracking()
+    marker = db.session.get(StageState, (analysis_pipeline.TRACKING_SUBJECT, 'tracking'))
+    marker.created_at = marker.updated_at = datetime(2020, 1, 1)
+    db.session.commit()
+    started_at = analysis_pipeline.tracking_started_at()
+
+    # updated_at moves forward (onupdate), created_at does not
+    marker.input_hash = 'changed'
+    db.session.commit()
+    analysis_pipeline.start_tracking()
+
+    assert analysis_pipeline.tracking_started_at() == started_at == datetime(2020, 1, 1)
+    assert StageState.query.count() == 1
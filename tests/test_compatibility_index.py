@@ -0,0 +1,94 @@
+"""
+Incremental indexing - new students, changed answers and deletions in any order - must leave
+the same neighbor lists as rebuilding the index from scratch.
+"""
+
+import json
+import random
+import threading
+
+import pytest
+
+from compatibility_index import index_students, rebuild_index
+from models import db, Student, StudentSimilarity
+
+WORDS = ['game', 'music', 'art', 'soccer', 'food', 'travel', 'code', 'dance', 'movie', 'anime', 'cook', 'read',
+         'beach', 'coffee', 'sleep', 'guitar']
+TOP_K = 5
+
+
+def archetype(vibes_text):
+    return 'musician' if 'music' in vibes_text.split() else 'other'
+
+
+def add_student(rng, number):
+    student = Student(name=f'Student {number}', country='Japan', gender='Female', submission_id=f'AAA-{number:03d}',
+                      vibes=' '.join(rng.sample(WORDS, rng.randint(2, 6))))
+    for q in range(1, 7):
+        setattr(student, f'question{q}', 'answer')
+    db.session.add(student)
+    db.session.commit()
+    return student
+
+
+def index_snapshot():
+    db.session.expire_all()
+    return {row.student_id: (row.archetype, json.loads(row.neighbors)) for row in StudentSimilarity.query.all()}
+
+
+def rebuilt_snapshot():
+    rebuild_index(Student.query.order_by(Student.id).all(), archetype, top_k=TOP_K)
+    return index_snapshot()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_index_matches_rebuild(app, seed):
+    rng = random.Random(seed)
+    for number in range(40):
+        student = add_student(rng, number)
+        index_students([student], archetype, top_k=TOP_K)
+
+        students = Student.query.all()
+        action = rng.random()
+        if action < 0.3:
+            # Answers changed - old neighbors must be refilled
+            changed = rng.sample(students, min(3, len(students)))
+            for other in changed:
+                other.vibes = ' '.join(rng.sample(WORDS, rng.randint(2, 6)))
+            db.session.commit()
+            index_students(changed, archetype, top_k=TOP_K)
+        elif action < 0.45 and len(students) > 2:
+            # Deleted students are purged the next time anyone is indexed
+            db.session.delete(rng.choice(students))
+            db.session.commit()
+            index_students([add_student(rng, 100 + number)], archetype, top_k=TOP_K)
+
+    incremental = index_snapshot()
+    assert incremental == rebuilt_snapshot()
+
+
+def test_concurrent_indexing_keeps_every_update(app):
+    rng = random.Random(7)
+    students = [add_student(rng, number) for number in range(30)]
+    rebuild_index(students[:10], archetype, top_k=TOP_K)
+    student_ids = [student.id for student in students[10:]]
+    errors = []
+
+    def worker(ids):
+        with app.app_context():
+            try:
+                for student_id in ids:
+                    index_students([db.session.get(Student, student_id)], archetype, top_k=TOP_K)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(student_ids[i::2],)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert index_snapshot() == rebuilt_snapshot()
@@ -0,0 +1,155 @@
+"""
+Squad creation through the organizer routes: the formation mode is picked from the request or
+SQUAD_FORMATION_MODE, and whatever path runs, every student ends up in exactly one squad of 3-5.
+"""
+
+import json
+
+import pytest
+
+import openai_integration
+from models import db, Job, Squad, Student
+from squad_formation import MAX_SQUAD_SIZE, MIN_SQUAD_SIZE
+
+WORDS = ['game', 'music', 'art', 'soccer', 'food', 'travel', 'code', 'dance']
+
+
+def add_students(count, first=0):
+    students = []
+    for number in range(first, first + count):
+        student = Student(name=f'Student {number}', country=['Japan', 'USA'][number % 2], gender='Female',
+                          submission_id=f'AAA-{number:03d}', archetype=['探検家', '職人'][number % 2])
+        for q in range(1, 7):
+            setattr(student, f'question{q}', f'{WORDS[number % len(WORDS)]} {WORDS[(number + q) % len(WORDS)]}')
+        students.append(student)
+    db.session.add_all(students)
+    db.session.commit()
+    return [student.id for student in students]
+
+
+def assert_squads_cover(student_ids):
+    db.session.expire_all()
+    members = {}
+    for student in Student.query.all():
+        members.setdefault(student.squad_id, []).append(student.id)
+    assert None not in members, "a student was left without a squad"
+    assert sorted(sum(members.values(), [])) == sorted(student_ids)
+    assert all(MIN_SQUAD_SIZE <= len(ids) <= MAX_SQUAD_SIZE for ids in members.values())
+    assert {squad.id for squad in Squad.query.all()} == set(members)
+
+
+def job_progress():
+    job = Job.query.filter_by(kind='create_squads').one()
+    assert job.status == 'done', job.last_error
+    return json.loads(job.progress)
+
+
+@pytest.fixture
+def ai_calls(monkeypatch):
+    """Record AI grouping calls; each answers with squads of four in the order given"""
+    calls = []
+
+    def group_students_into_squads(students_data):
+        calls.append([student['id'] for student in students_data])
+        ids = [student['id'] for student in students_data]
+        return {'squads': [
+            {'squad_name': f'AI {start}', 'shared_interests': 'AI', 'member_ids': ids[start:start + 4]}
+            for start in range(0, len(ids), 4)
+        ]}
+
+    monkeypatch.setattr(openai_integration, 'group_students_into_squads', group_students_into_squads)
+    return calls
+
+
+def test_auto_mode_uses_one_ai_call_for_a_small_class(client, run_jobs, ai_calls):
+    student_ids = add_students(12)
+
+    client.post('/teacher/create-squads')
+    run_jobs()
+
+    assert len(ai_calls) == 1
+    assert job_progress()['mode'] == 'ai'
+    assert_squads_cover(student_ids)
+
+
+def test_hierarchical_mode_groups_blocks(client, run_jobs, ai_calls, vibecheck, monkeypatch):
+    monkeypatch.setitem(vibecheck.app.config, 'SQUAD_HIERARCHICAL_THRESHOLD', 10)
+    monkeypatch.setitem(vibecheck.app.config, 'SQUAD_BLOCK_SIZE', 8)
+    student_ids = add_students(23)
+
+    client.post('/teacher/create-squads')
+    run_jobs()
+
+    assert job_progress()['mode'] == 'hierarchical'
+    assert len(ai_calls) == 3 and all(len(block) <= 8 for block in ai_calls)
+    assert sorted(sum(ai_calls, [])) == student_ids
+    assert_squads_cover(student_ids)
+
+
+def test_local_mode_makes_no_ai_call(client, run_jobs, ai_calls, vibecheck, monkeypatch):
+    student_ids = add_students(14)
+
+    # Requested by the form...
+    client.post('/teacher/create-squads', data={'mode': 'local'})
+    run_jobs()
+    assert job_progress()['mode'] == 'local'
+    assert_squads_cover(student_ids)
+
+    # ...or configured as the default
+    Job.query.delete()
+    db.session.commit()
+    monkeypatch.setitem(vibecheck.app.config, 'SQUAD_FORMATION_MODE', 'local')
+    client.post('/teacher/create-squads')
+    run_jobs()
+    assert job_progress()['mode'] == 'local'
+    assert_squads_cover(student_ids)
+    assert ai_calls == []
+
+
+def test_hybrid_mode_names_local_squads_with_ai(client, run_jobs, ai_calls, monkeypatch):
+    named = []
+
+    def generate_squad_identity(members_data):
+        named.append(len(members_data))
+        return {'squad_name': f'AIチーム{len(named)}', 'shared_interests': 'AI naming'}
+
+    monkeypatch.setattr(openai_integration, 'generate_squad_identity', generate_squad_identity)
+    student_ids = add_students(17)
+
+    client.post('/teacher/create-squads', data={'mode': 'hybrid'})
+    run_jobs()
+
+    assert job_progress()['mode'] == 'hybrid'
+    assert ai_calls == []
+    assert sum(named) == len(student_ids)
+    assert_squads_cover(student_ids)
+    assert all(squad.shared_interests == 'AI naming' for squad in Squad.query.all())
+
+
+def test_incremental_mode_places_late_arrivals(client, run_jobs, ai_calls):
+    student_ids = add_students(12)
+    client.post('/teacher/create-squads', data={'mode': 'local'})
+    run_jobs()
+    db.session.expire_all()
+    before = {student.id: student.squad_id for student in Student.query.all()}
+
+    late_ids = add_students(7, first=100)
+    response = client.post('/teacher/create-squads', data={'mode': 'incremental'}, follow_redirects=True)
+
+    assert '7人の学生をスクワッドに追加しました' in response.get_data(as_text=True)
+    # Placed right away - no background job, no AI call, existing members stay where they were
+    assert Job.query.count() == 1 and ai_calls == []
+    db.session.expire_all()
+    assert all(db.session.get(Student, student_id).squad_id == squad_id for student_id, squad_id in before.items())
+    assert all(db.session.get(Student, student_id).squad_id is not None for student_id in late_ids)
+    assert len({squad.name for squad in Squad.query.all()}) == Squad.query.count()
+
+
+def test_incremental_mode_waits_for_squad_creation(client):
+    add_students(6)
+    client.post('/teacher/create-squads', data={'mode': 'local'})
+
+    response = client.post('/teacher/create-squads', data={'mode': 'incremental'}, follow_redirects=True)
+
+    assert 'スクワッド作成を実行中です' in response.get_data(as_text=True)
+    assert Student.query.filter(Student.squad_id.isnot(None)).count() == 0
@@ -0,0 +1,135 @@
+"""
+Job queue claim, retry/backoff and lease recovery, driven step by step without worker threads.
+"""
+
+from datetime import timedelta
+
+import pytest
+
+import job_queue as job_queue_module
+from job_queue import JobQueue, utcnow
+from models import db, Job
+
+
+@pytest.fixture
+def queue(app):
+    return JobQueue(app, num_workers=0, lease_seconds=60, max_attempts=3)
+
+
+def add_jobs(queue, kind, count, **kwargs):
+    jobs = [queue.enqueue(kind, {'n': n}, **kwargs) for n in range(count)]
+    db.session.commit()
+    return [job.id for job in jobs]
+
+
+def statuses():
+    db.session.expire_all()
+    return {job.id: job.status for job in Job.query.order_by(Job.id)}
+
+
+def test_claim_batches_pending_jobs_once(queue):
+    queue.register('translation', lambda payloads, last_attempt: None, batch_size=3)
+    job_ids = add_jobs(queue, 'translation', 5)
+
+    first = queue._claim('worker-a')
+    second = queue._claim('worker-b')
+    third = queue._claim('worker-c')
+
+    assert [job.id for job in first] == job_ids[:3]
+    assert [job.id for job in second] == job_ids[3:]
+    assert third == []
+    assert all(job.status == 'running' and job.attempts == 1 for job in first + second)
+    assert {job.locked_by for job in first} == {'worker-a'}
+
+
+def test_claim_serves_higher_priority_and_respects_max_running(queue):
+    queue.register('translation', lambda payloads, last_attempt: None, priority=10)
+    queue.register('create_squads', lambda payload, job: None, tracked=True, priority=50, max_running=1)
+    translation_ids = add_jobs(queue, 'translation', 2)
+    squad_ids = add_jobs(queue, 'create_squads', 2)
+
+    assert [job.id for job in queue._claim('worker-a')] == squad_ids[:1]
+    # The second squad job waits for the first - translations run meanwhile
+    assert [job.id for job in queue._claim('worker-b')] == translation_ids[:1]
+
+
+def test_execute_marks_done_and_passes_payloads(queue):
+    seen = []
+    queue.register('translation', lambda payloads, last_attempt: seen.append((payloads, last_attempt)), batch_size=2)
+    job_ids = add_jobs(queue, 'translation', 2)
+
+    queue._execute(queue._claim('worker-a'))
+
+    assert seen == [([{'n': 0}, {'n': 1}], False)]
+    assert statuses() == {job_id: 'done' for job_id in job_ids}
+
+
+def test_failed_job_backs_off_then_fails_permanently(queue, monkeypatch):
+    monkeypatch.setattr(job_queue_module.random, 'uniform', lambda low, high: 1.0)
+    last_attempts = []
+
+    def failing(payloads, last_attempt):
+        last_attempts.append(last_attempt)
+        raise RuntimeError("API down")
+
+    queue.register('translation', failing, backoff_seconds=5)
+    [job_id] = add_jobs(queue, 'translation', 1)
+
+    for attempt in (1, 2):
+        before = utcnow()
+        queue._execute(queue._claim('worker-a'))
+        job = db.session.get(Job, job_id)
+        db.session.refresh(job)
+        assert job.status == 'pending' and job.attempts == attempt
+        assert job.last_error == "API down"
+        # 5s, then 10s - not claimable before then
+        delay = (job.run_after - before).total_seconds()
+        assert 5 * 2 ** (attempt - 1) - 1 <= delay <= 5 * 2 ** (attempt - 1) + 1
+        assert queue._claim('worker-a') == []
+        job.run_after = utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    queue._execute(queue._claim('worker-a'))
+    assert statuses() == {job_id: 'failed'}
+    assert last_attempts == [False, False, True]
+
+
+def test_retried_job_runs_alone(queue):
+    queue.register('translation', lambda payloads, last_attempt: None, batch_size=5)
+    job_ids = add_jobs(queue, 'translation', 3)
+    retried = db.session.get(Job, job_ids[1])
+    retried.attempts = 1
+    retried.priority = 1
+    db.session.commit()
+
+    assert [job.id for job in queue._claim('worker-a')] == [job_ids[1]]
+
+
+def test_expired_lease_is_recovered(queue):
+    queue.register('translation', lambda payloads, last_attempt: None)
+    stale_id, fresh_id = add_jobs(queue, 'translation', 2)
+    for job_id, claimed_at in ((stale_id, utcnow() - timedelta(seconds=120)), (fresh_id, utcnow())):
+        job = db.session.get(Job, job_id)
+        job.status, job.locked_by, job.locked_at, job.attempts = 'running', 'dead-worker', claimed_at, 1
+    db.session.commit()
+
+    claimed = queue._claim('worker-a')
+
+    # Only the job past its lease is handed out again; the other one still belongs to its worker
+    assert [job.id for job in claimed] == [stale_id]
+    assert claimed[0].locked_by == 'worker-a' and claimed[0].attempts == 2
+    assert db.session.get(Job, fresh_id).locked_by == 'dead-worker'
+
+
+def test_cancelled_job_is_not_claimed_or_completed(queue):
+    queue.register('translation', lambda payloads, last_attempt: None)
+    pending_id, running_id = add_jobs(queue, 'translation', 2)
+    assert queue.cancel(pending_id)
+    [running] = queue._claim('worker-a')
+    assert running.id == running_id
+    assert queue.cancel(running_id)
+
+    queue._execute([running])
+
+    assert statuses() == {pending_id: 'cancelled', running_id: 'cancelled'}
+    assert not queue.cancel(pending_id)
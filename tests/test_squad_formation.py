@@ -0,0 +1,165 @@
+"""
+Invariant tests for squad formation: every strategy must return a partition of the students
+(each one exactly once) into squads of MIN_SQUAD_SIZE-MAX_SQUAD_SIZE members.
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from squad_formation import (
+    MAX_SQUAD_SIZE,
+    MIN_SQUAD_SIZE,
+    _assign_with_capacity,
+    form_squads_hierarchical,
+    form_squads_hybrid,
+    form_squads_locally,
+    place_incrementally,
+    plan_squad_sizes,
+    repair_partition,
+)
+
+WORDS = ['game', 'music', 'art', 'soccer', 'food', 'travel', 'code', 'dance', 'movie', 'anime', 'cook', 'read']
+
+
+def make_students(count, rng, first_id=1):
+    students = []
+    for student_id in range(first_id, first_id + count):
+        student = {'id': student_id, 'archetype': rng.choice(['探検家', '職人', '夢想家'])}
+        for i in range(1, 7):
+            student[f'question{i}'] = ' '.join(rng.choice(WORDS) for _ in range(4))
+        students.append(student)
+    return students
+
+
+def assert_partition(squads, student_ids):
+    members = [student_id for squad in squads for student_id in squad['member_ids']]
+    assert len(members) == len(set(members)), "a student is in more than one squad"
+    assert sorted(members) == sorted(student_ids), "students missing or unknown IDs kept"
+    if len(student_ids) >= MIN_SQUAD_SIZE:
+        sizes = [len(squad['member_ids']) for squad in squads]
+        assert all(MIN_SQUAD_SIZE <= size <= MAX_SQUAD_SIZE for size in sizes), sizes
+    for squad in squads:
+        assert squad['squad_name'] and squad['shared_interests']
+
+
+@pytest.mark.parametrize('student_count', range(1, 61))
+def test_plan_squad_sizes(student_count):
+    sizes = plan_squad_sizes(student_count)
+    assert sum(sizes) == student_count
+    if student_count >= MIN_SQUAD_SIZE:
+        assert all(MIN_SQUAD_SIZE <= size <= MAX_SQUAD_SIZE for size in sizes)
+
+
+def test_repair_partition_random_proposals():
+    rng = random.Random(1)
+    for _ in range(2000):
+        student_ids = list(range(1, rng.randint(1, 60) + 1))
+        # Proposals with duplicates, unknown IDs, oversized, undersized and empty squads
+        proposal = [
+            {
+                'squad_name': f'Squad {index}',
+                'shared_interests': 'fun',
+                'member_ids': [rng.randint(0, len(student_ids) + 5) for _ in range(rng.randint(0, 8))],
+            }
+            for index in range(rng.randint(0, 15))
+        ]
+        proposal.append({'squad_name': 'Broken'})
+        assert_partition(repair_partition(proposal, student_ids), student_ids)
+
+
+def test_repair_partition_keeps_a_valid_partition():
+    squads = [
+        {'squad_name': 'A', 'shared_interests': 'x', 'member_ids': [1, 2, 3]},
+        {'squad_name': 'B', 'shared_interests': 'y', 'member_ids': [4, 5, 6, 7]},
+    ]
+    assert repair_partition(squads, list(range(1, 8))) == squads
+
+
+def test_assign_with_capacity_respects_capacity():
+    rng = np.random.default_rng(3)
+    similarity = rng.random((23, 5))
+    capacity = [5, 5, 5, 4, 4]
+    assignment = _assign_with_capacity(similarity, capacity)
+    assert (assignment >= 0).all()
+    assert (np.bincount(assignment, minlength=5) <= capacity).all()
+
+
+def test_assign_with_capacity_rejects_insufficient_capacity():
+    with pytest.raises(ValueError):
+        _assign_with_capacity(np.ones((6, 2)), [2, 3])
+
+
+@pytest.mark.parametrize('student_count', [3, 4, 7, 13, 24, 41])
+def test_form_squads_locally(student_count):
+    students = make_students(student_count, random.Random(student_count))
+    assert_partition(form_squads_locally(students)['squads'], [student['id'] for student in students])
+
+
+@pytest.mark.parametrize('student_count', [3, 9, 30])
+def test_form_squads_hybrid(student_count):
+    students = make_students(student_count, random.Random(student_count))
+    named = form_squads_hybrid(students, lambda members: {'squad_name': f'AI {len(members)}', 'shared_interests': 'AI'})
+    assert_partition(named['squads'], [student['id'] for student in students])
+    assert all(squad['squad_name'].startswith('AI') for squad in named['squads'])
+
+    def failing_naming(members):
+        raise RuntimeError("API down")
+
+    # Naming failures keep the local names
+    local = form_squads_hybrid(students, failing_naming)
+    assert_partition(local['squads'], [student['id'] for student in students])
+
+
+@pytest.mark.parametrize('student_count', [10, 50, 97])
+def test_form_squads_hierarchical(student_count):
+    rng = random.Random(student_count)
+    students = make_students(student_count, rng)
+
+    def sloppy_ai(block):
+        # Drops a student, duplicates another and invents an ID - repair_partition must fix it
+        ids = [student['id'] for student in block]
+        return {'squads': [
+            {'squad_name': 'AI', 'shared_interests': 'x', 'member_ids': ids[1:len(ids) // 2] + [ids[2], 99999]},
+            {'squad_name': 'AI 2', 'shared_interests': 'y', 'member_ids': ids[len(ids) // 2:]},
+        ]}
+
+    def failing_ai(block):
+        raise RuntimeError("API down")
+
+    for group_fn in (sloppy_ai, failing_ai):
+        squads = form_squads_hierarchical(students, group_fn, form_squads_locally, block_size=24)['squads']
+        assert_partition(squads, [student['id'] for student in students])
+
+
+def test_place_incrementally_random_cohorts():
+    rng = random.Random(2)
+    for _ in range(500):
+        next_id = 1
+        existing = []
+        for squad_id in range(rng.randint(0, 6)):
+            members = make_students(rng.randint(MIN_SQUAD_SIZE, MAX_SQUAD_SIZE), rng, next_id)
+            next_id += len(members)
+            existing.append({'id': 100 + squad_id, 'members': members})
+        newcomers = make_students(rng.randint(0, 14), rng, next_id)
+
+        result = place_incrementally(existing, newcomers, taken_names={'チームハーモニー'})
+        placed = list(result['placements']) + [student_id for squad in result['squads'] for student_id in squad['member_ids']]
+        newcomer_ids = [student['id'] for student in newcomers]
+
+        assert len(placed) == len(set(placed))
+        if not existing and len(newcomers) < MIN_SQUAD_SIZE:
+            # Too few to start the first squad - they wait for more arrivals
+            assert placed == []
+            continue
+        assert sorted(placed) == newcomer_ids
+        assert all(MIN_SQUAD_SIZE <= len(squad['member_ids']) <= MAX_SQUAD_SIZE for squad in result['squads'])
+        assert all(squad['squad_name'] != 'チームハーモニー' for squad in result['squads'])
+
+        sizes = {squad['id']: len(squad['members']) for squad in existing}
+        for squad_id in result['placements'].values():
+            sizes[squad_id] += 1
+        if len(newcomers) >= MIN_SQUAD_SIZE:
+            # Squads only overflow when too few students arrive to start a new squad
+            assert all(size <= MAX_SQUAD_SIZE for size in sizes.values())
@@ -0,0 +1,112 @@
+"""
+The optimizer's incremental swap/move deltas must match a full re-score, and the partition
+it returns must never score worse than the one it was given.
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from squad_formation import plan_squad_sizes
+from squad_optimizer import (
+    DEFAULT_OBJECTIVE_WEIGHTS,
+    _aggregates,
+    _encode,
+    _move_deltas,
+    _swap_deltas,
+    optimize_squads,
+    score_partition,
+)
+from text_vectors import student_text, tfidf_matrix
+
+WORDS = ['game', 'music', 'art', 'soccer', 'food', 'travel', 'code', 'dance', 'movie', 'anime', 'cook', 'read']
+WEIGHTS = [DEFAULT_OBJECTIVE_WEIGHTS, {'similarity': 2.0, 'country': 1.0, 'gender': 0.5, 'size': 0.3}]
+
+
+def make_students(count, rng):
+    students = []
+    for student_id in range(1, count + 1):
+        student = {
+            'id': student_id,
+            'country': rng.choice(['Japan', 'Vietnam', 'USA', 'France', None]),
+            'gender': rng.choice(['male', 'female', 'other']),
+        }
+        for i in range(1, 7):
+            student[f'question{i}'] = ' '.join(rng.choice(WORDS) for _ in range(4))
+        students.append(student)
+    return students
+
+
+def make_squads(students):
+    squads, start = [], 0
+    for index, size in enumerate(plan_squad_sizes(len(students))):
+        member_ids = [student['id'] for student in students[start:start + size]]
+        squads.append({'squad_name': f'Squad {index}', 'shared_interests': 'x', 'member_ids': member_ids})
+        start += size
+    return squads
+
+
+def problem(students, squads):
+    """The optimizer's arrays for a partition: similarity, assignment, country and gender codes"""
+    vectors = tfidf_matrix([student_text(student) for student in students])
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0.0)
+    squad_of = {student_id: index for index, squad in enumerate(squads) for student_id in squad['member_ids']}
+    assignment = np.array([squad_of[student['id']] for student in students])
+    countries, _ = _encode(student.get('country') for student in students)
+    genders, _ = _encode(student.get('gender') for student in students)
+    return similarity, assignment, countries, genders
+
+
+def partition_score(students, squads, weights=DEFAULT_OBJECTIVE_WEIGHTS):
+    similarity, assignment, countries, genders = problem(students, squads)
+    return score_partition(similarity, assignment, countries, genders, len(squads), dict(DEFAULT_OBJECTIVE_WEIGHTS, **weights))
+
+
+@pytest.mark.parametrize('weights', WEIGHTS)
+def test_incremental_deltas_match_full_rescore(weights):
+    rng = random.Random(4)
+    students = make_students(23, rng)
+    squads = make_squads(students)
+    similarity, assignment, countries, genders = problem(students, squads)
+    squad_count = len(squads)
+    squad_similarity, country_counts, gender_counts, sizes = _aggregates(
+        similarity, assignment, countries, genders, squad_count, countries.max() + 1, genders.max() + 1
+    )
+    base = score_partition(similarity, assignment, countries, genders, squad_count, weights)
+
+    pairs = np.array([(a, b) for a in range(len(students)) for b in range(len(students))
+                      if assignment[a] != assignment[b]])
+    swap_deltas = _swap_deltas(pairs[:, 0], pairs[:, 1], assignment, similarity, squad_similarity,
+                               countries, genders, country_counts, gender_counts, weights)
+    for (a, b), delta in zip(pairs, swap_deltas):
+        swapped = assignment.copy()
+        swapped[a], swapped[b] = assignment[b], assignment[a]
+        rescored = score_partition(similarity, swapped, countries, genders, squad_count, weights)
+        assert delta == pytest.approx(rescored - base, abs=1e-4)
+
+    moves = np.array([(a, squad) for a in range(len(students)) for squad in range(squad_count)
+                      if assignment[a] != squad])
+    move_deltas = _move_deltas(moves[:, 0], moves[:, 1], assignment, squad_similarity, countries, genders,
+                               country_counts, gender_counts, sizes, weights)
+    for (a, squad), delta in zip(moves, move_deltas):
+        moved = assignment.copy()
+        moved[a] = squad
+        rescored = score_partition(similarity, moved, countries, genders, squad_count, weights)
+        assert delta == pytest.approx(rescored - base, abs=1e-4)
+
+
+@pytest.mark.parametrize('student_count', [6, 17, 40])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_optimized_partition_never_scores_worse(student_count, seed):
+    rng = random.Random(student_count * 10 + seed)
+    students = make_students(student_count, rng)
+    for weights in WEIGHTS:
+        squads = make_squads(students)
+        optimized = optimize_squads(squads, students, iterations=3000, weights=weights, seed=seed)
+
+        member_ids = sorted(student_id for squad in optimized for student_id in squad['member_ids'])
+        assert member_ids == [student['id'] for student in students]
+        assert [squad['squad_name'] for squad in optimized] == [squad['squad_name'] for squad in squads]
+        assert partition_score(students, optimized, weights) >= partition_score(students, squads, weights) - 1e-4
@@ -0,0 +1,101 @@
+"""
+Squad hub snapshots are only dropped by changes to what the hub shows, and rebuilding an
+unchanged squad gives the same payload and ETag.
+"""
+
+import pytest
+
+from models import db, Student, Squad, SquadSnapshot
+from squad_snapshots import get_snapshot, save_snapshots, track_snapshot_invalidation
+
+
+@pytest.fixture
+def squads(app):
+    track_snapshot_invalidation(db.session)
+    squads = [Squad(name=f'Squad {rank}', squad_rank=rank, shared_interests='music', squad_icon='fa-users') for rank in (1, 2)]
+    db.session.add_all(squads)
+    db.session.flush()
+    for i in range(8):
+        student = Student(name=f'Student {i}', country='Japan', gender='Female', submission_id=f'AAA-{i:03d}',
+                          squad_id=squads[i % 2].id, archetype='探検家')
+        for q in range(1, 7):
+            setattr(student, f'question{q}', f'answer {i} {q}')
+        db.session.add(student)
+    db.session.flush()
+    save_snapshots(squads)
+    db.session.commit()
+    return squads
+
+
+def snapshot_ids():
+    db.session.expire_all()
+    return {snapshot.squad_id for snapshot in SquadSnapshot.query.all()}
+
+
+def test_rebuild_keeps_first_speaker_and_etag(squads):
+    payload, etag = get_snapshot(squads[0].id)
+    for _ in range(5):
+        db.session.execute(db.delete(SquadSnapshot))
+        db.session.commit()
+        assert get_snapshot(squads[0].id) == (payload, etag)
+
+
+def test_unrelated_fields_do_not_invalidate(squads):
+    member = Student.query.filter_by(squad_id=squads[0].id).first()
+    member.question1_jp = '翻訳'
+    member.core_strength = 'Curiosity'
+    db.session.commit()
+    db.session.execute(db.update(Student).values(question2_jp='翻訳'))
+    db.session.commit()
+
+    assert snapshot_ids() == {squad.id for squad in squads}
+
+
+def test_payload_changes_invalidate_only_their_squad(squads):
+    first, second = squads
+    member = Student.query.filter_by(squad_id=first.id).first()
+    member.archetype = '職人'
+    db.session.commit()
+    assert snapshot_ids() == {second.id}
+
+    save_snapshots([first])
+    second.icebreaker_text = '{"act_1_title": "Hi"}'
+    db.session.commit()
+    assert snapshot_ids() == {first.id}
+
+
+def test_moving_a_member_invalidates_both_squads(squads):
+    first, second = squads
+    member = Student.query.filter_by(squad_id=first.id).first()
+    member.squad_id = second.id
+    db.session.commit()
+    assert snapshot_ids() == set()
+
+
+def test_bulk_statements_invalidate_matching_squads(squads):
+    first, second = squads
+    db.session.execute(db.update(Student).where(Student.squad_id == first.id).values(country='Vietnam'))
+    db.session.commit()
+    assert snapshot_ids() == {second.id}
+
+    save_snapshots([first])
+    member_id = Student.query.filter_by(squad_id=second.id).first().id
+    db.session.execute(db.update(Student), [{'id': member_id, 'name': 'Renamed'}])
+    db.session.commit()
+    assert snapshot_ids() == {first.id}
+
+    Student.query.filter_by(squad_id=first.id).delete()
+    db.session.commit()
+    assert snapshot_ids() == set()
+
+
+def test_membership_change_rebuild_picks_from_current_members(squads):
+    first, second = squads
+    member = Student.query.filter_by(squad_id=first.id).first()
+    member.squad_id = second.id
+    db.session.commit()
+
+    payload, etag = get_snapshot(first.id)
+    member_ids = [data['id'] for data in payload['squad']['members']]
+    assert member.id not in member_ids
+    assert payload['first_speaker']['id'] in member_ids
@@ -0,0 +1,55 @@
+"""
+Questionnaire submissions through the student routes: the background job that picks them up
+(batched translation or the fused pipeline) also adds them to the compatibility index.
+"""
+
+import json
+
+import pytest
+
+import openai_integration
+from analysis_engine import SIGNATURE_FIELDS
+from models import Student, StudentSimilarity
+from translation_batcher import QUESTION_FIELDS
+
+ANSWERS = ['music and games', 'soccer with friends', 'music festivals', 'cooking ramen', 'anime and music', 'travel']
+
+
+@pytest.fixture
+def offline_ai(monkeypatch):
+    """Answer translations and the fused pipeline without the API"""
+    monkeypatch.setattr(openai_integration, 'translate_students_to_japanese', lambda students_answers: {
+        student_id: {field: f'訳: {answer}' for field, answer in answers.items()}
+        for student_id, answers in students_answers.items()
+    })
+    monkeypatch.setattr(openai_integration, 'analyze_and_translate_student', lambda student_answers, translate=True: {
+        'translations': {field: f'訳: {answer}' for field, answer in student_answers.items()} if translate else {},
+        'signature': {field: 'テスト' for field in SIGNATURE_FIELDS},
+    })
+
+
+def submit(client, number):
+    with client.session_transaction() as session:
+        session['session_authenticated'] = True
+        session['selected_language'] = 'en'
+    form = {'name': f'Student {number}', 'country': 'Japan', 'gender': 'Female'}
+    for q, field in enumerate(QUESTION_FIELDS):
+        form[field] = ANSWERS[(number + q) % len(ANSWERS)]
+    response = client.post('/submit-form', data=form)
+    assert response.status_code == 302 and response.location.endswith('/success')
+
+
+@pytest.mark.parametrize('fused', [False, True])
+def test_submitted_students_get_neighbor_rows(vibecheck, client, run_jobs, offline_ai, monkeypatch, fused):
+    monkeypatch.setitem(vibecheck.app.config, 'FUSED_STUDENT_PIPELINE', fused)
+    for number in range(4):
+        submit(client, number)
+
+    assert run_jobs()
+
+    student_ids = {student.id for student in Student.query.all()}
+    rows = {row.student_id: json.loads(row.neighbors) for row in StudentSimilarity.query.all()}
+    assert set(rows) == student_ids
+    for student_id, neighbors in rows.items():
+        assert neighbors
+        assert {pair[0] for pair in neighbors} <= student_ids - {student_id}
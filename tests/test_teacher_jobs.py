@@ -0,0 +1,30 @@
+"""
+Organizer operations started from the dashboard run as background jobs, one at a time.
+"""
+
+from models import db, Job
+
+JSON = {'Accept': 'application/json'}
+
+
+def test_same_operation_reuses_the_running_job(client):
+    first = client.post('/analyze-batch', headers=JSON)
+    second = client.post('/analyze-batch', headers=JSON)
+
+    assert first.status_code == second.status_code == 202
+    assert first.get_json()['id'] == second.get_json()['id']
+    assert Job.query.count() == 1
+
+
+def test_other_operation_is_refused_while_one_runs(client):
+    running = client.post('/analyze-batch', headers=JSON).get_json()
+
+    refused = client.post('/teacher/create-squads', headers=JSON)
+    assert refused.status_code == 409
+    assert refused.get_json()['success'] is False
+    assert refused.get_json()['id'] == running['id']
+
+    # Form posts go back to the dashboard, which shows why nothing started
+    response = client.post('/teacher/create-squads', follow_redirects=True)
+    assert '別の処理を実行中です' in response.get_data(as_text=True)
+    assert [job.kind for job in Job.query.all()] == ['analysis']
@@ -0,0 +1,88 @@
+"""
+Hashed n-gram text vectors for comparing student answers locally, without any API call.
+Latin-script text contributes word unigrams and bigrams, Japanese/Chinese/Korean text
+contributes character bigrams, so answers and their _jp translations share one feature space.
+"""
+
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+HASH_DIM = 2 ** 12
+
+WORD_PATTERN = re.compile(r"[a-z0-9À-ɏḀ-ỿ']+")
+CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]+')
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'i', 'im', "i'm", 'in', 'is',
+    'it', 'its', 'like', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'their', 'them', 'then',
+    'they', 'this', 'to', 'was', 'we', 'who', 'with', 'you', 'your',
+}
+
+ANSWER_FIELDS = [f'question{i}' for i in range(1, 7)]
+
+
+def extract_features(text):
+    """Return the n-gram features of a text"""
+    text = (text or '').lower()
+    features = []
+
+    words = [word for word in WORD_PATTERN.findall(text) if word not in STOP_WORDS and len(word) > 1]
+    features.extend(words)
+    features.extend(f'{first} {second}' for first, second in zip(words, words[1:]))
+
+    for run in CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            features.append(run)
+        else:
+            features.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    return features
+
+
+@lru_cache(maxsize=65536)
+def hash_feature(feature):
+    """Map a feature to a stable column index (Python's hash() is salted per process)"""
+    return zlib.crc32(feature.encode('utf-8')) % HASH_DIM
+
+
+def student_text(student_data, fields=None):
+    """Concatenate a student's answers, including the Japanese translations when present"""
+    fields = fields or ANSWER_FIELDS + [f'{field}_jp' for field in ANSWER_FIELDS]
+    return ' '.join(student_data.get(field) or '' for field in fields)
+
+
+def count_matrix(texts, feature_names=None):
+    """
+    Build the (n_texts, HASH_DIM) term count matrix.
+    If feature_names is a dict, it is filled with column index -> first feature seen there.
+    """
+    counts = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        features = extract_features(text)
+        if not features:
+            continue
+        columns = [hash_feature(feature) for feature in features]
+        counts[row] = np.bincount(columns, minlength=HASH_DIM)
+        if feature_names is not None:
+            for feature, column in zip(features, columns):
+                feature_names.setdefault(column, feature)
+    return counts
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row; all-zero rows stay zero"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def tfidf_matrix(texts, feature_names=None):
+    """Sublinear TF-IDF vectors with unit length, so a dot product is the cosine similarity"""
+    counts = count_matrix(texts, feature_names)
+    term_frequency = np.log1p(counts)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    inverse_document_frequency = np.log((1 + len(texts)) / (1 + document_frequency)) + 1.0
+    return normalize_rows(term_frequency * inverse_document_frequency.astype(np.float32))
@@ -0,0 +1,78 @@
+"""
+Translation batcher - translates several students to Japanese with a single AI request
+instead of six requests each. Submissions are queued as 'translation' jobs (see job_queue),
+and the job workers claim a burst of them together.
+"""
+
+import logging
+
+QUESTION_FIELDS = [f'question{i}' for i in range(1, 7)]
+
+# Stored by the job's last attempt for answers that could not be translated
+TRANSLATION_ERROR_TEXT = "翻訳エラー"
+
+
+class TranslationIncomplete(Exception):
+    """Raised by translate_students(strict=True) when some answers could not be translated"""
+
+
+def translate_students(translation_requests, fallback_text=None, strict=False):
+    """
+    Translate the answers of several students to Japanese with one batched AI request.
+    translation_requests is a list of (student_id, student_language) pairs.
+    Students who chose Japanese get their original answers copied to the _jp fields.
+    fallback_text is stored for answers that could not be translated; None keeps the original answer.
+    With strict=True nothing is stored and TranslationIncomplete is raised instead, so the job is retried.
+    Must be called inside an application context.
+    """
+    from models import db, Student
+    from openai_integration import translate_students_to_japanese
+    from analysis_pipeline import record_stage
+
+    language_by_id = dict(translation_requests)
+    students = Student.query.filter(Student.id.in_(language_by_id.keys())).all()
+    missing_ids = set(language_by_id) - {student.id for student in students}
+    for student_id in missing_ids:
+        logging.error(f"Could not find student with ID {student_id} to translate.")
+
+    to_translate = {}
+    translated_students = []
+    for student in students:
+        if language_by_id[student.id] == 'ja':
+            # Student chose Japanese - copy original answers to _jp fields
+            for field in QUESTION_FIELDS:
+                setattr(student, f'{field}_jp', getattr(student, field))
+            translated_students.append(student)
+            logging.info(f"Japanese detected for student {student.id}, copied original answers")
+        else:
+            to_translate[str(student.id)] = {field: getattr(student, field) for field in QUESTION_FIELDS}
+
+    if to_translate:
+        logging.info(f"Translating answers for {len(to_translate)} students in one request")
+        translations = translate_students_to_japanese(to_translate)
+        if strict:
+            failed_ids = sorted(
+                key for key in to_translate
+                if any(translations.get(key, {}).get(field) is None for field in QUESTION_FIELDS)
+            )
+            if failed_ids:
+                raise TranslationIncomplete(f"Translation failed for students {failed_ids}")
+        for student in students:
+            key = str(student.id)
+            if key not in to_translate:
+                continue
+            complete = True
+            for field in QUESTION_FIELDS:
+                translated = translations.get(key, {}).get(field)
+                if translated is None:
+                    logging.error(f"Translation failed for {field} of student {student.id}")
+                    translated = fallback_text if fallback_text is not None else getattr(student, field)
+                    complete = False
+                setattr(student, f'{field}_jp', translated)
+            if complete:
+                translated_students.append(student)
+
+    # Failed translations stay stale for the next pipeline run
+    record_stage('translate', translated_students)
+    db.session.commit()
+    logging.info(f"Translation completed and saved for students {sorted(language_by_id)}")
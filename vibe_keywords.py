@@ -0,0 +1,355 @@
+"""
+Keyword tables and keyword-based classifiers for student vibes and squad names.
+All tables share one compiled KeywordMatcher, so each text is matched once
+and reused by every classifier.
+"""
+
+from keyword_matcher import KeywordMatcher
+
+# Icon mapping based on common keywords in squad names
+SQUAD_ICON_KEYWORDS = {
+    'explorer': 'fa-compass',
+    'adventure': 'fa-compass',
+    'travel': 'fa-compass',
+    '探検': 'fa-compass',
+    'アドベンチャー': 'fa-compass',
+
+    'creative': 'fa-palette',
+    'art': 'fa-palette',
+    'design': 'fa-palette',
+    'クリエイティブ': 'fa-palette',
+    'アート': 'fa-palette',
+
+    'music': 'fa-music',
+    'sound': 'fa-music',
+    'ミュージック': 'fa-music',
+    '音楽': 'fa-music',
+
+    'tech': 'fa-laptop-code',
+    'coding': 'fa-laptop-code',
+    'digital': 'fa-laptop-code',
+    'テック': 'fa-laptop-code',
+    'コーディング': 'fa-laptop-code',
+
+    'sports': 'fa-running',
+    'fitness': 'fa-running',
+    'active': 'fa-running',
+    'スポーツ': 'fa-running',
+
+    'stars': 'fa-star',
+    'dream': 'fa-star',
+    'future': 'fa-star',
+    'スター': 'fa-star',
+    'ドリーム': 'fa-star',
+
+    'unity': 'fa-users',
+    'team': 'fa-users',
+    'harmony': 'fa-users',
+    'ユニティ': 'fa-users',
+    'チーム': 'fa-users',
+    'ハーモニー': 'fa-users',
+
+    'gaming': 'fa-gamepad',
+    'game': 'fa-gamepad',
+    'ゲーム': 'fa-gamepad',
+
+    'book': 'fa-book',
+    'reading': 'fa-book',
+    'study': 'fa-book',
+    '本': 'fa-book',
+
+    'fire': 'fa-fire',
+    'energy': 'fa-fire',
+    'power': 'fa-fire',
+    'パワー': 'fa-fire',
+
+    'rocket': 'fa-rocket',
+    'space': 'fa-rocket',
+    'innovation': 'fa-rocket',
+    'ロケット': 'fa-rocket',
+}
+
+# Interest categories with colors and keywords
+INTEREST_CATEGORIES = {
+    'Gaming': {
+        'keywords': ['game', 'gaming', 'games', 'video games', 'gamer', 'esports', 'pc', 'console', 'minecraft', 'fortnite'],
+        'color': '#E91E63',  # Pink
+        'icon': 'fas fa-gamepad'
+    },
+    'Music': {
+        'keywords': ['music', 'musical', 'musician', 'singing', 'guitar', 'piano', 'song', 'instrument', 'band'],
+        'color': '#9C27B0',  # Purple
+        'icon': 'fas fa-music'
+    },
+    'Art & Design': {
+        'keywords': ['art', 'drawing', 'painting', 'creative', 'design', 'sketch', 'photography', 'photo'],
+        'color': '#FF9800',  # Orange
+        'icon': 'fas fa-palette'
+    },
+    'Technology': {
+        'keywords': ['technology', 'tech', 'programming', 'coding', 'computer', 'software', 'app'],
+        'color': '#2196F3',  # Blue
+        'icon': 'fas fa-code'
+    },
+    'Sports': {
+        'keywords': ['sport', 'sports', 'football', 'basketball', 'soccer', 'tennis', 'athletic', 'fitness', 'gym'],
+        'color': '#4CAF50',  # Green
+        'icon': 'fas fa-running'
+    },
+    'Anime & Manga': {
+        'keywords': ['anime', 'manga', 'cosplay', 'otaku', 'japanese', 'japan'],
+        'color': '#FF5722',  # Deep Orange
+        'icon': 'fas fa-star'
+    },
+    'Adventure': {
+        'keywords': ['travel', 'traveling', 'adventure', 'explore', 'trip', 'nature', 'outdoor', 'hiking', 'camping'],
+        'color': '#795548',  # Brown
+        'icon': 'fas fa-mountain'
+    },
+    'Reading': {
+        'keywords': ['reading', 'books', 'literature', 'novel', 'story', 'study', 'academic'],
+        'color': '#607D8B',  # Blue Grey
+        'icon': 'fas fa-book'
+    },
+    'Food': {
+        'keywords': ['food', 'cooking', 'baking', 'cuisine', 'restaurant', 'eat', 'chef'],
+        'color': '#FF9800',  # Amber
+        'icon': 'fas fa-utensils'
+    },
+    'Movies & TV': {
+        'keywords': ['movie', 'film', 'cinema', 'netflix', 'watch', 'tv', 'series'],
+        'color': '#673AB7',  # Deep Purple
+        'icon': 'fas fa-film'
+    },
+    'Dance': {
+        'keywords': ['dance', 'dancing', 'ballet', 'hip hop', 'choreography'],
+        'color': '#E91E63',  # Pink
+        'icon': 'fas fa-music'
+    },
+    'Social': {
+        'keywords': ['friends', 'social', 'party', 'people', 'community', 'group'],
+        'color': '#FFEB3B',  # Yellow
+        'icon': 'fas fa-users'
+    }
+}
+
+# Creative archetype detection with meme-worthy titles
+CREATIVE_ARCHETYPES = {
+    'Midnight Philosopher': {
+        'keywords': ['thinking', 'deep', 'philosophy', 'existential', 'meaning', 'life', 'questions', 'universe', 'wondering', 'pondering', 'reflect'],
+        'icon': 'fas fa-moon',
+        'description': 'Deep thinker who ponders life\'s mysteries'
+    },
+    'Certified Meme Historian': {
+        'keywords': ['memes', 'funny', 'internet', 'viral', 'tiktok', 'instagram', 'social media', 'trends', 'jokes', 'humor', 'laugh'],
+        'icon': 'fas fa-laugh-squint',
+        'description': 'Master of internet culture and digital humor'
+    },
+    'Low-Key Genius': {
+        'keywords': ['smart', 'coding', 'programming', 'math', 'science', 'learning', 'studying', 'tech', 'computer', 'solving', 'intelligent'],
+        'icon': 'fas fa-brain',
+        'description': 'Brilliant mind hiding behind casual vibes'
+    },
+    'Chaos Coordinator': {
+        'keywords': ['random', 'chaos', 'unpredictable', 'spontaneous', 'weird', 'crazy', 'wild', 'energy', 'hyperactive', 'chaotic'],
+        'icon': 'fas fa-bolt',
+        'description': 'Thrives in beautiful chaos and spontaneity'
+    },
+    'Vibe Curator': {
+        'keywords': ['music', 'playlist', 'aesthetic', 'vibes', 'mood', 'atmosphere', 'chill', 'lofi', 'beats', 'spotify', 'sound'],
+        'icon': 'fas fa-headphones',
+        'description': 'Creates the perfect atmosphere for any moment'
+    },
+    'Digital Nomad': {
+        'keywords': ['gaming', 'online', 'virtual', 'digital', 'streaming', 'twitch', 'discord', 'pc', 'console', 'esports', 'game'],
+        'icon': 'fas fa-gamepad',
+        'description': 'Lives and breathes in digital realms'
+    },
+    'Snack Connoisseur': {
+        'keywords': ['food', 'eating', 'snacks', 'cooking', 'restaurant', 'hungry', 'delicious', 'taste', 'cuisine', 'baking', 'cook'],
+        'icon': 'fas fa-cookie-bite',
+        'description': 'Finds joy in culinary adventures and treats'
+    },
+    'Plot Twist Enthusiast': {
+        'keywords': ['movies', 'series', 'shows', 'netflix', 'anime', 'drama', 'story', 'plot', 'character', 'binge', 'watch'],
+        'icon': 'fas fa-film',
+        'description': 'Lives for compelling stories and epic narratives'
+    },
+    'Energy Drink Personified': {
+        'keywords': ['energy', 'hyper', 'active', 'sports', 'running', 'gym', 'fitness', 'workout', 'adrenaline', 'intense', 'fast'],
+        'icon': 'fas fa-fire',
+        'description': 'Pure kinetic energy in human form'
+    },
+    'Professional Procrastinator': {
+        'keywords': ['sleep', 'lazy', 'procrastinate', 'later', 'tomorrow', 'bed', 'nap', 'chill', 'relaxing', 'nothing', 'rest'],
+        'icon': 'fas fa-bed',
+        'description': 'Masters the art of strategic delay'
+    },
+    'Social Algorithm': {
+        'keywords': ['friends', 'social', 'people', 'party', 'talking', 'hanging out', 'group', 'together', 'communication', 'connect'],
+        'icon': 'fas fa-users',
+        'description': 'Naturally connects people and builds communities'
+    },
+    'Creative Hurricane': {
+        'keywords': ['art', 'drawing', 'creative', 'design', 'painting', 'craft', 'making', 'building', 'creating', 'imagination', 'artistic'],
+        'icon': 'fas fa-palette',
+        'description': 'Creates beauty from pure imagination'
+    },
+    'Adventure Architect': {
+        'keywords': ['adventure', 'explore', 'travel', 'discovery', 'journey', 'new', 'experience', 'outdoor', 'hiking', 'nature'],
+        'icon': 'fas fa-compass',
+        'description': 'Builds epic quests from everyday moments'
+    },
+    'Zen Master': {
+        'keywords': ['calm', 'peaceful', 'meditation', 'nature', 'quiet', 'serene', 'balance', 'mindful', 'tranquil', 'peace'],
+        'icon': 'fas fa-leaf',
+        'description': 'Brings inner peace to chaotic worlds'
+    }
+}
+
+# Core spark keywords with Japanese translations
+SPARK_TRANSLATIONS = {
+    'gaming': 'ゲーム',
+    'music': '音楽',
+    'art': 'アート',
+    'travel': '旅行',
+    'sports': 'スポーツ',
+    'technology': 'テクノロジー',
+    'reading': '読書',
+    'food': '食べ物',
+    'movies': '映画',
+    'anime': 'アニメ',
+    'dance': 'ダンス',
+    'photography': '写真',
+    'fitness': 'フィットネス',
+    'nature': '自然',
+    'creative': '創造的',
+    'adventure': '冒険'
+}
+
+# Enhanced keyword mapping to core sparks
+SPARK_KEYWORD_MAPPING = {
+    'game': 'gaming', 'games': 'gaming', 'gamer': 'gaming', 'video games': 'gaming',
+    'musical': 'music', 'musician': 'music', 'singing': 'music', 'song': 'music',
+    'drawing': 'art', 'painting': 'art', 'sketch': 'art',
+    'traveling': 'travel', 'trip': 'travel', 'explore': 'travel',
+    'sport': 'sports', 'athletic': 'sports', 'football': 'sports', 'basketball': 'sports',
+    'tech': 'technology', 'programming': 'technology', 'coding': 'technology',
+    'books': 'reading', 'novel': 'reading', 'literature': 'reading',
+    'cooking': 'food', 'baking': 'food', 'cuisine': 'food',
+    'movie': 'movies', 'film': 'movies', 'cinema': 'movies',
+    'manga': 'anime', 'cosplay': 'anime',
+    'dancing': 'dance', 'ballet': 'dance',
+    'photo': 'photography', 'camera': 'photography',
+    'gym': 'fitness', 'workout': 'fitness', 'exercise': 'fitness',
+    'outdoor': 'nature', 'hiking': 'nature', 'camping': 'nature',
+    'design': 'creative', 'artist': 'creative'
+}
+
+INTEREST_KEYWORDS = {category: data['keywords'] for category, data in INTEREST_CATEGORIES.items()}
+ARCHETYPE_KEYWORDS = {archetype: data['keywords'] for archetype, data in CREATIVE_ARCHETYPES.items()}
+
+# One matcher over every table's keywords
+VIBE_MATCHER = KeywordMatcher(
+    list(SQUAD_ICON_KEYWORDS)
+    + [keyword for keywords in INTEREST_KEYWORDS.values() for keyword in keywords]
+    + [keyword for keywords in ARCHETYPE_KEYWORDS.values() for keyword in keywords]
+    + list(SPARK_TRANSLATIONS)
+    + list(SPARK_KEYWORD_MAPPING)
+)
+
+
+def assign_squad_icon(squad_name):
+    """
+    Assign Font Awesome icon based on keywords in squad name
+    """
+    keyword = VIBE_MATCHER.first(squad_name.lower(), SQUAD_ICON_KEYWORDS)
+    
+    # Default icon if no keywords match
+    return SQUAD_ICON_KEYWORDS[keyword] if keyword else 'fa-users'
+
+
+def get_interest_categories_with_colors(vibes_text):
+    """Extract interest categories and assign colors for visualization"""
+    match_counts = VIBE_MATCHER.count_by_category(vibes_text.lower(), INTEREST_KEYWORDS)
+    
+    # Find matching categories
+    found_interests = []
+    for category, matches in match_counts.items():
+        data = INTEREST_CATEGORIES[category]
+        found_interests.append({
+            'name': category,
+            'color': data['color'],
+            'icon': data['icon'],
+            'intensity': min(matches / len(data['keywords']) * 2, 1.0),  # Normalize intensity
+            'match_count': matches
+        })
+    
+    # Sort by match count (highest first)
+    found_interests.sort(key=lambda x: x['match_count'], reverse=True)
+    
+    return found_interests[:4]  # Return top 4 interests
+
+
+def get_creative_vibe_archetype(student):
+    """Determine student's creative vibe archetype based on mystery generator answers"""
+    # Handle both new format and legacy format
+    if hasattr(student, 'question1') and student.question1:
+        combined_text = ' '.join([
+            student.question1 or '',
+            student.question2 or '',
+            student.question3 or '',
+            student.question4 or '',
+            student.question5 or '',
+            student.question6 or '',
+        ]).lower()
+    else:
+        # Fallback to legacy vibes field
+        combined_text = (student.vibes or '').lower()
+    
+    # Calculate scores for each archetype
+    archetype_scores = VIBE_MATCHER.count_by_category(combined_text, ARCHETYPE_KEYWORDS)
+    
+    # Return the highest scoring archetype or default
+    if archetype_scores:
+        best_archetype = max(archetype_scores, key=archetype_scores.get)
+        return {
+            'name': best_archetype,
+            'icon': CREATIVE_ARCHETYPES[best_archetype]['icon'],
+            'description': CREATIVE_ARCHETYPES[best_archetype]['description']
+        }
+    else:
+        return {
+            'name': 'Mysterious Entity',
+            'icon': 'fas fa-star',
+            'description': 'A unique presence that defies categorization'
+        }
+
+
+# Legacy function for backward compatibility
+def get_vibe_archetype(vibes_text):
+    """Legacy function - returns archetype name only"""
+    class FakeStudent:
+        def __init__(self, vibes):
+            self.vibes = vibes
+            self.question1 = None
+    
+    result = get_creative_vibe_archetype(FakeStudent(vibes_text))
+    return result['name']
+
+
+def get_core_sparks(vibes_text):
+    """Extract core interests as hashtags with Japanese translations"""
+    found_keywords = VIBE_MATCHER.find(vibes_text.lower())
+    
+    # Direct matches plus mapped keywords
+    found_sparks = {spark for spark in SPARK_TRANSLATIONS if spark in found_keywords}
+    found_sparks.update(spark for keyword, spark in SPARK_KEYWORD_MAPPING.items() if keyword in found_keywords)
+    
+    # Convert to hashtag format with translations
+    sparks = []
+    for spark in sorted(found_sparks)[:4]:  # Limit to 4 main sparks
+        japanese = SPARK_TRANSLATIONS.get(spark, '？')
+        sparks.append(f'#{spark} ({japanese})')
+    
+    return sparks if sparks else ['#unique (ユニーク)']
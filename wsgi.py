@@ -2,11 +2,14 @@
 WSGI entry point for Firebase App Hosting
 """
 import os
-from app import app_instance as application
+from app import app_instance as application, job_queue
 
 # Firebase App Hosting expects the WSGI application to be named 'application'
 app = application
 
+# Start the job workers - jobs left pending by a previous instance are resumed
+job_queue.start()
+
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 8080))
     application.run(host='0.0.0.0', port=port, debug=False)